@@ -12,5 +12,19 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# requests run in new threads here, persistent connections would pile up one
+# per thread (see DB_CONN_MAX_AGE / DB_POOL in settings)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after get_asgi_application(), which sets Django up
+from core.subscriptions import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # HTTP goes to Django, WebSockets to the GraphQL subscription server
+    if scope["type"] == "websocket":
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -1,6 +1,6 @@
 import graphene
 import graphql_jwt
-from core.schema import Query as CoreQuery, Mutation as CoreMutation
+from core.schema import Query as CoreQuery, Mutation as CoreMutation, Subscription as CoreSubscription
 
 class Query(CoreQuery, graphene.ObjectType):
     hello = graphene.String(default_value="GraphQL is working!")
@@ -10,4 +10,7 @@ class Mutation(CoreMutation,graphene.ObjectType):
     verify_token = graphql_jwt.Verify.Field()
     refresh_token = graphql_jwt.Refresh.Field()
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
\ No newline at end of file
+class Subscription(CoreSubscription, graphene.ObjectType):
+    pass
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 # pylint: disable=import-error
 from corsheaders.defaults import default_headers
@@ -55,6 +56,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "core.middleware.OrganizationMiddleware",
 ]
+# X-ORG slug -> Organization cache used by OrganizationMiddleware (core/tenants.py)
+ORGANIZATION_CACHE = {
+    "MAX_SIZE": 1024,  # tenants kept in each process
+    "TTL": 60,  # seconds
+    "SHARED_CACHE": None,  # alias in CACHES (e.g. a Redis cache) shared across processes
+}
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
 ]
@@ -62,8 +70,13 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_HEADERS = list(default_headers) + [
     "X-ORG",
+    "If-None-Match",
+    "X-GraphQL-Debug",
 ]
 
+# read query responses carry an ETag (core/response_cache.py)
+CORS_EXPOSE_HEADERS = ["ETag"]
+
 
 ROOT_URLCONF = 'config.urls'
 
@@ -88,16 +101,100 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Everything can be set from the environment (DB_*), the defaults are the local dev database.
+#
+# Connection reuse, the TCP + auth handshake otherwise paid by every request:
+#   - DB_CONN_MAX_AGE: seconds a connection is kept between requests (0: a new one per
+#     request, "none": forever), checked before reuse when DB_CONN_HEALTH_CHECKS is on.
+#     Fine under WSGI, where a worker thread keeps its connection. Under ASGI every request
+#     may run in a new thread, each keeping its own connection open, so config/asgi.py
+#     makes the default 0 there.
+#   - DB_POOL=1: a psycopg 3 connection pool per process instead (`psycopg[pool]` in
+#     requirements.txt); connections go back to the pool at the end of each request. Use
+#     this under ASGI.
+# `python manage.py benchmark_connections` measures what each saves per request.
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+DB_CONN_MAX_AGE = os.environ.get('DB_CONN_MAX_AGE', '60')
+DB_POOL = env_bool('DB_POOL', False)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'project_management',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'project_management'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # the pool does the reuse, Django refuses persistent connections on top of it
+        'CONN_MAX_AGE': 0 if DB_POOL else None if DB_CONN_MAX_AGE.lower() == 'none' else int(DB_CONN_MAX_AGE),
+        'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),  # seconds
+        },
     }
 }
+if DB_POOL:
+    try:
+        from psycopg_pool import ConnectionPool
+    except ImportError:
+        from django.core.exceptions import ImproperlyConfigured
+
+        raise ImproperlyConfigured('DB_POOL needs psycopg 3 with its pool: pip install "psycopg[binary,pool]"')
+
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),  # per process
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # seconds to wait for a free connection
+        'max_idle': int(os.environ.get('DB_POOL_MAX_IDLE', 300)),  # seconds before an idle extra one is closed
+        # a connection handed out by the pool is checked first (broken ones are replaced)
+        'check': ConnectionPool.check_connection if env_bool('DB_CONN_HEALTH_CHECKS', True) else None,
+    }
+
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds `replica1`, `replica2` (same database and
+# credentials as default, on those hosts). GraphQL queries read from them, see READ_REPLICAS.
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        # tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Tenant shards: DB_SHARD_HOSTS=shard1=host1,shard2=host2 adds `shard1`, `shard2` (same database
+# and credentials as default, on those hosts). Organization.shard says where a tenant lives,
+# `manage.py move_tenant` moves one; see TENANT_SHARDS.
+SHARD_ALIASES = []
+for entry in filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(',')):
+    alias, _, host = entry.strip().partition('=')
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        'TEST': {'MIRROR': 'default'},
+    }
+    SHARD_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['core.shards.ShardRouter', 'core.replicas.ReplicaRouter']
+
+# X-ORG -> the tenant's database (core/shards.py)
+TENANT_SHARDS = {
+    "ALIASES": SHARD_ALIASES,  # besides default
+    "CACHE": "default",  # alias in CACHES for the freezes during a move, shared between processes
+}
+
+# Query -> replica, Mutation -> primary (core/replicas.py)
+READ_REPLICAS = {
+    "ALIASES": [alias for alias in DATABASES if alias != 'default' and alias not in SHARD_ALIASES],
+    "PIN_SECONDS": 10,  # a tenant reads from the primary this long after a mutation, >= MAX_LAG
+    "MAX_LAG": 10,  # seconds; a replica further behind is skipped
+    "LAG_CHECK_INTERVAL": 5,  # seconds between lag checks, per process and replica
+    "CACHE": "default",  # alias in CACHES for the pins, shared between processes
+}
 
 
 # Password validation
@@ -136,10 +233,79 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Automatic Persisted Queries + parsed document cache for /graphql/ (core/persisted.py)
+PERSISTED_QUERIES = {
+    "CACHE": "default",  # alias in CACHES where runtime-registered documents live
+    "REGISTRY": None,  # JSON file of known documents ({hash: query} or an Apollo manifest)
+    "ALLOW_LIST": False,  # True: only documents from REGISTRY can run
+    "DOCUMENT_CACHE_SIZE": 256,  # parsed + validated documents kept per process
+}
+
+# Depth / cost limit for GraphQL documents, checked before execution (core/cost.py)
+QUERY_COST = {
+    "MAX_DEPTH": 12,
+    "MAX_COST": 200000,  # estimated objects resolved by one request (projects { tasks { comments } } ~ 105k)
+    "DEFAULT_LIST_SIZE": 100,  # estimate for list fields without a cost hint
+    "TENANTS": {},  # per X-ORG slug overrides, e.g. {"big-org": {"MAX_COST": 50000}}
+}
+
+# LocMem by default; set REDIS_URL to share the caches between processes
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
+# Serialized responses of read queries, invalidated by the mutations (core/response_cache.py)
+RESPONSE_CACHE = {
+    "ENABLED": True,
+    "CACHE": "default",  # alias in CACHES
+    "TIMEOUT": 60 * 5,  # seconds, entries of old versions just age out
+}
+
+# Several operations in one POST, a JSON array (core/batching.py)
+GRAPHQL_BATCH = {
+    "ENABLED": True,
+    "MAX_OPERATIONS": 20,
+    "PARALLEL": True,  # async view: the queries between two mutations run concurrently
+}
+
+# JSON encoding and compression of /graphql/ responses (core/encoding.py)
+GRAPHQL_ENCODING = {
+    "ENCODER": "orjson",  # falls back to the stdlib json if orjson isn't installed
+    "COMPRESS": True,  # brotli if installed and accepted, else gzip
+    "MIN_SIZE": 1024,  # bytes, smaller responses are sent as is
+}
+
+# GraphQL subscriptions over WebSocket (core/broker.py, core/subscriptions.py), ASGI only
+SUBSCRIPTIONS = {
+    "BACKEND": "core.broker.InMemoryBackend",  # swap for a cross-process backend, e.g. Redis pub/sub
+    "MAX_QUEUE": 100,  # pending events per subscriber before the oldest are dropped
+    "PATH": "/graphql/",
+    "CONNECTION_INIT_TIMEOUT": 10,  # seconds
+}
+
+# Per-request resolver/SQL tracing (core/instrumentation.py)
+GRAPHQL_INSTRUMENTATION = {
+    "ENABLED": True,
+    "DEBUG_HEADER": "X-GraphQL-Debug",  # trace in extensions.debug (DEBUG or staff users only)
+    "N_PLUS_ONE_THRESHOLD": 5,  # same statement from one field this many times = N+1
+    "METRICS_TOKEN": os.environ.get("GRAPHQL_METRICS_TOKEN"),  # Bearer token for /graphql/metrics/
+}
+
+# Serve /graphql/ with core.views.AsyncGraphQLView (async resolvers, async ORM).
+# Only makes sense when running under ASGI, e.g. `uvicorn config.asgi:application`
+GRAPHQL_ASYNC = os.environ.get("GRAPHQL_ASYNC", "") == "1"
+
 # add graphene settings
 GRAPHENE = {
     "SCHEMA": "config.schema.schema",
     "MIDDLEWARE": [
         "graphql_jwt.middleware.JSONWebTokenMiddleware",
+        # resolver/SQL timings, N+1 detection (core/instrumentation.py)
+        "core.instrumentation.InstrumentationMiddleware",
     ],
 }
\ No newline at end of file
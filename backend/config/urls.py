@@ -14,15 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
+from core.views import AsyncGraphQLView, GraphQLView, graphql_metrics
+
+# GRAPHQL_ASYNC=1 when running under ASGI, see settings.py
+GraphQLView = AsyncGraphQLView if settings.GRAPHQL_ASYNC else GraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('core.urls')),
     path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql/metrics/', graphql_metrics),
 ]
 
 '''
@@ -31,4 +36,8 @@ The csrf_exempt decorator is used to disable Django's Cross-Site Request Forgery
 protection for this specific URL, which is often necessary for non-browser-based API clients.
 graphiql=True enables the GraphiQL interface, a web-based IDE for exploring and testing
 GraphQL APIs.
+core.views.GraphQLView is graphene-django's view plus persisted queries and a
+cache of parsed/validated documents (core/persisted.py).
+core.views.AsyncGraphQLView is the same view for ASGI, executing queries with
+async resolvers (core/aio.py).
 '''
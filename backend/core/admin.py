@@ -1,5 +1,26 @@
 from django.contrib import admin
+from django.db import connection
+from django.db.models import Q
 from .models import Organization, Project, Task, TaskComment
+from .search import search_query, search_terms
+
+
+class SearchVectorAdmin(admin.ModelAdmin):
+    # on Postgres the search box uses the GIN-indexed search_vector
+    # (core/search.py) instead of ILIKE '%q%' over every row, OR'ed with
+    # icontains on vectorless_search_fields (the search_fields the vector
+    # doesn't cover); search_fields is the fallback for other databases
+    vectorless_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        terms = search_terms(search_term)
+        if connection.vendor != "postgresql" or not terms:
+            return super().get_search_results(request, queryset, search_term)
+        matches = Q(search_vector=search_query(terms))
+        for field in self.vectorless_search_fields:
+            matches |= Q(**{f"{field}__icontains": search_term.strip()})
+        return queryset.filter(matches), False
+
 
 @admin.register(Organization)
 class OrganizationAdmin(admin.ModelAdmin):
@@ -13,13 +34,15 @@ class ProjectAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
 
 @admin.register(Task)
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(SearchVectorAdmin):
     list_display = ['title', 'project', 'status', 'assignee_email', 'due_date', 'created_at', 'last_updated_at']
     list_filter = ['status', 'project']
     search_fields = ['title', 'description', 'assignee_email']
+    vectorless_search_fields = ['assignee_email']
 
 @admin.register(TaskComment)
-class TaskCommentAdmin(admin.ModelAdmin):
+class TaskCommentAdmin(SearchVectorAdmin):
     list_display = ['task', 'author_email', 'created_at', 'last_updated_at']
     list_filter = ['created_at']
-    search_fields = ['content', 'author_email']
\ No newline at end of file
+    search_fields = ['content', 'author_email']
+    vectorless_search_fields = ['author_email']
\ No newline at end of file
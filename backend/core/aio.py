@@ -0,0 +1,80 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from graphql.pyutils import is_awaitable
+
+
+# ======================
+# ASYNC HELPERS
+# ======================
+# The async view (core/views.py AsyncGraphQLView) marks the request with
+# `graphql_async = True`. Resolvers that touch the database check it and
+# return a coroutine using the async ORM (aget, afirst, `async for`) instead
+# of blocking, so sibling fields on the same level can run concurrently.
+# The sync view never sets it and keeps the exact same code path as before.
+
+
+def is_async(info):
+    return getattr(info.context, "graphql_async", False)
+
+
+def then(value, callback):
+    # callback(value), after awaiting value if it is awaitable
+    if is_awaitable(value):
+        async def await_then():
+            return callback(await value)
+
+        return await_then()
+    return callback(value)
+
+
+def fetch(queryset, info):
+    # list(queryset), awaitable on the async view
+    if is_async(info):
+        return alist(queryset)
+    return list(queryset)
+
+
+async def alist(queryset):
+    return [row async for row in queryset]
+
+
+def get_or_none(queryset, info, **lookup):
+    # queryset.get(**lookup) or None, awaitable on the async view
+    if is_async(info):
+        return aget_or_none(queryset, **lookup)
+    try:
+        return queryset.get(**lookup)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+async def aget_or_none(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        return None
+
+
+def related(obj, name, info):
+    # obj.<name> for a forward FK; when it wasn't select_related()/set by a
+    # loader the async view loads it with aget() instead of a blocking query
+    field = obj._meta.get_field(name)
+    if not is_async(info) or field.is_cached(obj):
+        return getattr(obj, name)
+    return field.related_model.objects.aget(pk=getattr(obj, field.attname))
+
+
+def sync_resolver(resolver):
+    """
+    For resolvers that only have a sync implementation (a few aggregate
+    queries): on the async view they run in a worker thread instead of
+    blocking the event loop.
+    """
+    @wraps(resolver)
+    def wrapper(root, info, **kwargs):
+        if is_async(info):
+            return sync_to_async(resolver)(root, info, **kwargs)
+        return resolver(root, info, **kwargs)
+
+    return wrapper
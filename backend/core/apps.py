@@ -2,4 +2,12 @@ from django.apps import AppConfig
 
 
 class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # connect the signal receivers
+        from . import signals  # noqa: F401
+        from .replicas import check_settings
+
+        check_settings()
@@ -0,0 +1,80 @@
+from django.conf import settings
+from graphql import OperationType, get_operation_ast
+
+from .persisted import document_cache, persisted_queries, query_hash
+
+
+# ======================
+# BATCHED OPERATIONS
+# ======================
+# POST /graphql/ with a JSON array runs every operation in it and answers with
+# an array of results in the same order (what Apollo's BatchHttpLink sends).
+# The whole batch is one request, so everything per request is paid once:
+# the tenant lookup, authentication, the replica choice. Every operation gets
+# its own DataLoaders (core/loaders.py) - they select different columns of
+# the same relations.
+#
+# Operations run in order, the ones after a mutation see its writes. On the
+# async view consecutive queries run concurrently (PARALLEL) and mutations in
+# between wait for them.
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MAX_OPERATIONS": 20,
+    "PARALLEL": True,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_BATCH", {}).get(name, DEFAULTS[name])
+
+
+def check_batch(entries):
+    """Error message for a batch that can't run, None if it's fine."""
+    if not get_setting("ENABLED"):
+        return "Batched operations are not enabled"
+    if not entries:
+        return "Received an empty list in the batch request."
+    if len(entries) > get_setting("MAX_OPERATIONS"):
+        return f"At most {get_setting('MAX_OPERATIONS')} operations per batch"
+    if not all(isinstance(entry, dict) for entry in entries):
+        return "Every operation in a batch must be a JSON object"
+    return None
+
+
+def is_read(request, entry):
+    """
+    True when the entry is known to be a query - its document is in the
+    document cache. Anything else (mutations, documents not parsed yet) runs
+    on its own, in order.
+    """
+    key = persisted_queries.requested_hash(request, entry)
+    query = entry.get("query")
+    if query:
+        key = query_hash(query)
+    document = document_cache.get(key) if key else None
+    if document is None:
+        return False
+    operation = get_operation_ast(document, entry.get("operationName"))
+    return operation is not None and operation.operation == OperationType.QUERY
+
+
+def groups(request, entries):
+    """
+    [(indexes, parallel)]: runs of consecutive reads (parallel=True) and single
+    other operations, in order.
+    """
+    result = []
+    for index, entry in enumerate(entries):
+        read = is_read(request, entry)
+        if read and result and result[-1][1]:
+            result[-1][0].append(index)
+        else:
+            result.append(([index], read))
+    return result
+
+
+def combine(responses):
+    # [(body, status)] -> the batch's body and status, as graphene's view does it
+    body = "[{}]".format(",".join(body for body, _ in responses))
+    return body, max((status for _, status in responses), default=200)
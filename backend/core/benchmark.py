@@ -0,0 +1,523 @@
+import http.client
+import json
+import math
+import random
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from .counters import rebuild_counters
+from .models import Organization, Project, Task, TaskComment
+
+
+# ======================
+# BENCHMARK HARNESS
+# ======================
+# Synthetic tenants + scripted query mixes, run either through the Django test
+# client (in-process: SQL queries and rows fetched are recorded per request)
+# or against a real server over HTTP (runserver / gunicorn / uvicorn: latency
+# and throughput only). `python manage.py benchmark` drives it, see there.
+#
+# Everything is seeded, so the same dataset + mix + seed sends the same
+# requests in the same order - query and row counts are exact and can be
+# compared against a saved baseline.
+
+SLUG_PREFIX = "bench-"
+
+ASSIGNEES = [f"user{i}@bench.test" for i in range(5)]
+TASK_STATUSES = ["TODO", "IN_PROGRESS", "DONE"]
+
+DASHBOARD = """
+    query {
+      projects { id name status dueDate todoCount inProgressCount doneCount }
+      organizationStats { projectCount total overdue }
+    }
+"""
+
+PROJECT_DETAIL = """
+    query ($id: ID!) {
+      project(id: $id) {
+        id name description status
+        tasks { id title status assigneeEmail dueDate comments { id content authorEmail createdAt } }
+      }
+    }
+"""
+
+# a tenant's whole tree (`manage.py benchmark_encoding`)
+TREE = """
+    query {
+      projects {
+        id name status
+        tasks { id title status assigneeEmail comments { id content authorEmail } }
+      }
+    }
+"""
+
+STATUS_UPDATE = """
+    mutation ($id: ID!, $status: String!) {
+      updateTask(id: $id, status: $status) { task { id status } }
+    }
+"""
+
+ADD_COMMENT = """
+    mutation ($taskId: ID!, $content: String!) {
+      addComment(taskId: $taskId, content: $content, authorEmail: "bench@bench.test") { comment { id } }
+    }
+"""
+
+# comments posted back to back on one task per comment_burst step
+BURST_SIZE = 5
+
+
+class Dataset:
+    """N orgs x M projects x K tasks x C comments, created with bulk_create."""
+
+    def __init__(self, orgs=2, projects=10, tasks=20, comments=2):
+        self.size = {"orgs": orgs, "projects": projects, "tasks": tasks, "comments": comments}
+        # fresh slugs every run: nothing cached by an earlier run (tenant
+        # cache, response cache, a long-running server's memory) can match
+        self.prefix = f"{SLUG_PREFIX}{uuid.uuid4().hex[:8]}-"
+        # slug -> {"projects": [ids], "tasks": [ids]}
+        self.tenants = {}
+
+    def create(self):
+        now = timezone.now()
+        organizations = Organization.objects.bulk_create(
+            Organization(name=f"Bench {o}", slug=f"{self.prefix}{o}", contact_email=f"admin@bench{o}.test")
+            for o in range(self.size["orgs"])
+        )
+        projects = Project.objects.bulk_create(
+            Project(organization=org, name=f"Project {p}", description="benchmark project " * 10)
+            for org in organizations
+            for p in range(self.size["projects"])
+        )
+        tasks = Task.objects.bulk_create(
+            Task(
+                project=project,
+                title=f"Task {t}",
+                description="benchmark task " * 20,
+                status=TASK_STATUSES[t % len(TASK_STATUSES)],
+                assignee_email=ASSIGNEES[t % len(ASSIGNEES)],
+                due_date=now + timezone.timedelta(days=t % 14 - 7),
+            )
+            for project in projects
+            for t in range(self.size["tasks"])
+        )
+        TaskComment.objects.bulk_create(
+            (
+                TaskComment(task=task, content=f"Comment {c}", author_email=ASSIGNEES[c % len(ASSIGNEES)])
+                for task in tasks
+                for c in range(self.size["comments"])
+            ),
+            batch_size=5000,
+        )
+        rebuild_counters(Project.objects.filter(organization__in=organizations))
+
+        by_org = {org.pk: {"projects": [], "tasks": []} for org in organizations}
+        for project in projects:
+            by_org[project.organization_id]["projects"].append(project.pk)
+        project_org = {project.pk: project.organization_id for project in projects}
+        for task in tasks:
+            by_org[project_org[task.project_id]]["tasks"].append(task.pk)
+        self.tenants = {org.slug: by_org[org.pk] for org in organizations}
+        return self
+
+    def delete(self):
+        Organization.objects.filter(slug__startswith=self.prefix).delete()
+
+
+# ======================
+# QUERY MIXES
+# ======================
+# operation name -> function(tenant ids, rng) returning the requests of one
+# step: [(query, variables), ...] (a comment burst is several requests)
+
+def dashboard(tenant, rng):
+    return [(DASHBOARD, {})]
+
+
+def project_detail(tenant, rng):
+    return [(PROJECT_DETAIL, {"id": rng.choice(tenant["projects"])})]
+
+
+def status_update(tenant, rng):
+    return [(STATUS_UPDATE, {"id": rng.choice(tenant["tasks"]), "status": rng.choice(TASK_STATUSES)})]
+
+
+def comment_burst(tenant, rng):
+    task_id = rng.choice(tenant["tasks"])
+    return [(ADD_COMMENT, {"taskId": task_id, "content": f"burst {i}"}) for i in range(BURST_SIZE)]
+
+
+OPERATIONS = {
+    "dashboard": dashboard,
+    "project_detail": project_detail,
+    "status_update": status_update,
+    "comment_burst": comment_burst,
+}
+
+# roughly what the frontend does: mostly reads, some writes
+DEFAULT_MIX = {"dashboard": 5, "project_detail": 3, "status_update": 1, "comment_burst": 1}
+
+
+def page(dataset, rng, size):
+    """
+    (slug, operations) a screen fetches at once: the dashboard plus `size`
+    project details (benchmark_batch sends them one by one or as a batch).
+    """
+    slug = rng.choice(sorted(dataset.tenants))
+    tenant = dataset.tenants[slug]
+    return slug, dashboard(tenant, rng) + [project_detail(tenant, rng)[0] for _ in range(size)]
+
+
+def parse_mix(text):
+    # "dashboard=5,project_detail=3" -> {"dashboard": 5, "project_detail": 3}
+    mix = {}
+    for part in filter(None, (text or "").split(",")):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = int(weight or 1)
+    return mix or dict(DEFAULT_MIX)
+
+
+def script(dataset, mix, steps, seed=0):
+    """The seeded sequence of steps: [(operation, slug, [(query, variables), ...])]."""
+    rng = random.Random(seed)
+    names = sorted(mix)
+    weights = [mix[name] for name in names]
+    slugs = sorted(dataset.tenants)
+    steps_list = []
+    for _ in range(steps):
+        name = rng.choices(names, weights)[0]
+        slug = rng.choice(slugs)
+        steps_list.append((name, slug, OPERATIONS[name](dataset.tenants[slug], rng)))
+    return steps_list
+
+
+# ======================
+# RUNNERS
+# ======================
+
+class SQLRecorder:
+    """
+    connection.execute_wrapper() counting queries and the rows fetched
+    from their cursors.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        cursor = context["cursor"]
+        if not isinstance(cursor.cursor, CountingCursor):
+            cursor.cursor = CountingCursor(cursor.cursor, self)
+        return execute(sql, params, many, context)
+
+
+class CountingCursor:
+    def __init__(self, cursor, recorder):
+        self._cursor = cursor
+        self._recorder = recorder
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._recorder.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._recorder.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._recorder.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._recorder.rows += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class Sample:
+    __slots__ = ("operation", "seconds", "queries", "rows", "errors")
+
+    def __init__(self, operation, seconds, queries=None, rows=None, errors=0):
+        self.operation = operation
+        self.seconds = seconds
+        self.queries = queries
+        self.rows = rows
+        self.errors = errors
+
+
+def has_errors(body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return True
+    return bool(payload.get("errors")) if isinstance(payload, dict) else True
+
+
+class TestClientRunner:
+    """In-process, one request at a time, with SQL counts."""
+
+    def __init__(self, path="/graphql/", close_connections=False):
+        self.path = path
+        self.client = Client()
+        # the test client keeps the connection open across requests; with this
+        # it's closed (or kept, or handed back to the pool) after each one as
+        # a real server's request_finished would, per CONN_MAX_AGE
+        self.close_connections = close_connections
+
+    def run(self, steps):
+        # what the test runner's setup_test_environment() would allow
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            return self._run(steps)
+
+    def _run(self, steps):
+        samples = []
+        started = time.perf_counter()
+        for name, slug, requests in steps:
+            for query, variables in requests:
+                recorder = SQLRecorder()
+                begin = time.perf_counter()
+                with connection.execute_wrapper(recorder):
+                    response = self.client.post(
+                        self.path,
+                        json.dumps({"query": query, "variables": variables}),
+                        content_type="application/json",
+                        HTTP_X_ORG=slug,
+                    )
+                if self.close_connections:
+                    close_old_connections()
+                seconds = time.perf_counter() - begin
+                errors = int(response.status_code != 200 or has_errors(response.content))
+                samples.append(Sample(name, seconds, recorder.queries, recorder.rows, errors))
+        return samples, time.perf_counter() - started
+
+    def run_pages(self, pages, batched):
+        """
+        [(slug, [(query, variables), ...])] -> one Sample per page, its
+        operations sent as separate requests or as one batch (core/batching.py).
+        """
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            samples = []
+            started = time.perf_counter()
+            for slug, operations in pages:
+                entries = [{"query": query, "variables": variables} for query, variables in operations]
+                bodies = [entries] if batched else entries
+                recorder = SQLRecorder()
+                errors = 0
+                begin = time.perf_counter()
+                for body in bodies:
+                    with connection.execute_wrapper(recorder):
+                        response = self.client.post(
+                            self.path, json.dumps(body), content_type="application/json", HTTP_X_ORG=slug
+                        )
+                    if self.close_connections:
+                        close_old_connections()
+                    errors += int(response.status_code != 200 or has_batch_errors(response.content))
+                seconds = time.perf_counter() - begin
+                name = "batch" if batched else "single"
+                samples.append(Sample(name, seconds, recorder.queries, recorder.rows, errors))
+            return samples, time.perf_counter() - started
+
+
+def has_batch_errors(body):
+    # has_errors() for a response that may be a batch's array
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return True
+    payloads = payload if isinstance(payload, list) else [payload]
+    return any(not isinstance(p, dict) or p.get("errors") for p in payloads)
+
+
+class HTTPRunner:
+    """Against a running server, `concurrency` keep-alive connections in parallel."""
+
+    def __init__(self, url, concurrency=1, timeout=30):
+        self.url = urlsplit(url)
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def run(self, steps):
+        samples = []
+        lock = threading.Lock()
+        # every worker takes every Nth step, so steps keep their relative order
+        shares = [steps[i :: self.concurrency] for i in range(self.concurrency)]
+
+        def worker(share):
+            conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=self.timeout)
+            local = []
+            try:
+                for name, slug, requests in share:
+                    for query, variables in requests:
+                        body = json.dumps({"query": query, "variables": variables})
+                        begin = time.perf_counter()
+                        conn.request(
+                            "POST",
+                            self.url.path or "/",
+                            body,
+                            {"Content-Type": "application/json", "X-ORG": slug},
+                        )
+                        response = conn.getresponse()
+                        content = response.read()
+                        seconds = time.perf_counter() - begin
+                        errors = int(response.status != 200 or has_errors(content))
+                        local.append(Sample(name, seconds, errors=errors))
+            finally:
+                conn.close()
+                with lock:
+                    samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(share,)) for share in shares]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - started
+
+
+# ======================
+# CONNECTION REUSE
+# ======================
+# What happens to the database connection between two requests, see
+# DATABASES in config/settings.py. `manage.py benchmark_connections` runs
+# the same requests under each (TestClientRunner(close_connections=True)).
+
+CONNECTION_MODES = {
+    # CONN_MAX_AGE=0: connect + authenticate on every request
+    "reconnect": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "pool": False},
+    # kept open, checked before it's reused
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True, "pool": False},
+    # psycopg 3 pool, the connection goes back to it after each request
+    "pooled": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "pool": True},
+}
+
+
+def pooling_unavailable():
+    """Why the "pooled" mode can't run here, or None."""
+    if connection.vendor != "postgresql":
+        return "pooling needs Postgres"
+    if connection.Database.__name__ != "psycopg":
+        return "pooling needs psycopg 3 (psycopg2 is installed)"
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return "pooling needs psycopg_pool"
+    return None
+
+
+@contextmanager
+def connection_mode(name):
+    """Runs the block with the default connection set up as CONNECTION_MODES[name]."""
+    mode = CONNECTION_MODES[name]
+    settings_dict = connection.settings_dict
+    saved = {key: settings_dict.get(key) for key in ("CONN_MAX_AGE", "CONN_HEALTH_CHECKS")}
+    saved_options = settings_dict["OPTIONS"]
+
+    def reset():
+        connection.close()
+        if hasattr(connection, "close_pool"):
+            connection.close_pool()
+
+    reset()
+    settings_dict.update(CONN_MAX_AGE=mode["CONN_MAX_AGE"], CONN_HEALTH_CHECKS=mode["CONN_HEALTH_CHECKS"])
+    options = {key: value for key, value in saved_options.items() if key != "pool"}
+    if mode["pool"]:
+        # the configured pool options if any (DB_POOL_*), the psycopg_pool defaults otherwise
+        options["pool"] = saved_options.get("pool") or True
+    settings_dict["OPTIONS"] = options
+    try:
+        yield
+    finally:
+        reset()
+        settings_dict.update(saved)
+        settings_dict["OPTIONS"] = saved_options
+
+
+# ======================
+# REPORT + BASELINE
+# ======================
+
+def percentile(sorted_values, p):
+    # nearest rank
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    by_operation = {}
+    for sample in samples:
+        by_operation.setdefault(sample.operation, []).append(sample)
+
+    operations = {}
+    for name, group in sorted(by_operation.items()):
+        ms = sorted(sample.seconds * 1000 for sample in group)
+        stats = {
+            "requests": len(group),
+            "errors": sum(sample.errors for sample in group),
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p95_ms": round(percentile(ms, 95), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+            "mean_ms": round(statistics.fmean(ms), 3),
+        }
+        if group[0].queries is not None:
+            # per request; deterministic for a given dataset/mix/seed
+            stats["queries"] = round(statistics.fmean(s.queries for s in group), 3)
+            stats["max_queries"] = max(s.queries for s in group)
+            stats["rows"] = round(statistics.fmean(s.rows for s in group), 3)
+        operations[name] = stats
+
+    return {
+        "requests": len(samples),
+        "errors": sum(sample.errors for sample in samples),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else None,
+        "operations": operations,
+    }
+
+
+def compare(baseline, report, latency_tolerance=0.5, rows_tolerance=0.0):
+    """
+    Regressions of `report` against `baseline` as messages (empty = fine).
+    Query counts are exact, rows fetched may grow by rows_tolerance, p95
+    latency by latency_tolerance (a fraction: 0.5 = 50% slower).
+    """
+    regressions = []
+    for name, old in baseline["operations"].items():
+        new = report["operations"].get(name)
+        if new is None:
+            continue
+        if new["errors"] > old["errors"]:
+            regressions.append(f"{name}: {new['errors']} errors (baseline {old['errors']})")
+        if "queries" in old and "queries" in new:
+            if new["queries"] > old["queries"] or new["max_queries"] > old["max_queries"]:
+                regressions.append(
+                    f"{name}: {new['queries']:g} queries/request, max {new['max_queries']} "
+                    f"(baseline {old['queries']:g}, max {old['max_queries']})"
+                )
+            if new["rows"] > old["rows"] * (1 + rows_tolerance):
+                regressions.append(f"{name}: {new['rows']:g} rows/request (baseline {old['rows']:g})")
+        if latency_tolerance is not None and new["p95_ms"] > old["p95_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p95 {new['p95_ms']}ms (baseline {old['p95_ms']}ms)")
+    return regressions
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# ======================
+# SUBSCRIPTION BROKER
+# ======================
+# Pub/sub between the mutations and the GraphQL subscriptions
+# (core/subscriptions.py). Mutations publish to a topic once their
+# transaction commits, every subscriber of that topic gets the message on its
+# own asyncio.Queue.
+#
+# Mutations run in worker threads (WSGI, or sync_to_async on ASGI) while the
+# subscribers live on the event loop, so delivery goes through
+# loop.call_soon_threadsafe() - once per loop, not once per subscriber, which
+# keeps fan-out to thousands of sockets cheap.
+#
+# Messages only reach subscribers in the same process. To fan out across
+# processes point SUBSCRIPTIONS["BACKEND"] at a class that ships publish()
+# to the other processes (e.g. over Redis pub/sub) and calls
+# broker.deliver(topic, message) for everything it receives. Messages are
+# plain dicts of model instances, so they pickle.
+
+DEFAULTS = {
+    "BACKEND": "core.broker.InMemoryBackend",
+    # per subscriber; a subscriber that falls this far behind loses the oldest messages
+    "MAX_QUEUE": 100,
+    # WebSocket endpoint (core/subscriptions.py)
+    "PATH": "/graphql/",
+    "CONNECTION_INIT_TIMEOUT": 10,  # seconds
+}
+
+
+def get_setting(name):
+    return getattr(settings, "SUBSCRIPTIONS", {}).get(name, DEFAULTS[name])
+
+
+class InMemoryBackend:
+    # single process: publish() is delivered straight to the local subscribers
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, topic, message):
+        self.broker.deliver(topic, message)
+
+    def has_subscribers(self, topic):
+        # lets publishers skip building messages nobody listens to; a
+        # cross-process backend that can't tell should return True
+        return self.broker.subscriber_count(topic) > 0
+
+
+class Subscriber:
+    def __init__(self, loop, max_queue):
+        self.loop = loop
+        self.queue = asyncio.Queue(max_queue)
+
+    def put(self, message):
+        # on self.loop only
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class Broker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # topic -> set of Subscriber
+        self.subscribers = defaultdict(set)
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = import_string(get_setting("BACKEND"))(self)
+        return self._backend
+
+    def publish(self, topic, message):
+        self.backend.publish(topic, message)
+
+    def has_subscribers(self, topic):
+        return self.backend.has_subscribers(topic)
+
+    def publish_on_commit(self, topic, message, using=None):
+        # subscribers must never see a write that gets rolled back; `using`
+        # is the alias the write went to
+        transaction.on_commit(lambda: self.publish(topic, message), using=using)
+
+    def deliver(self, topic, message):
+        # called by the backend, in any thread
+        with self.lock:
+            subscribers = list(self.subscribers.get(topic, ()))
+
+        by_loop = defaultdict(list)
+        for subscriber in subscribers:
+            by_loop[subscriber.loop].append(subscriber)
+
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, group in by_loop.items():
+            if loop is current:
+                put_all(group, message)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(put_all, group, message)
+
+    async def subscribe(self, topic):
+        # async generator of the messages published to `topic` from now on
+        subscriber = Subscriber(asyncio.get_running_loop(), get_setting("MAX_QUEUE"))
+        with self.lock:
+            self.subscribers[topic].add(subscriber)
+        try:
+            while True:
+                yield await subscriber.queue.get()
+        finally:
+            with self.lock:
+                self.subscribers[topic].discard(subscriber)
+                if not self.subscribers[topic]:
+                    del self.subscribers[topic]
+
+    def subscriber_count(self, topic=None):
+        with self.lock:
+            if topic is not None:
+                return len(self.subscribers.get(topic, ()))
+            return sum(len(group) for group in self.subscribers.values())
+
+
+def put_all(subscribers, message):
+    for subscriber in subscribers:
+        subscriber.put(message)
+
+
+def task_topic(project_id):
+    return f"project:{project_id}:tasks"
+
+
+def comment_topic(task_id):
+    return f"task:{task_id}:comments"
+
+
+broker = Broker()
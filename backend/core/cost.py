@@ -0,0 +1,187 @@
+import graphene
+from django.conf import settings
+from graphene.utils.str_converters import to_snake_case
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    InlineFragmentNode,
+    get_named_type,
+    get_nullable_type,
+    get_operation_ast,
+    is_composite_type,
+)
+from graphql.utilities import value_from_ast_untyped
+
+from .pagination import DEFAULT_PAGE_SIZE
+
+
+# ======================
+# QUERY COST
+# ======================
+# Every list field can be nested in every other one (projects -> tasks ->
+# project -> tasks -> ...), so one small document can ask for millions of rows.
+# Before anything is executed we walk the operation and estimate how many
+# objects it resolves:
+#
+#   - every object costs 1 plus its sub-selection, scalars cost 0
+#   - plain lists multiply that by the estimate in the parent type's
+#     `cost_hints`, or QUERY_COST["DEFAULT_LIST_SIZE"]
+#   - connections cost 1 plus `first` (or the default page size) times one edge
+#
+# Types can override both numbers per field:
+#
+#     class ProjectType(DjangoObjectType):
+#         cost_hints = {"tasks": {"multiplier": 50}}
+#
+# Documents deeper than MAX_DEPTH or costlier than MAX_COST are rejected;
+# both limits can be raised per tenant (X-ORG slug) in QUERY_COST["TENANTS"].
+
+DEFAULTS = {
+    "MAX_DEPTH": 12,
+    "MAX_COST": 200000,
+    "DEFAULT_LIST_SIZE": 100,
+    "TENANTS": {},
+}
+
+
+def get_setting(name):
+    return getattr(settings, "QUERY_COST", {}).get(name, DEFAULTS[name])
+
+
+def tenant_limits(slug):
+    limits = get_setting("TENANTS").get(slug, {}) if slug else {}
+    return (
+        limits.get("MAX_DEPTH", get_setting("MAX_DEPTH")),
+        limits.get("MAX_COST", get_setting("MAX_COST")),
+    )
+
+
+class QueryCost:
+    def __init__(self, schema, document, variables=None, operation_name=None):
+        self.schema = schema
+        self.document = document
+        self.variables = variables or {}
+        self.operation_name = operation_name
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+
+    def analyze(self):
+        """Returns (cost, depth) of the operation that is going to run."""
+        operation = get_operation_ast(self.document, self.operation_name)
+        if operation is None:
+            return 0, 0
+        root_type = self.schema.get_root_type(operation.operation)
+        return self.selection_cost(operation.selection_set.selections, root_type)
+
+    def selection_cost(self, selections, parent_type, visited=()):
+        cost, depth = 0, 0
+        for selection in selections:
+            if isinstance(selection, FieldNode):
+                sub_cost, sub_depth = self.field_cost(selection, parent_type, visited)
+
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                sub_cost, sub_depth = self.selection_cost(
+                    selection.selection_set.selections, fragment_type, visited
+                )
+
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                if name in visited or name not in self.fragments:
+                    continue
+                fragment = self.fragments[name]
+                sub_cost, sub_depth = self.selection_cost(
+                    fragment.selection_set.selections,
+                    self.schema.get_type(fragment.type_condition.name.value),
+                    (*visited, name),
+                )
+            else:
+                continue
+
+            cost += sub_cost
+            depth = max(depth, sub_depth)
+        return cost, depth
+
+    def field_cost(self, node, parent_type, visited):
+        name = node.name.value
+        if name.startswith("__"):
+            # introspection (GraphiQL) is cheap and not tenant data
+            return 0, 0
+
+        field = get_named_type(parent_type).fields.get(name)
+        if field is None:
+            return 0, 0
+
+        field_type = field.type
+        named_type = get_named_type(field_type)
+        hint = self.hint(parent_type, name)
+        if not is_composite_type(named_type) or node.selection_set is None:
+            return hint.get("cost", 0), 1
+
+        cost = hint.get("cost", 1)
+        multiplier = hint.get("multiplier", 1)
+
+        sub_cost, sub_depth = self.selection_cost(node.selection_set.selections, named_type, visited)
+
+        if self.is_connection(parent_type):
+            # edges/pageInfo are just the wrapper, `node` pays for each row
+            return hint.get("cost", 0) + sub_cost, sub_depth + 1
+        if "first" in field.args:
+            # connection: 1 for itself + `first` times what each edge costs
+            multiplier = self.argument(node, "first")
+            if multiplier is None:
+                # `first: 0` is an empty page, not the default one
+                multiplier = DEFAULT_PAGE_SIZE
+            return cost + multiplier * sub_cost, sub_depth + 1
+        if isinstance(get_nullable_type(field_type), GraphQLList) and "multiplier" not in hint:
+            multiplier = get_setting("DEFAULT_LIST_SIZE")
+        # list: every row costs `cost` plus its own sub-selection
+        return multiplier * (cost + sub_cost), sub_depth + 1
+
+    def hint(self, parent_type, graphql_name):
+        graphene_type = getattr(get_named_type(parent_type), "graphene_type", None)
+        hints = getattr(graphene_type, "cost_hints", {})
+        return hints.get(to_snake_case(graphql_name), {})
+
+    def is_connection(self, parent_type):
+        graphene_type = getattr(get_named_type(parent_type), "graphene_type", None)
+        return isinstance(graphene_type, type) and issubclass(
+            graphene_type, graphene.relay.Connection
+        )
+
+    def argument(self, node, name):
+        for argument in node.arguments:
+            if argument.name.value == name:
+                value = value_from_ast_untyped(argument.value, self.variables)
+                return value if isinstance(value, int) else None
+        return None
+
+
+def check_cost(schema, document, variables, operation_name, slug):
+    """
+    Returns the `cost` extension for the response, raises a GraphQLError
+    when the document is over the tenant's depth or cost limit.
+    """
+    cost, depth = QueryCost(schema, document, variables, operation_name).analyze()
+    max_depth, max_cost = tenant_limits(slug)
+    extension = {"requested": cost, "maximum": max_cost, "depth": depth, "maxDepth": max_depth}
+
+    if depth > max_depth:
+        raise GraphQLError(
+            f"Query depth {depth} exceeds the maximum of {max_depth}",
+            extensions={"code": "QUERY_TOO_DEEP", "cost": extension},
+        )
+    if cost > max_cost:
+        raise GraphQLError(
+            f"Query cost {cost} exceeds the maximum of {max_cost}",
+            extensions={"code": "QUERY_TOO_EXPENSIVE", "cost": extension},
+        )
+    return extension
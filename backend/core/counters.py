@@ -0,0 +1,87 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Project, Task, TaskComment
+
+
+# ======================
+# DENORMALIZED COUNTERS
+# ======================
+# Project.<status>_count and Task.comment_count let the dashboard show task
+# stats without loading tasks. Mutations adjust them with F() expressions in
+# the same transaction as the write, so concurrent requests can't lose an
+# increment. Anything that bypasses the mutations (admin, raw SQL) can drift
+# them - rebuild_counters() / `manage.py rebuild_counters` fixes that.
+#
+# "overdue" depends on the clock rather than on writes, so it can't be kept as
+# a counter - overdue_counts() computes it with one grouped query that only
+# touches overdue rows through the (project, due_date) index.
+
+STATUS_COUNTERS = {
+    "TODO": "todo_count",
+    "IN_PROGRESS": "in_progress_count",
+    "DONE": "done_count",
+}
+
+
+def adjust_status_counts(project_id, deltas):
+    # deltas: {"TODO": -1, "DONE": +1}, statuses without a counter are ignored
+    updates = {
+        STATUS_COUNTERS[status]: F(STATUS_COUNTERS[status]) + delta
+        for status, delta in deltas.items()
+        if delta and status in STATUS_COUNTERS
+    }
+    if updates:
+        Project.objects.filter(pk=project_id).update(**updates)
+
+
+def status_changed(project_id, old_status, new_status):
+    if old_status != new_status:
+        adjust_status_counts(project_id, {old_status: -1, new_status: 1})
+
+
+def comment_added(task_id):
+    Task.objects.filter(pk=task_id).update(comment_count=F("comment_count") + 1)
+
+
+def overdue_counts(project_ids):
+    # project id -> number of open tasks past their due date
+    rows = (
+        Task.objects.filter(project_id__in=project_ids, due_date__lt=timezone.now())
+        .exclude(status="DONE")
+        .values("project_id")
+        .annotate(overdue=Count("id"))
+        .order_by()
+    )
+    return {row["project_id"]: row["overdue"] for row in rows}
+
+
+def rebuild_counters(projects=None):
+    """
+    Recomputes every counter from the task/comment rows, one UPDATE per table.
+    `projects` limits the rebuild (e.g. to one organization's projects).
+    """
+    projects = Project.objects.all() if projects is None else projects
+
+    def count(queryset, parent_field):
+        return Coalesce(
+            Subquery(
+                queryset.filter(**{parent_field: OuterRef("pk")})
+                .order_by()
+                .values(parent_field)
+                .annotate(total=Count("id"))
+                .values("total")
+            ),
+            Value(0),
+        )
+
+    projects.update(
+        **{
+            field: count(Task.objects.filter(status=status), "project")
+            for status, field in STATUS_COUNTERS.items()
+        }
+    )
+    Task.objects.filter(project__in=projects).update(
+        comment_count=count(TaskComment.objects.all(), "task")
+    )
@@ -0,0 +1,139 @@
+import gzip
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+
+# ======================
+# RESPONSE ENCODING
+# ======================
+# A project page with all its tasks and comments is a few hundred KB of JSON.
+# graphene's view encodes it with the stdlib json module and sends it as is
+# (settings.MIDDLEWARE has no GZipMiddleware - it would also compress the
+# admin's and the export's streams).
+#
+#   - encode(): orjson when installed (several times faster; datetime, date
+#     and UUID natively, the rest like DjangoJSONEncoder), stdlib json otherwise
+#   - compress(): GraphQL responses of MIN_SIZE bytes and more are sent with
+#     brotli (if installed) or gzip, whichever the client accepts.
+#     Smaller ones aren't worth the CPU.
+#
+# `manage.py benchmark_encoding` measures both on a synthetic tenant.
+
+DEFAULTS = {
+    "ENCODER": "orjson",  # or "json"
+    "COMPRESS": True,
+    "MIN_SIZE": 1024,  # bytes
+    "GZIP_LEVEL": 6,
+    "BROTLI_QUALITY": 4,  # 0-11, 4 compresses better than gzip -6 and about as fast
+}
+
+ENCODERS = ("orjson", "json")
+CODINGS = ("br", "gzip")
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_ENCODING", {}).get(name, DEFAULTS[name])
+
+
+def encoder():
+    # the configured encoder, if it's installed
+    if get_setting("ENCODER") == "orjson" and orjson is not None:
+        return "orjson"
+    return "json"
+
+
+def django_default(value):
+    # what orjson can't encode (Decimal, lazy strings, ...)
+    return DjangoJSONEncoder().default(value)
+
+
+def encode(data, pretty=False, using=None):
+    """`data` as a JSON string, compact unless pretty (sorted keys, 2-space indent)."""
+    if (using or encoder()) == "orjson":
+        options = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            options |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(data, default=django_default, option=options).decode()
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which json handles
+            pass
+    if pretty:
+        return json.dumps(data, sort_keys=True, indent=2, separators=(",", ": "), cls=DjangoJSONEncoder)
+    return json.dumps(data, separators=(",", ":"), cls=DjangoJSONEncoder)
+
+
+def compress_bytes(content, coding):
+    if coding == "br":
+        return brotli.compress(content, quality=get_setting("BROTLI_QUALITY"))
+    # mtime=0: the same body compresses to the same bytes
+    return gzip.compress(content, compresslevel=get_setting("GZIP_LEVEL"), mtime=0)
+
+
+def accepted_codings(header):
+    # "br;q=1.0, gzip;q=0.5, *;q=0" -> {"br": 1.0, "gzip": 0.5, "*": 0.0}
+    qualities = {}
+    for item in header.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities
+
+
+def negotiate(request):
+    """The coding to send the response with, None for identity."""
+    qualities = accepted_codings(request.headers.get("Accept-Encoding", ""))
+    best, best_quality = None, 0.0
+    for coding in CODINGS:
+        if coding == "br" and brotli is None:
+            continue
+        # q=0 means "not this one"; unlisted codings get the `*` quality
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(request, response):
+    """Compresses a large enough GraphQL response if the client accepts it."""
+    if not get_setting("COMPRESS") or response.streaming or response.has_header("Content-Encoding"):
+        return response
+    # it depends on Accept-Encoding whether compressed or not
+    patch_vary_headers(response, ("Accept-Encoding",))
+    if response.status_code != 200 or len(response.content) < get_setting("MIN_SIZE"):
+        return response
+    coding = negotiate(request)
+    if coding is None:
+        return response
+
+    response.content = compress_bytes(response.content, coding)
+    response["Content-Length"] = str(len(response.content))
+    response["Content-Encoding"] = coding
+    etag = response.get("ETag")
+    if etag and not etag.startswith("W/"):
+        # the same as GZipMiddleware: the compressed bytes aren't the entity
+        # the strong tag was computed for
+        response["ETag"] = "W/" + etag
+    return response
@@ -0,0 +1,143 @@
+import csv
+import datetime
+import json
+
+from asgiref.sync import sync_to_async
+
+from .models import Project, Task, TaskComment
+from .shards import database_for
+
+
+# ======================
+# TENANT EXPORT
+# ======================
+# Streams everything an organization owns as NDJSON (one JSON object per line)
+# or CSV (one row per record, a `type` column plus the union of the columns):
+#
+#   {"type": "organization", "id": 1, "name": ..., "slug": ...}
+#   {"type": "project", "id": 7, "organization_id": 1, "name": ...}
+#   {"type": "task", "id": 31, "project_id": 7, "title": ...}
+#   {"type": "comment", "id": 90, "task_id": 31, "content": ...}
+#
+# Parents always come before their children, so the file can be loaded back
+# in one pass (`manage.py import_tenant`). Rows are read with
+# .values().iterator(chunk_size) - a server-side cursor on Postgres - and
+# written out in ~64KB chunks, so memory use doesn't grow with the tenant.
+# Used by the /export/ view and `manage.py export_tenant`.
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# rows fetched per round trip to the database
+CHUNK_SIZE = 2000
+
+# bytes of output buffered before a chunk is handed to the response/file
+WRITE_SIZE = 64 * 1024
+
+RECORDS = {
+    "organization": ("id", "name", "slug", "contact_email", "created_at", "last_updated_at"),
+    "project": (
+        "id", "organization_id", "name", "description", "status", "due_date",
+        "created_at", "last_updated_at",
+    ),
+    "task": (
+        "id", "project_id", "title", "description", "status", "assignee_email", "due_date",
+        "created_at", "last_updated_at",
+    ),
+    "comment": ("id", "task_id", "content", "author_email", "created_at", "last_updated_at"),
+}
+
+# CSV header: every column of every record type, in first-seen order
+CSV_COLUMNS = ["type"] + list(dict.fromkeys(c for columns in RECORDS.values() for c in columns))
+
+
+def records(org, chunk_size=CHUNK_SIZE):
+    """(type, row dict) for everything `org` owns, parents first."""
+    yield "organization", {column: getattr(org, column) for column in RECORDS["organization"]}
+
+    # streamed after the view returned, out of the request's shard routing
+    database = database_for(org)
+    querysets = (
+        ("project", Project.objects.using(database).filter(organization=org).order_by("id")),
+        ("task", Task.objects.using(database).filter(project__organization=org).order_by("project_id", "id")),
+        (
+            "comment",
+            TaskComment.objects.using(database)
+            .filter(task__project__organization=org)
+            .order_by("task_id", "id"),
+        ),
+    )
+    for kind, queryset in querysets:
+        for row in queryset.values(*RECORDS[kind]).iterator(chunk_size=chunk_size):
+            yield kind, row
+
+
+def isoformat(value):
+    # full precision (DjangoJSONEncoder cuts microseconds, which the
+    # (created_at, id) cursors need to survive an export/import)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Buffer:
+    # file-like target for csv.writer that just keeps what was written
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def take(self):
+        text = "".join(self.parts)
+        self.parts, self.size = [], 0
+        return text
+
+
+def export_chunks(org, format="ndjson", chunk_size=CHUNK_SIZE):
+    """The export of `org` as a generator of ~WRITE_SIZE strings."""
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format}, expected one of {', '.join(FORMATS)}")
+
+    buffer = Buffer()
+    if format == "csv":
+        writer = csv.DictWriter(buffer, CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        write = lambda kind, row: writer.writerow({"type": kind, **row})  # noqa: E731
+    else:
+        encoder = json.JSONEncoder(separators=(",", ":"), default=isoformat)
+        write = lambda kind, row: buffer.write(encoder.encode({"type": kind, **row}) + "\n")  # noqa: E731
+
+    for kind, row in records(org, chunk_size):
+        write(kind, row)
+        if buffer.size >= WRITE_SIZE:
+            yield buffer.take()
+    if buffer.size:
+        yield buffer.take()
+
+
+async def aexport_chunks(org, format="ndjson", chunk_size=CHUNK_SIZE):
+    """
+    export_chunks() for ASGI. Django would read a sync iterator into a list
+    before sending any of it; this pulls one chunk at a time from the same
+    worker thread (the cursor belongs to that thread's connection).
+    """
+    chunks = export_chunks(org, format, chunk_size)
+    done = object()
+    try:
+        while True:
+            chunk = await sync_to_async(next)(chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def export_filename(org, format):
+    return f"{org.slug}.{format}"
+
@@ -0,0 +1,279 @@
+import csv
+import io
+import json
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .counters import rebuild_counters
+from .models import Organization, Project, Task, TaskComment
+
+
+# ======================
+# TENANT IMPORT
+# ======================
+# Loads a tenant from the NDJSON/CSV format written by core/export.py (what
+# `manage.py import_tenant` reads). `id`, `organization_id`, `project_id` and
+# `task_id` in the file are the *external* ids of the source system: every
+# row gets a new pk and children are re-pointed through an external -> new
+# id map (only kept for projects and tasks - nothing points at comments).
+#
+# The input is streamed and written in batches, parents before children:
+#
+#   - Postgres: pks are taken from the table's sequence up front
+#     (nextval() x batch size) and the rows go in with COPY ... FROM STDIN,
+#     which is an order of magnitude faster than INSERTs. The search_vector
+#     triggers (migration 0004) fire for COPY too.
+#   - other databases: bulk_create(), which returns the new pks
+#
+# Counters (core/counters.py) are rebuilt once at the end.
+
+BATCH_SIZE = 5000
+
+# record type -> (model, (parent record type, FK column))
+RECORD_TYPES = {
+    "project": (Project, ("organization", "organization_id")),
+    "task": (Task, ("project", "project_id")),
+    "comment": (TaskComment, ("task", "task_id")),
+}
+# flush order, parents first
+ORDER = ("project", "task", "comment")
+
+
+class InvalidImport(Exception):
+    # bad input; the import runs in one transaction, so nothing is kept
+    pass
+
+
+# ======================
+# READERS
+# ======================
+
+def read_records(lines, format):
+    """(line number, type, row dict) from NDJSON or CSV (export_chunks() output)."""
+    if format == "csv":
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            kind = row.pop("type", None)
+            # CSV has every column on every row, and no NULL
+            yield number, kind, {key: value for key, value in row.items() if value != ""}
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise InvalidImport(f"line {number}: {e}")
+            yield number, row.pop("type", None), row
+
+
+def clean(model, row, now=None):
+    """Row from the file -> {attname: python value} for the model's own columns."""
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if field.attname not in row:
+            # the writers keep what's in the file, so they'd get no timestamp at all
+            if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+                values[field.attname] = now or timezone.now()
+            continue
+        value = row[field.attname]
+        if value is not None and field.get_internal_type() == "DateTimeField":
+            value = parse_datetime(value) if isinstance(value, str) else value
+        elif value is not None and field.get_internal_type() == "DateField":
+            value = parse_date(value) if isinstance(value, str) else value
+        values[field.attname] = value
+    return values
+
+
+# ======================
+# WRITERS
+# ======================
+
+class BulkCreateWriter:
+    """Any database: bulk_create(), keeping the timestamps from the file."""
+
+    def insert(self, model, rows):
+        objs = [model(**row) for row in rows]
+        with keep_timestamps(model):
+            model.objects.bulk_create(objs)
+        return [obj.pk for obj in objs]
+
+
+class CopyWriter:
+    """Postgres: pks from the sequence, rows through COPY FROM STDIN."""
+
+    def insert(self, model, rows):
+        table = model._meta.db_table
+        fields = [f for f in model._meta.concrete_fields if f.get_internal_type() != "SearchVectorField"]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, len(rows)],
+            )
+            pks = [pk for (pk,) in cursor.fetchall()]
+
+            data = io.StringIO()
+            for pk, row in zip(pks, rows):
+                values = []
+                for field in fields:
+                    if field.primary_key:
+                        value = pk
+                    elif field.attname in row:
+                        value = row[field.attname]
+                    else:
+                        value = field.get_default()
+                    values.append(copy_value(value))
+                data.write("\t".join(values))
+                data.write("\n")
+            data.seek(0)
+
+            columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+            sql = f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN"
+            raw = cursor.cursor
+            if hasattr(raw, "copy_expert"):
+                raw.copy_expert(sql, data)  # psycopg2
+            else:
+                with raw.copy(sql) as copy:  # psycopg 3
+                    copy.write(data.getvalue())
+        return pks
+
+
+def copy_value(value):
+    # COPY text format: \N is NULL, backslash/tab/newline/CR escaped
+    if value is None:
+        return "\\N"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+@contextmanager
+def keep_timestamps(model):
+    # auto_now/auto_now_add would overwrite the imported created_at/last_updated_at
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def default_writer():
+    return CopyWriter() if connection.vendor == "postgresql" else BulkCreateWriter()
+
+
+# ======================
+# IMPORTER
+# ======================
+
+class TenantImporter:
+    def __init__(self, writer=None, batch_size=BATCH_SIZE, slug=None, progress=None):
+        self.writer = writer or default_writer()
+        self.batch_size = batch_size
+        # overrides the slug in the file
+        self.slug = slug
+        # called with the counts every time a batch is written
+        self.progress = progress
+        self.organization = None
+        self.pending = {kind: [] for kind in ORDER}
+        # record type -> {external id: new pk}, for the types that have children
+        self.ids = {"project": {}, "task": {}}
+        self.counts = {"organization": 0, "project": 0, "task": 0, "comment": 0}
+        self.started = time.perf_counter()
+
+    def run(self, records):
+        """Imports (line number, type, row) records, returns the new Organization."""
+        for number, kind, row in records:
+            if kind == "organization":
+                self.add_organization(number, row)
+            elif kind in RECORD_TYPES:
+                if self.organization is None:
+                    raise InvalidImport(f"line {number}: the organization must come first")
+                self.pending[kind].append((number, row))
+                if len(self.pending[kind]) >= self.batch_size:
+                    self.flush(kind)
+            else:
+                raise InvalidImport(f"line {number}: unknown record type {kind!r}")
+
+        if self.organization is None:
+            raise InvalidImport("no organization in the input")
+        for kind in ORDER:
+            self.flush(kind)
+        rebuild_counters(Project.objects.filter(organization=self.organization))
+        return self.organization
+
+    def add_organization(self, number, row):
+        if self.organization is not None:
+            raise InvalidImport(f"line {number}: only one organization per import")
+        values = clean(Organization, row)
+        if self.slug:
+            values["slug"] = self.slug
+        if not values.get("slug") or not values.get("name"):
+            raise InvalidImport(f"line {number}: the organization needs a name and a slug")
+        if Organization.objects.filter(slug=values["slug"]).exists():
+            raise InvalidImport(f"Organization {values['slug']} already exists")
+
+        with keep_timestamps(Organization):
+            self.organization = Organization.objects.create(**values)
+        self.counts["organization"] += 1
+
+    def flush(self, kind):
+        # children point at parents, which therefore go first
+        for parent_kind in ORDER[: ORDER.index(kind)]:
+            if self.pending[parent_kind]:
+                self.flush(parent_kind)
+        batch, self.pending[kind] = self.pending[kind], []
+        if not batch:
+            return
+
+        model, (parent_kind, parent_column) = RECORD_TYPES[kind]
+        now = timezone.now()
+        rows = []
+        for number, row in batch:
+            values = clean(model, row, now)
+            if parent_kind == "organization":
+                # there's only the one, organization_id can be left out
+                values[parent_column] = self.organization.pk
+            else:
+                external = row.get(parent_column)
+                try:
+                    values[parent_column] = self.ids[parent_kind][normalize(external)]
+                except KeyError:
+                    raise InvalidImport(f"line {number}: {kind} points at unknown {parent_kind} {external}")
+            rows.append(values)
+
+        pks = self.writer.insert(model, rows)
+        if kind in self.ids:
+            for (_, row), pk in zip(batch, pks):
+                if row.get("id") is not None:
+                    self.ids[kind][normalize(row["id"])] = pk
+        self.counts[kind] += len(rows)
+        if self.progress:
+            self.progress(self.counts, self.elapsed())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def normalize(external_id):
+    # CSV ids are strings, NDJSON ids numbers
+    return str(external_id)
@@ -0,0 +1,334 @@
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from graphene.types.resolver import get_default_resolver
+from graphql.pyutils import is_awaitable
+
+
+logger = logging.getLogger(__name__)
+
+
+# ======================
+# INSTRUMENTATION
+# ======================
+# Every GraphQL request gets a Trace: how long each resolver took (per field,
+# e.g. "ProjectType.tasks") and every SQL statement it ran, attributed to the
+# field whose resolver was running at the time.
+#
+#   - InstrumentationMiddleware (settings.GRAPHENE["MIDDLEWARE"]) times the
+#     resolvers and tracks the current field in a contextvar
+#   - record_sql is an execute wrapper installed on every DB connection when it
+#     opens (core/signals.py), so it also sees the queries run in
+#     sync_to_async() threads on the async view
+#   - the views (core/views.py) start the trace and finish it with traced()
+#
+# The same statement run N_PLUS_ONE_THRESHOLD+ times by one field in one request
+# is flagged as an N+1. With the DEBUG_HEADER set (and DEBUG on, or a staff
+# user) the trace is returned in the response as `extensions.debug`;
+# otherwise it is added to the process-wide `metrics`, served in the
+# Prometheus text format on /graphql/metrics/.
+#
+# Operation names come from the client, so they only become a label while
+# there are fewer than MAX_OPERATIONS of them (or the document is in the
+# persisted registry, core/views.py operation_label); the rest are counted as
+# "other".
+
+DEFAULTS = {
+    "ENABLED": True,
+    "DEBUG_HEADER": "X-GraphQL-Debug",
+    "N_PLUS_ONE_THRESHOLD": 5,
+    # how much of the trace goes into extensions.debug
+    "SLOWEST_RESOLVERS": 20,
+    "MAX_QUERIES": 100,
+    # distinct operation labels in `metrics`, see Metrics.label()
+    "MAX_OPERATIONS": 200,
+    # lets a scraper read /graphql/metrics/ with `Authorization: Bearer <token>`
+    "METRICS_TOKEN": None,
+}
+
+
+OTHER = "other"
+
+
+def get_setting(name):
+    return getattr(settings, "GRAPHQL_INSTRUMENTATION", {}).get(name, DEFAULTS[name])
+
+
+current_trace = ContextVar("graphql_trace", default=None)
+current_field = ContextVar("graphql_field", default=None)
+
+
+class Trace:
+    def __init__(self, operation, debug=False):
+        self.operation = operation
+        # the client asked for extensions.debug (whether it gets it is decided
+        # at the end, once the resolvers have authenticated the user)
+        self.debug = debug
+        self.started = time.perf_counter()
+        self.duration = None
+        # field -> [calls, total seconds, max seconds]
+        self.fields = defaultdict(lambda: [0, 0.0, 0.0])
+        # min-heap of the slowest (seconds, seq, field, info.path)
+        self.slowest = []
+        self.seq = 0
+        # (sql, params, seconds, field)
+        self.queries = []
+
+    def add_resolver(self, field, path, seconds):
+        stats = self.fields[field]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        if self.debug:
+            self.seq += 1
+            entry = (seconds, self.seq, field, path)
+            if len(self.slowest) < get_setting("SLOWEST_RESOLVERS"):
+                heapq.heappush(self.slowest, entry)
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def add_query(self, sql, params, seconds, field):
+        self.queries.append((sql, params, seconds, field))
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def n_plus_one(self):
+        # [(field, sql, count)]: one field running the same statement over and over
+        threshold = get_setting("N_PLUS_ONE_THRESHOLD")
+        counts = Counter((field, sql) for sql, _, _, field in self.queries)
+        return [
+            (field, sql, count)
+            for (field, sql), count in counts.most_common()
+            if count >= threshold
+        ]
+
+    def duplicates(self):
+        # [(sql, count)]: the exact same statement + parameters more than once
+        counts = Counter((sql, repr(params)) for sql, params, _, _ in self.queries)
+        return [(sql, count) for (sql, _), count in counts.most_common() if count > 1]
+
+    def report(self):
+        ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+        return {
+            "operation": self.operation,
+            "duration_ms": ms(self.duration),
+            "sql": {
+                "count": len(self.queries),
+                "duration_ms": ms(sum(seconds for _, _, seconds, _ in self.queries)),
+                "queries": [
+                    {"sql": sql, "duration_ms": ms(seconds), "field": field}
+                    for sql, _, seconds, field in self.queries[: get_setting("MAX_QUERIES")]
+                ],
+                "duplicates": [{"sql": sql, "count": count} for sql, count in self.duplicates()],
+            },
+            "resolvers": {
+                "fields": {
+                    field: {"calls": calls, "total_ms": ms(total), "max_ms": ms(slowest)}
+                    for field, (calls, total, slowest) in self.fields.items()
+                },
+                "slowest": [
+                    {"path": ".".join(map(str, path.as_list())), "field": field, "duration_ms": ms(seconds)}
+                    for seconds, _, field, path in sorted(self.slowest, reverse=True)
+                ],
+            },
+            "n_plus_one": [
+                {"field": field, "sql": sql, "count": count} for field, sql, count in self.n_plus_one()
+            ],
+        }
+
+
+def is_attribute(field):
+    # graphene's default resolver, partial(dict_or_attr_resolver, name, default),
+    # or an introspection field like __typename (None): a getattr, timing it
+    # would cost more than running it
+    if field is None or field.resolve is None:
+        return True
+    return isinstance(field.resolve, partial) and field.resolve.func is get_default_resolver()
+
+
+class InstrumentationMiddleware:
+    """
+    Graphene middleware timing the resolvers of a traced request. Plain
+    attribute fields (the scalar columns) aren't timed, they'd only add the
+    timing overhead to every value of a large list; SQL they trigger counts
+    for the field above them.
+    """
+
+    def resolve(self, next, root, info, **args):
+        trace = current_trace.get()
+        if trace is None or is_attribute(info.parent_type.fields.get(info.field_name)):
+            return next(root, info, **args)
+
+        field = f"{info.parent_type.name}.{info.field_name}"
+        token = current_field.set(field)
+        started = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+        finally:
+            current_field.reset(token)
+
+        if is_awaitable(result):
+            return self.finish_async(trace, field, info.path, started, result)
+        trace.add_resolver(field, info.path, time.perf_counter() - started)
+        return result
+
+    async def finish_async(self, trace, field, path, started, result):
+        # the queries run while awaiting still belong to this field
+        token = current_field.set(field)
+        try:
+            return await result
+        finally:
+            current_field.reset(token)
+            trace.add_resolver(field, path, time.perf_counter() - started)
+
+
+def record_sql(execute, sql, params, many, context):
+    # execute wrapper on every connection, a no-op outside a traced request
+    trace = current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.add_query(sql, params, time.perf_counter() - started, current_field.get())
+
+
+def instrument_connection(connection):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+def debug_allowed(request):
+    user = getattr(request, "user", None)
+    return settings.DEBUG or bool(user is not None and user.is_staff)
+
+
+def debug_requested(request):
+    return bool(request.headers.get(get_setting("DEBUG_HEADER")))
+
+
+def traced(request, operation, execute):
+    """
+    Runs execute() (which returns an ExecutionResult or an awaitable of one)
+    under a new Trace and finishes it: extensions.debug or the metrics.
+    """
+    if not get_setting("ENABLED"):
+        return execute()
+
+    trace = Trace(operation, debug=debug_requested(request))
+    token = current_trace.set(trace)
+    try:
+        result = execute()
+    except BaseException:
+        current_trace.reset(token)
+        raise
+
+    if is_awaitable(result):
+        async def finish():
+            try:
+                return publish(request, trace, await result)
+            finally:
+                current_trace.reset(token)
+
+        return finish()
+
+    current_trace.reset(token)
+    return publish(request, trace, result)
+
+
+def publish(request, trace, result):
+    trace.finish()
+    if trace.debug and debug_allowed(request) and result is not None:
+        result.extensions = {**(result.extensions or {}), "debug": trace.report()}
+    else:
+        metrics.record(trace)
+    return result
+
+
+class Metrics:
+    """Process-wide aggregates of the traces, see export()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # operation -> [requests, seconds, queries, query seconds]
+        self.operations = defaultdict(lambda: [0, 0.0, 0, 0.0])
+        # field -> [calls, seconds]
+        self.fields = defaultdict(lambda: [0, 0.0])
+        # field -> requests where it was flagged as an N+1
+        self.n_plus_one = Counter()
+
+    def label(self, operation):
+        """`operation`, or OTHER once MAX_OPERATIONS distinct ones have been recorded."""
+        with self.lock:
+            if operation in self.operations or len(self.operations) < get_setting("MAX_OPERATIONS"):
+                return operation
+        return OTHER
+
+    def record(self, trace):
+        flagged = trace.n_plus_one()
+        for field, sql, count in flagged:
+            logger.warning("N+1 in %s (%s): %s ran %d times", field, trace.operation, sql, count)
+
+        with self.lock:
+            operation = self.operations[trace.operation]
+            operation[0] += 1
+            operation[1] += trace.duration
+            operation[2] += len(trace.queries)
+            operation[3] += sum(seconds for _, _, seconds, _ in trace.queries)
+            for field, (calls, total, _) in trace.fields.items():
+                stats = self.fields[field]
+                stats[0] += calls
+                stats[1] += total
+            for field in {field for field, _, _ in flagged}:
+                self.n_plus_one[field] += 1
+
+    def export(self):
+        """Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label = ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+                lines.append(f"{name}{{{label}}} {value}")
+
+        with self.lock:
+            operations = sorted(self.operations.items(), key=lambda item: str(item[0]))
+            fields = sorted(self.fields.items())
+            n_plus_one = sorted(self.n_plus_one.items())
+
+        metric("graphql_requests_total", "counter", "GraphQL requests.",
+               [({"operation": op}, stats[0]) for op, stats in operations])
+        metric("graphql_request_seconds_total", "counter", "Time spent executing GraphQL requests.",
+               [({"operation": op}, round(stats[1], 6)) for op, stats in operations])
+        metric("graphql_sql_queries_total", "counter", "SQL queries run by GraphQL requests.",
+               [({"operation": op}, stats[2]) for op, stats in operations])
+        metric("graphql_sql_seconds_total", "counter", "Time spent in SQL by GraphQL requests.",
+               [({"operation": op}, round(stats[3], 6)) for op, stats in operations])
+        metric("graphql_resolver_calls_total", "counter", "Resolver calls per field.",
+               [({"field": field}, stats[0]) for field, stats in fields])
+        metric("graphql_resolver_seconds_total", "counter", "Time spent in resolvers per field.",
+               [({"field": field}, round(stats[1], 6)) for field, stats in fields])
+        metric("graphql_n_plus_one_total", "counter", "Requests where a field ran the same query N+ times.",
+               [({"field": field}, count) for field, count in n_plus_one])
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
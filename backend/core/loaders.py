@@ -0,0 +1,322 @@
+import asyncio
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from graphql.pyutils import is_awaitable
+
+from .aio import is_async
+from .models import Project, Task, TaskComment
+from .pagination import ORDERING, after_cursor
+
+
+# ======================
+# PER-REQUEST LOADERS
+# ======================
+# graphene runs our resolvers synchronously and depth-first, so a classic
+# "collect keys until the next tick" DataLoader never gets a chance to batch.
+# Instead every loader keeps a set of *pending* parents: whenever a level of
+# the tree is fetched, those rows are queued on the loader for the next
+# level down. The first load() for any of them fetches the children
+# of ALL queued parents in one query, every later load() is a dict lookup.
+# -> one query per nesting level, no matter how many rows the level has.
+#
+# On the async view (Loaders(is_async=True)) load()/load_page() return
+# coroutines and graphql-core resolves a level's siblings concurrently; the
+# first one starts the batch for all queued parents and the others await that
+# same task, so it is still one query per level.
+
+
+class RelatedLoader:
+    model = None
+    # FK on `model` pointing at the parent, e.g. "project"
+    parent_field = None
+    # reverse accessor on the parent, e.g. "tasks" (used to spot prefetched rows)
+    related_name = None
+    # loader (attribute name on Loaders) that the loaded rows are parents for
+    child_loader = None
+
+    def __init__(self, loaders):
+        self.loaders = loaders
+        self.cache = {}
+        # parent pk -> parent instance, waiting for the next batch
+        self.pending = {}
+        # every parent ever queued, used to batch paginated loads
+        self.parents = {}
+        # (parent pk, first, after) -> up to first + 1 rows
+        self.pages = {}
+        # (parent pk, ListArguments.key) -> rows matching filter/orderBy
+        self.filtered = {}
+        # async only: cache/pages key -> batch currently being fetched
+        self.inflight = {}
+
+    @property
+    def key_field(self):
+        return f"{self.parent_field}_id"
+
+    def get_queryset(self):
+        return self.model.objects.order_by("id")
+
+    def queue(self, parents):
+        # remember parents so they get batched with the next load()
+        for parent in parents:
+            self.parents[parent.pk] = parent
+            if parent.pk not in self.cache:
+                self.pending[parent.pk] = parent
+
+    def prefetched(self, parent, rows):
+        # rows the optimizer prefetched for `parent` (core/optimizer.py). They
+        # only have the columns of the selection that parent was loaded for,
+        # so they're served to that parent and never go into the cache -
+        # another selection of the same relation may need other columns.
+        rows = list(rows)
+        self.pending.pop(parent.pk, None)
+        self._queue_children(rows)
+        return rows
+
+    def load(self, parent):
+        # a list on the sync view, an awaitable on the async one (unless prefetched)
+        prefetched = getattr(parent, "_prefetched_objects_cache", {})
+        if self.related_name in prefetched:
+            return self.prefetched(parent, prefetched[self.related_name])
+
+        if self.loaders.is_async:
+            return self._aload(parent)
+
+        if parent.pk not in self.cache:
+            self.pending[parent.pk] = parent
+            parents, self.pending = self.pending, {}
+            self._store(parents, list(self._batch_queryset(parents)))
+        return self.cache[parent.pk]
+
+    async def _aload(self, parent):
+        if parent.pk not in self.cache:
+            if parent.pk not in self.inflight:
+                self.pending[parent.pk] = parent
+                parents = {
+                    pk: p for pk, p in self.pending.items() if pk not in self.inflight
+                }
+                self.pending = {}
+                self._start(parents, self._abatch(parents))
+            # siblings resolving concurrently wait for the same batch
+            await self.inflight[parent.pk]
+        return self.cache[parent.pk]
+
+    async def _abatch(self, parents):
+        self._store(parents, await self._afetch(self._batch_queryset(parents)))
+
+    def _batch_queryset(self, parents):
+        return self.get_queryset().filter(**{f"{self.key_field}__in": parents})
+
+    def _store(self, parents, rows):
+        for key, grouped in self._group(parents, rows).items():
+            self.cache[key] = grouped
+        self._queue_children(rows)
+
+    def load_page(self, parent, first, after=None):
+        # first + 1 children of `parent` after the cursor; every queued sibling
+        # asking for the same page is fetched in the same query
+        self.parents[parent.pk] = parent
+        if self.loaders.is_async:
+            return self._aload_page(parent, first, after)
+
+        if (parent.pk, first, after) not in self.pages:
+            parents = self._page_parents(first, after)
+            self._store_page(parents, list(self._page_queryset(parents, first, after)), first, after)
+        return self.pages[(parent.pk, first, after)]
+
+    async def _aload_page(self, parent, first, after):
+        key = (parent.pk, first, after)
+        if key not in self.pages:
+            if key not in self.inflight:
+                parents = {
+                    pk: p
+                    for pk, p in self._page_parents(first, after).items()
+                    if (pk, first, after) not in self.inflight
+                }
+                self._start(
+                    [(pk, first, after) for pk in parents],
+                    self._abatch_page(parents, first, after),
+                )
+            await self.inflight[key]
+        return self.pages[key]
+
+    async def _abatch_page(self, parents, first, after):
+        rows = await self._afetch(self._page_queryset(parents, first, after))
+        self._store_page(parents, rows, first, after)
+
+    def load_filtered(self, parent, arguments):
+        # children of `parent` matching `arguments` (core/filters.py), batched
+        # over every queued sibling like load_page()
+        key = (parent.pk, arguments.key)
+        prefetched = getattr(parent, arguments.prefetch_attr(self.related_name), None)
+        if prefetched is not None:
+            # the optimizer prefetched the relation with the same arguments
+            self._queue_children(prefetched)
+            return prefetched
+
+        self.parents[parent.pk] = parent
+        if self.loaders.is_async:
+            return self._aload_filtered(parent, arguments)
+
+        if key not in self.filtered:
+            parents = self._filtered_parents(arguments)
+            rows = list(arguments.apply(self._batch_queryset(parents)))
+            self._store_filtered(parents, rows, arguments)
+        return self.filtered[key]
+
+    async def _aload_filtered(self, parent, arguments):
+        key = (parent.pk, arguments.key)
+        if key not in self.filtered:
+            if key not in self.inflight:
+                parents = {
+                    pk: p
+                    for pk, p in self._filtered_parents(arguments).items()
+                    if (pk, arguments.key) not in self.inflight
+                }
+                self._start(
+                    [(pk, arguments.key) for pk in parents],
+                    self._abatch_filtered(parents, arguments),
+                )
+            await self.inflight[key]
+        return self.filtered[key]
+
+    async def _abatch_filtered(self, parents, arguments):
+        rows = await self._afetch(arguments.apply(self._batch_queryset(parents)))
+        self._store_filtered(parents, rows, arguments)
+
+    def _filtered_parents(self, arguments):
+        return {
+            pk: parent
+            for pk, parent in self.parents.items()
+            if (pk, arguments.key) not in self.filtered
+        }
+
+    def _store_filtered(self, parents, rows, arguments):
+        for key, grouped in self._group(parents, rows).items():
+            self.filtered[(key, arguments.key)] = grouped
+        self._queue_children(rows)
+
+    def _page_parents(self, first, after):
+        return {
+            pk: parent
+            for pk, parent in self.parents.items()
+            if (pk, first, after) not in self.pages
+        }
+
+    def _page_queryset(self, parents, first, after):
+        # ROW_NUMBER() per parent caps every parent at first + 1 rows in SQL
+        queryset = after_cursor(self._batch_queryset(parents), after)
+        return (
+            queryset.annotate(
+                page_row=Window(
+                    RowNumber(),
+                    partition_by=F(self.key_field),
+                    order_by=[F(field).asc() for field in ORDERING],
+                )
+            )
+            .filter(page_row__lte=first + 1)
+            .order_by(self.key_field, *ORDERING)
+        )
+
+    def _store_page(self, parents, rows, first, after):
+        for key, grouped in self._group(parents, rows).items():
+            self.pages[(key, first, after)] = grouped
+            self._queue_children(grouped[:first])
+
+    def _group(self, parents, rows):
+        grouped = {key: [] for key in parents}
+        field = self.model._meta.get_field(self.parent_field)
+        for row in rows:
+            parent = parents[getattr(row, self.key_field)]
+            # child.parent is already in memory, don't let Django query it again
+            field.set_cached_value(row, parent)
+            grouped[parent.pk].append(row)
+        return grouped
+
+    def _start(self, keys, batch):
+        # one task per batch, every key in it waits on the same task
+        task = asyncio.ensure_future(batch)
+        for key in keys:
+            self.inflight[key] = task
+        task.add_done_callback(lambda _: [self.inflight.pop(key, None) for key in keys])
+
+    async def _afetch(self, queryset):
+        return [row async for row in queryset]
+
+    def _queue_children(self, rows):
+        if self.child_loader:
+            getattr(self.loaders, self.child_loader).queue(rows)
+
+
+class ProjectsByOrganizationLoader(RelatedLoader):
+    model = Project
+    parent_field = "organization"
+    related_name = "projects"
+    child_loader = "tasks_by_project"
+
+
+class TasksByProjectLoader(RelatedLoader):
+    model = Task
+    parent_field = "project"
+    related_name = "tasks"
+    child_loader = "comments_by_task"
+
+
+class CommentsByTaskLoader(RelatedLoader):
+    model = TaskComment
+    parent_field = "task"
+    related_name = "comments"
+
+
+class Loaders:
+    def __init__(self, is_async=False):
+        # on the async view (core/views.py) loads return awaitables and use the
+        # async ORM; concurrent siblings still share one batch per level
+        self.is_async = is_async
+        self.projects_by_organization = ProjectsByOrganizationLoader(self)
+        self.tasks_by_project = TasksByProjectLoader(self)
+        self.comments_by_task = CommentsByTaskLoader(self)
+
+
+# where the running operation keeps its loaders, see with_loaders()
+current_scope = ContextVar("loaders_scope", default=None)
+
+
+def with_loaders(execute):
+    """
+    Runs execute() (which may return an awaitable) with its own set of
+    loaders. The views run every operation like this: the operations of a
+    batch select different columns of the same relations, and on the async
+    view run concurrently.
+    """
+    token = current_scope.set(SimpleNamespace(loaders=None))
+    try:
+        result = execute()
+    except BaseException:
+        current_scope.reset(token)
+        raise
+
+    if is_awaitable(result):
+        async def finish():
+            try:
+                return await result
+            finally:
+                current_scope.reset(token)
+
+        return finish()
+
+    current_scope.reset(token)
+    return result
+
+
+def get_loaders(info):
+    # one set of loaders per operation (per context outside the views),
+    # created on first use
+    scope = current_scope.get() or info.context
+    loaders = getattr(scope, "loaders", None)
+    if loaders is None:
+        loaders = Loaders(is_async=is_async(info))
+        scope.loaders = loaders
+    return loaders
@@ -0,0 +1,212 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.benchmark import (
+    Dataset,
+    HTTPRunner,
+    TestClientRunner,
+    compare,
+    parse_mix,
+    script,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the GraphQL API: create synthetic tenants, replay a seeded query mix "
+        "and report p50/p95/p99 latency, throughput and, in-process, SQL queries and rows "
+        "per request. --baseline fails the run on regressions, --save-baseline records one. "
+        "The synthetic tenants are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        dataset = parser.add_argument_group("dataset")
+        dataset.add_argument("--orgs", type=int, default=2)
+        dataset.add_argument("--projects", type=int, default=10, help="per org")
+        dataset.add_argument("--tasks", type=int, default=20, help="per project")
+        dataset.add_argument("--comments", type=int, default=2, help="per task")
+
+        run = parser.add_argument_group("run")
+        run.add_argument(
+            "--mix",
+            help="operation=weight,... out of dashboard, project_detail, status_update, "
+            "comment_burst (default dashboard=5,project_detail=3,status_update=1,comment_burst=1)",
+        )
+        run.add_argument("--steps", type=int, default=200)
+        run.add_argument("--warmup", type=int, default=10, help="steps run first and not measured")
+        run.add_argument("--seed", type=int, default=0)
+        run.add_argument(
+            "--no-response-cache",
+            action="store_true",
+            help="measure the resolvers, not the response cache (in-process only)",
+        )
+
+        target = parser.add_argument_group("target (default: in-process test client)")
+        target.add_argument("--url", help="a running server, e.g. http://127.0.0.1:8000/graphql/")
+        target.add_argument(
+            "--serve",
+            choices=["wsgi", "asgi"],
+            help="start a local server for the run: runserver (wsgi) or uvicorn (asgi)",
+        )
+        target.add_argument("--concurrency", type=int, default=1, help="parallel connections over HTTP")
+
+        baseline = parser.add_argument_group("baseline")
+        baseline.add_argument("--baseline", help="JSON report to compare against, regressions fail")
+        baseline.add_argument("--save-baseline", help="write the report as the new baseline")
+        baseline.add_argument(
+            "--latency-tolerance",
+            type=float,
+            default=0.5,
+            help="allowed p95 slowdown vs the baseline (0.5 = 50%%), negative to skip",
+        )
+        baseline.add_argument("--json", help="also write the report here")
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["url"] and options["serve"]:
+            raise CommandError("--url and --serve are exclusive")
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                baseline = json.loads(Path(options["baseline"]).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read baseline {options['baseline']}: {e}")
+
+        dataset = Dataset(options["orgs"], options["projects"], options["tasks"], options["comments"])
+        target = "http" if options["url"] or options["serve"] else "test_client"
+        config = {
+            "target": target,
+            "dataset": dataset.size,
+            "mix": mix,
+            "steps": options["steps"],
+            "seed": options["seed"],
+            "concurrency": options["concurrency"] if target == "http" else 1,
+            "response_cache": not options["no_response_cache"],
+        }
+        if baseline is not None and baseline.get("config") != config:
+            raise CommandError(
+                "The baseline was recorded with a different configuration:\n"
+                f"  baseline: {json.dumps(baseline.get('config'), sort_keys=True)}\n"
+                f"  this run: {json.dumps(config, sort_keys=True)}"
+            )
+
+        self.stdout.write(
+            "Creating {orgs} orgs x {projects} projects x {tasks} tasks x {comments} comments".format(
+                **dataset.size
+            )
+        )
+        dataset.create()
+        server = None
+        try:
+            warmup = script(dataset, mix, options["warmup"], seed=options["seed"] + 1)
+            steps = script(dataset, mix, options["steps"], seed=options["seed"])
+
+            if target == "http":
+                url = options["url"]
+                if options["serve"]:
+                    server, url = self.start_server(options["serve"])
+                runner = HTTPRunner(url, options["concurrency"])
+            else:
+                runner = TestClientRunner()
+
+            cache_settings = nullcontext()
+            if options["no_response_cache"]:
+                cache_settings = override_settings(
+                    RESPONSE_CACHE={**getattr(settings, "RESPONSE_CACHE", {}), "ENABLED": False}
+                )
+            with cache_settings:
+                runner.run(warmup)
+                samples, elapsed = runner.run(steps)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(10)
+            dataset.delete()
+
+        report = {"config": config, **summarize(samples, elapsed)}
+        self.print_report(report)
+        if report["errors"]:
+            self.stdout.write(self.style.WARNING(f"{report['errors']} requests returned errors"))
+
+        for path in filter(None, (options["json"], options["save_baseline"])):
+            Path(path).write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(f"Wrote {path}")
+
+        if baseline is not None:
+            tolerance = options["latency_tolerance"]
+            regressions = compare(baseline, report, tolerance if tolerance >= 0 else None)
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['requests']} requests in {report['elapsed_s']}s "
+            f"({report['throughput_rps']} req/s), {report['errors']} errors"
+        )
+        header = f"{'operation':<16}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        with_sql = any("queries" in stats for stats in report["operations"].values())
+        if with_sql:
+            header += f"{'queries':>9}{'rows':>9}"
+        self.stdout.write(header)
+        for name, stats in report["operations"].items():
+            line = (
+                f"{name:<16}{stats['requests']:>9}{stats['p50_ms']:>10.2f}"
+                f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+            )
+            if with_sql:
+                line += f"{stats['queries']:>9g}{stats['rows']:>9g}"
+            self.stdout.write(line)
+
+    def start_server(self, kind):
+        # the server shares our settings module (and database)
+        if settings.DATABASES["default"]["NAME"] == ":memory:":
+            raise CommandError("--serve needs a database the server process can see, not :memory:")
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        manage = Path(settings.BASE_DIR) / "manage.py"
+        if kind == "wsgi":
+            command = [sys.executable, str(manage), "runserver", f"127.0.0.1:{port}", "--noreload"]
+        else:
+            command = [
+                sys.executable, "-m", "uvicorn", "config.asgi:application",
+                "--port", str(port), "--log-level", "warning",
+            ]
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+        # the access log would drown the report, it's only shown if the server dies
+        log = tempfile.TemporaryFile()
+        server = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                output = log.read().decode(errors="replace")
+                raise CommandError(f"{' '.join(command)} exited with {server.returncode}:\n{output}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return server, f"http://127.0.0.1:{port}/graphql/"
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"{' '.join(command)} did not start listening on port {port}")
@@ -0,0 +1,80 @@
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.batching import get_setting as get_batch_setting
+from core.benchmark import Dataset, TestClientRunner, page, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what batching saves: pages of the dashboard query plus N project "
+        "details, run in-process as N+1 requests and as one batched request "
+        "(core/batching.py). Reports latency and SQL queries per page. "
+        "The synthetic tenants are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orgs", type=int, default=2)
+        parser.add_argument("--projects", type=int, default=10)
+        parser.add_argument("--tasks", type=int, default=10, help="per project")
+        parser.add_argument("--comments", type=int, default=1, help="per task")
+        parser.add_argument("--size", type=int, default=5, help="project details per page")
+        parser.add_argument("--pages", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="leave the response cache on (single requests are served from it, batches aren't)",
+        )
+
+    def handle(self, *args, **options):
+        if options["size"] + 1 > get_batch_setting("MAX_OPERATIONS"):
+            raise CommandError(
+                f"A page is {options['size'] + 1} operations, GRAPHQL_BATCH allows "
+                f"{get_batch_setting('MAX_OPERATIONS')}"
+            )
+
+        dataset = Dataset(
+            orgs=options["orgs"],
+            projects=options["projects"],
+            tasks=options["tasks"],
+            comments=options["comments"],
+        )
+        dataset.create()
+        results = {}
+        try:
+            response_cache = {**getattr(settings, "RESPONSE_CACHE", {})}
+            if not options["response_cache"]:
+                response_cache["ENABLED"] = False
+            rng = random.Random(options["seed"])
+            pages = [page(dataset, rng, options["size"]) for _ in range(options["pages"])]
+            runner = TestClientRunner()
+            with override_settings(RESPONSE_CACHE=response_cache):
+                for batched in (False, True):
+                    # warm-up: parsed documents, tenant cache
+                    runner.run_pages(pages[:5], batched)
+                    samples, elapsed = runner.run_pages(pages, batched)
+                    results.update(summarize(samples, elapsed)["operations"])
+        finally:
+            dataset.delete()
+
+        self.stdout.write(
+            f"{options['size'] + 1} operations per page"
+            + (", async view" if settings.GRAPHQL_ASYNC else "")
+        )
+        self.stdout.write(
+            f"{'mode':<8}{'pages':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'queries':>9}"
+        )
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:<8}{stats['requests']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.3f}"
+                f"{stats['p95_ms']:>10.3f}{stats['mean_ms']:>10.3f}{stats['queries']:>9.1f}"
+            )
+        single, batch = results["single"], results["batch"]
+        self.stdout.write(
+            f"batch saves {single['mean_ms'] - batch['mean_ms']:.3f} ms and "
+            f"{single['queries'] - batch['queries']:.1f} queries per page on average"
+        )
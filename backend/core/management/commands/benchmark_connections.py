@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from core.benchmark import (
+    CONNECTION_MODES,
+    Dataset,
+    TestClientRunner,
+    connection_mode,
+    pooling_unavailable,
+    script,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what connection reuse saves per request: the dashboard `projects` query "
+        "run in-process with the database connection closed after every request "
+        "(CONN_MAX_AGE=0), kept open (persistent) or returned to a psycopg pool. "
+        "The synthetic tenant is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--projects", type=int, default=10)
+        parser.add_argument("--tasks", type=int, default=5, help="per project")
+        parser.add_argument("--requests", type=int, default=300, help="per mode")
+        parser.add_argument(
+            "--modes", default=",".join(CONNECTION_MODES), help="comma separated, out of %(default)s"
+        )
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="leave the response cache on (cached responses don't touch the database at all)",
+        )
+
+    def handle(self, *args, **options):
+        modes = [mode.strip() for mode in options["modes"].split(",") if mode.strip()]
+        unknown = set(modes) - set(CONNECTION_MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        if getattr(connection, "is_in_memory_db", lambda: False)():
+            raise CommandError("Closing the connection would drop a :memory: database")
+
+        dataset = Dataset(orgs=1, projects=options["projects"], tasks=options["tasks"], comments=0)
+        dataset.create()
+        connects = []
+        count = lambda **kwargs: connects.append(1)  # noqa: E731
+        connection_created.connect(count)
+        results = {}
+        try:
+            response_cache = {**getattr(settings, "RESPONSE_CACHE", {})}
+            if not options["response_cache"]:
+                response_cache["ENABLED"] = False
+            for mode in modes:
+                reason = pooling_unavailable() if mode == "pooled" else None
+                if reason:
+                    self.stdout.write(f"{mode}: skipped, {reason}")
+                    continue
+                runner = TestClientRunner(close_connections=True)
+                with connection_mode(mode), override_settings(RESPONSE_CACHE=response_cache):
+                    runner.run(script(dataset, {"dashboard": 1}, 10, seed=1))
+                    del connects[:]
+                    samples, elapsed = runner.run(script(dataset, {"dashboard": 1}, options["requests"]))
+                report = summarize(samples, elapsed)
+                results[mode] = {**report["operations"]["dashboard"], "connects": len(connects)}
+        finally:
+            connection_created.disconnect(count)
+            dataset.delete()
+
+        self.stdout.write(
+            f"{'mode':<12}{'requests':>9}{'connects':>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}"
+        )
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:<12}{stats['requests']:>9}{stats['connects']:>10}{stats['p50_ms']:>10.3f}"
+                f"{stats['p95_ms']:>10.3f}{stats['mean_ms']:>10.3f}"
+            )
+        if "reconnect" in results:
+            base = results["reconnect"]["mean_ms"]
+            for mode, stats in results.items():
+                if mode != "reconnect":
+                    self.stdout.write(
+                        f"{mode} saves {base - stats['mean_ms']:.3f} ms/request on average vs reconnect"
+                    )
+
@@ -0,0 +1,88 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.benchmark import PROJECT_DETAIL, TREE, Dataset
+from core.encoding import CODINGS, ENCODERS, brotli, compress_bytes, encode, orjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure response encoding on a synthetic tenant: time to encode the tenant's "
+        "tree and one project page with each JSON encoder, time and size with each "
+        "compression, and the bytes /graphql/ actually sends per Accept-Encoding "
+        "(core/encoding.py). The synthetic tenant is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--projects", type=int, default=5)
+        parser.add_argument("--tasks", type=int, default=200, help="per project")
+        parser.add_argument("--comments", type=int, default=5, help="per task")
+        parser.add_argument("--repeat", type=int, default=20, help="encodings/compressions timed per case")
+
+    def handle(self, *args, **options):
+        dataset = Dataset(orgs=1, projects=options["projects"], tasks=options["tasks"], comments=options["comments"])
+        dataset.create()
+        slug, tenant = next(iter(dataset.tenants.items()))
+        queries = {
+            "tree": (TREE, {}),
+            "project": (PROJECT_DETAIL, {"id": tenant["projects"][0]}),
+        }
+        client = Client()
+        try:
+            with override_settings(
+                RESPONSE_CACHE={**getattr(settings, "RESPONSE_CACHE", {}), "ENABLED": False},
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                for name, (query, variables) in queries.items():
+                    body = json.dumps({"query": query, "variables": variables})
+                    post = lambda coding: client.post(  # noqa: E731
+                        "/graphql/", body, content_type="application/json",
+                        HTTP_X_ORG=slug, HTTP_ACCEPT_ENCODING=coding,
+                    )
+                    response = post("identity")
+                    payload = response.json()
+                    if response.status_code != 200 or payload.get("errors"):
+                        raise CommandError(f"The {name} query failed: {payload.get('errors')}")
+                    self.report(name, payload, post, options["repeat"])
+        finally:
+            dataset.delete()
+
+    def report(self, name, payload, post, repeat):
+        self.stdout.write(f"\n{name}")
+        self.stdout.write(f"  {'encoder':<10}{'encode ms':>11}{'bytes':>11}")
+        for encoder in ENCODERS:
+            if encoder == "orjson" and orjson is None:
+                self.stdout.write("  orjson: skipped, not installed")
+                continue
+            seconds, text = timed(lambda: encode(payload, using=encoder), repeat)
+            self.stdout.write(f"  {encoder:<10}{seconds * 1000:>11.3f}{len(text.encode()):>11}")
+
+        content = encode(payload).encode()
+        self.stdout.write(f"  {'coding':<10}{'compress ms':>11}{'bytes':>11}{'ratio':>8}")
+        for coding in CODINGS:
+            if coding == "br" and brotli is None:
+                self.stdout.write("  br: skipped, brotli not installed")
+                continue
+            seconds, compressed = timed(lambda: compress_bytes(content, coding), repeat)
+            self.stdout.write(
+                f"  {coding:<10}{seconds * 1000:>11.3f}{len(compressed):>11}{len(content) / len(compressed):>8.1f}"
+            )
+
+        self.stdout.write(f"  {'Accept-Encoding':<22}{'sent as':>10}{'bytes on the wire':>19}")
+        for accepted in ("identity", "gzip", "br, gzip"):
+            response = post(accepted)
+            sent = response.get("Content-Encoding", "identity")
+            self.stdout.write(f"  {accepted:<22}{sent:>10}{len(response.content):>19}")
+
+
+def timed(function, repeat):
+    # (mean seconds per call, last result)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
@@ -0,0 +1,64 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.export import FORMATS
+from core.importer import BATCH_SIZE, InvalidImport, TenantImporter, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Load an organization with its projects, tasks and comments from NDJSON or CSV "
+        "(the export_tenant format, ids are the source system's). Streams the input and "
+        "writes in batches through COPY on Postgres, bulk_create elsewhere. All or nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="file to read, - for stdin")
+        parser.add_argument(
+            "--format", choices=list(FORMATS), help="default: from the file extension, else ndjson"
+        )
+        parser.add_argument("--slug", help="slug of the new organization, instead of the one in the file")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per COPY/bulk_create")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or ("csv" if path.lower().endswith(".csv") else "ndjson")
+        self.last_report = 0
+
+        importer = TenantImporter(
+            batch_size=options["batch_size"], slug=options["slug"], progress=self.progress
+        )
+        try:
+            with self.open(path) as lines, transaction.atomic():
+                org = importer.run(read_records(lines, format))
+        except InvalidImport as e:
+            raise CommandError(str(e))
+
+        counts, elapsed = importer.counts, importer.elapsed()
+        rows = sum(counts.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {org.slug}: {counts['project']} projects, {counts['task']} tasks, "
+                f"{counts['comment']} comments in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+            )
+        )
+
+    def open(self, path):
+        if path == "-":
+            return nullcontext(sys.stdin)
+        try:
+            return open(path, encoding="utf-8", newline="")
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {e}")
+
+    def progress(self, counts, elapsed):
+        # a line per ~100k rows, on stderr
+        rows = sum(counts.values())
+        if rows - self.last_report < 100_000:
+            return
+        self.last_report = rows
+        self.stderr.write(f"  {rows:,} rows, {rows / max(elapsed, 1e-9):,.0f} rows/s", style_func=None)
+
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.broker import broker, task_topic
+from core.models import Organization, Project, Task
+from core.subscriptions import PROTOCOL, websocket_application
+
+
+QUERY = """
+    subscription ($id: ID!) {
+      taskChanged(projectId: $id) { kind task { id title status } }
+    }
+"""
+
+
+class LocalSocket:
+    # an in-process WebSocket client, talking ASGI to the subscription server
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {"type": "websocket", "path": "/graphql/", "subprotocols": [PROTOCOL], "headers": []}
+        self.task = asyncio.ensure_future(websocket_application(scope, self.inbox.get, self.outbox.put))
+
+    async def send(self, message):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive(self):
+        message = await self.outbox.get()
+        return json.loads(message["text"]) if "text" in message else message
+
+    async def open(self, slug, variables):
+        await self.inbox.put({"type": "websocket.connect"})
+        await self.receive()  # accept
+        await self.send({"type": "connection_init", "payload": {"X-ORG": slug}})
+        await self.receive()  # ack
+        await self.send({"id": "1", "type": "subscribe", "payload": {"query": QUERY, "variables": variables}})
+
+    async def close(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+
+class Command(BaseCommand):
+    help = (
+        "Open N local WebSocket subscriptions to taskChanged, publish events "
+        "and report the fan-out latency (publish -> `next` message on every socket). "
+        "Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=2000)
+        parser.add_argument("--events", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            org = Organization.objects.create(
+                name="Load test", slug="subscription-load-test", contact_email="load@test.test"
+            )
+            project = Project.objects.create(organization=org, name="Load test")
+            task = Task.objects.create(project=project, title="Load test")
+
+            latencies, elapsed = async_to_sync(self.run)(
+                org.slug, project, task, options["subscribers"], options["events"]
+            )
+            transaction.set_rollback(True)
+
+        latencies.sort()
+        ms = [latency * 1000 for latency in latencies]
+        self.stdout.write(
+            f"{options['subscribers']} subscribers x {options['events']} events: "
+            f"{len(ms)} deliveries in {elapsed:.2f}s ({len(ms) / elapsed:.0f}/s)"
+        )
+        self.stdout.write(
+            "fan-out latency ms: "
+            f"p50={statistics.median(ms):.1f} "
+            f"p95={ms[int(len(ms) * 0.95) - 1]:.1f} "
+            f"p99={ms[int(len(ms) * 0.99) - 1]:.1f} "
+            f"max={ms[-1]:.1f}"
+        )
+
+    async def run(self, slug, project, task, subscribers, events):
+        topic = task_topic(project.id)
+        sockets = [LocalSocket() for _ in range(subscribers)]
+        await asyncio.gather(*(s.open(slug, {"id": project.id}) for s in sockets))
+        while broker.subscriber_count(topic) < subscribers:
+            await asyncio.sleep(0.01)
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(events):
+            published = time.perf_counter()
+            # published from a worker thread, like a mutation would
+            await asyncio.to_thread(broker.publish, topic, {"kind": "UPDATED", "task": task})
+
+            async def receive(socket):
+                await socket.receive()
+                latencies.append(time.perf_counter() - published)
+
+            await asyncio.gather(*(receive(s) for s in sockets))
+        elapsed = time.perf_counter() - started
+
+        await asyncio.gather(*(s.close() for s in sockets))
+        return latencies, elapsed
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.models import Organization
+from core.shards import TenantMove
+
+
+class Command(BaseCommand):
+    help = (
+        "Move an organization's projects, tasks and comments to another database "
+        "(see core/shards.py) while it stays online: copy, catch up until little "
+        "changes, then cut over. Mutations are refused for the last pass and until "
+        "every process picked up the new shard (the tenant cache TTL); reads keep working."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("org", help="organization slug")
+        parser.add_argument("shard", help=f"DATABASES alias to move to ({DEFAULT_DB_ALIAS} or a shard)")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--max-passes", type=int, default=10, help="catch-up passes before cutting over")
+        parser.add_argument(
+            "--threshold", type=int, default=100, help="cut over once a pass copies this few rows"
+        )
+        parser.add_argument(
+            "--drain", type=float, default=2.0, help="seconds in-flight mutations get to finish"
+        )
+        parser.add_argument(
+            "--freeze-seconds",
+            type=float,
+            help="how long mutations stay refused after the switch (default: the tenant cache TTL)",
+        )
+        parser.add_argument(
+            "--delete-source", action="store_true", help="delete the rows from the old shard afterwards"
+        )
+
+    def handle(self, *args, **options):
+        org = Organization.objects.using(DEFAULT_DB_ALIAS).filter(slug=options["org"]).first()
+        if not org:
+            raise CommandError(f"Organization {options['org']} not found")
+
+        move = TenantMove(org, options["shard"], batch_size=options["batch_size"], log=self.stdout.write)
+        problems = move.check()
+        if problems:
+            raise CommandError("\n".join(problems))
+
+        self.stdout.write(f"Moving {org.slug} from {move.source} to {move.target}")
+        move.run(
+            max_passes=options["max_passes"],
+            threshold=options["threshold"],
+            drain=options["drain"],
+            freeze_seconds=options["freeze_seconds"],
+        )
+        if options["delete_source"]:
+            self.stdout.write(f"Deleted {move.delete_source()} rows from {move.source}")
+        self.stdout.write(self.style.SUCCESS(f"{org.slug} is on {move.target}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.counters import rebuild_counters
+from core.models import Organization, Project
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized task/comment counters from the actual rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", help="only rebuild this organization (slug)")
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all()
+        if options["org"]:
+            org = Organization.objects.filter(slug=options["org"]).first()
+            if not org:
+                raise CommandError(f"Organization {options['org']} not found")
+            projects = projects.filter(organization=org)
+
+        rebuild_counters(projects)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {projects.count()} projects"))
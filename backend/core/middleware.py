@@ -1,24 +1,60 @@
-from .models import Organization
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from .shards import tenant_context
+from .tenants import organization_cache
+
+
+async def no_organization():
+    return None
+
 
 class OrganizationMiddleware:
+    # works in both chains: under WSGI (or sync views) Django calls it sync,
+    # under ASGI with async views it's awaited without a thread hop
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         # get_response = the next middleware or view function in Django's request chain
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # tells Django this instance returns coroutines (see __call__)
+            markcoroutinefunction(self)
 
     def __call__(self, request):
         # This makes the middleware "callable" - Django calls this method for each request
-        
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        self.set_organization(request)
+        # the tenant's `core` queries go to its shard (core/shards.py)
+        with tenant_context(request.headers.get("X-ORG")):
+            return self.get_response(request)
+        # Call the next middleware/view and return its response
+        # This passes the request onwards in the Django chain
+
+    async def __acall__(self, request):
+        # same thing for the async chain
+        self.set_organization(request)
+        with tenant_context(request.headers.get("X-ORG")):
+            return await self.get_response(request)
+
+    def set_organization(self, request):
         slug = request.headers.get("X-ORG")
         # Extract the "X-ORG" header value from the HTTP request
         # Returns None if header doesn't exist
-        
+
         request.organization = (
-            Organization.objects.filter(slug=slug).first()
-            # Query database for Organization with matching slug
-            # .first() returns the first match or None if not found
+            SimpleLazyObject(lambda: organization_cache.get(slug))
+            # Resolved on first use only (e.g. a resolver reading info.context.organization),
+            # from the in-process / shared cache, falling back to the database
+            # (core/tenants.py) - None if no organization has that slug
             if slug else None
         )
-        
-        return self.get_response(request)
-        # Call the next middleware/view and return its response
-        # This passes the request onwards in the Django chain
\ No newline at end of file
+
+        # async code can't touch the lazy object above (it would query the
+        # database synchronously), it awaits request.aorganization() instead
+        request.aorganization = partial(organization_cache.aget, slug) if slug else no_organization
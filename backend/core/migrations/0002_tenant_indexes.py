@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name='project',
+            index=models.Index(fields=['organization', 'created_at', 'id'], name='project_org_created_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='task',
+            index=models.Index(fields=['project', 'created_at', 'id'], name='task_project_created_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='task',
+            index=models.Index(fields=['project', 'status'], name='task_project_status_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='task',
+            index=models.Index(fields=['project', 'due_date'], name='task_project_due_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='taskcomment',
+            index=models.Index(fields=['task', 'created_at', 'id'], name='comment_task_created_idx'),
+        ),
+    ]
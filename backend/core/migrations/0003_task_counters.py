@@ -0,0 +1,62 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    # same as core.counters.rebuild_counters, against the historical models
+    Project = apps.get_model('core', 'Project')
+    Task = apps.get_model('core', 'Task')
+    TaskComment = apps.get_model('core', 'TaskComment')
+
+    def count(queryset, parent_field):
+        return Coalesce(
+            Subquery(
+                queryset.filter(**{parent_field: OuterRef('pk')})
+                .order_by()
+                .values(parent_field)
+                .annotate(total=Count('id'))
+                .values('total')
+            ),
+            Value(0),
+        )
+
+    Project.objects.update(
+        todo_count=count(Task.objects.filter(status='TODO'), 'project'),
+        in_progress_count=count(Task.objects.filter(status='IN_PROGRESS'), 'project'),
+        done_count=count(Task.objects.filter(status='DONE'), 'project'),
+    )
+    Task.objects.update(comment_count=count(TaskComment.objects.all(), 'task'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_tenant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='done_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='in_progress_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='todo_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
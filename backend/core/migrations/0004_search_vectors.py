@@ -0,0 +1,86 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from core.operations import AddIndexConcurrentlyIfPostgres, BatchedUpdateIfPostgres, RunSQLIfPostgres
+
+
+# tsvector columns kept up to date by BEFORE INSERT/UPDATE triggers, so rows
+# written by bulk_create(), update() or raw SQL are indexed too. Existing rows
+# are backfilled by touching them in batches once the triggers are in place.
+TASK_TRIGGER = """
+CREATE FUNCTION core_task_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_task_search_vector
+    BEFORE INSERT OR UPDATE OF title, description ON core_task
+    FOR EACH ROW EXECUTE FUNCTION core_task_search_vector();
+"""
+
+COMMENT_TRIGGER = """
+CREATE FUNCTION core_taskcomment_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := setweight(to_tsvector('english', coalesce(NEW.content, '')), 'A');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_taskcomment_search_vector
+    BEFORE INSERT OR UPDATE OF content ON core_taskcomment
+    FOR EACH ROW EXECUTE FUNCTION core_taskcomment_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0003_task_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='taskcomment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        RunSQLIfPostgres(
+            TASK_TRIGGER,
+            reverse_sql="""
+                DROP TRIGGER core_task_search_vector ON core_task;
+                DROP FUNCTION core_task_search_vector();
+            """,
+        ),
+        RunSQLIfPostgres(
+            COMMENT_TRIGGER,
+            reverse_sql="""
+                DROP TRIGGER core_taskcomment_search_vector ON core_taskcomment;
+                DROP FUNCTION core_taskcomment_search_vector();
+            """,
+        ),
+        BatchedUpdateIfPostgres('core_task', 'title = title'),
+        BatchedUpdateIfPostgres('core_taskcomment', 'content = content'),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='task',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='task_search_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='taskcomment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='comment_search_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0004_search_vectors'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name='project',
+            index=models.Index(fields=['organization', 'status'], name='project_org_status_idx'),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name='task',
+            index=models.Index(fields=['project', 'assignee_email', 'status'], name='task_project_assignee_idx'),
+        ),
+    ]
@@ -1,9 +1,20 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+class SearchVectorManager(models.Manager):
+    # the tsvector is only for search to filter on (core/search.py), every
+    # other query would just read and parse it
+    def get_queryset(self):
+        return super().get_queryset().defer("search_vector")
+
+
 class Organization(models.Model):
     name=models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     contact_email=models.EmailField()
+    # DATABASES alias with this tenant's projects, tasks and comments (core/shards.py)
+    shard = models.CharField(max_length=100, default="default")
     created_at=models.DateTimeField(auto_now_add=True)
     last_updated_at=models.DateTimeField(auto_now=True)
     
@@ -31,6 +42,19 @@ class Project(models.Model):
     due_date=models.DateField(null=True, blank=True)
     created_at=models.DateTimeField(auto_now_add=True)
     last_updated_at=models.DateTimeField(auto_now=True)
+    # denormalized task counts per status, kept in sync by the task mutations
+    # (core/counters.py) - `python manage.py rebuild_counters` recomputes them
+    todo_count = models.IntegerField(default=0)
+    in_progress_count = models.IntegerField(default=0)
+    done_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # projects of an org in (created_at, id) order - list + keyset pages
+            models.Index(fields=["organization", "created_at", "id"], name="project_org_created_idx"),
+            # projects(filter: {statusIn}) (core/filters.py)
+            models.Index(fields=["organization", "status"], name="project_org_status_idx"),
+        ]
     
     def __str__(self):
         return self.name
@@ -58,6 +82,22 @@ class Task(models.Model):
     due_date = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated_at=models.DateTimeField(auto_now=True)
+    # denormalized, kept in sync by AddComment (core/counters.py)
+    comment_count = models.IntegerField(default=0)
+    # title (weight A) + description (B), maintained by a Postgres trigger (core/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchVectorManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "created_at", "id"], name="task_project_created_idx"),
+            models.Index(fields=["project", "status"], name="task_project_status_idx"),
+            models.Index(fields=["project", "due_date"], name="task_project_due_idx"),
+            # tasks(filter: {assigneeEmail, statusIn}) - "my open tasks" (core/filters.py)
+            models.Index(fields=["project", "assignee_email", "status"], name="task_project_assignee_idx"),
+            GinIndex(fields=["search_vector"], name="task_search_idx"),
+        ]
     
     def __str__(self):
         return self.title
@@ -71,6 +111,16 @@ class TaskComment(models.Model):
     author_email = models.EmailField()
     created_at = models.DateTimeField(auto_now_add=True)
     last_updated_at=models.DateTimeField(auto_now=True)
+    # content, maintained by a Postgres trigger (core/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchVectorManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["task", "created_at", "id"], name="comment_task_created_idx"),
+            GinIndex(fields=["search_vector"], name="comment_search_idx"),
+        ]
     
     def __str__(self):
         return f"Comment by {self.author_email} on {self.task.title}"
\ No newline at end of file
@@ -0,0 +1,83 @@
+from django.contrib.postgres.indexes import PostgresIndex
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import transaction
+from django.db.migrations.operations import AddIndex, RunSQL
+from django.db.migrations.operations.base import Operation
+
+
+# ======================
+# MIGRATION OPERATIONS
+# ======================
+
+class AddIndexConcurrentlyIfPostgres(AddIndexConcurrently):
+    # CREATE INDEX CONCURRENTLY on Postgres, so the index can be built on a live
+    # database without blocking writes. Other backends (SQLite in local tests)
+    # don't have CONCURRENTLY and just get a plain CREATE INDEX - or nothing at
+    # all for Postgres-only index types (GinIndex, ...).
+    # Migrations using it must set `atomic = False`.
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        if not isinstance(self.index, PostgresIndex):
+            return AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        if not isinstance(self.index, PostgresIndex):
+            return AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class RunSQLIfPostgres(RunSQL):
+    # raw Postgres SQL (triggers, functions, ...), skipped on other backends
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class BatchedUpdateIfPostgres(Operation):
+    # UPDATE <table> SET <assignments> in pk ranges of batch_size rows, each
+    # range in its own transaction - a backfill on a live database that doesn't
+    # lock and rewrite the whole table in one go. Rows written while it runs
+    # are the triggers' business. Skipped on other backends.
+    # Migrations using it must set `atomic = False`.
+
+    reduces_to_sql = False
+
+    def __init__(self, table, assignments, batch_size=5000):
+        self.table = table
+        self.assignments = assignments
+        self.batch_size = batch_size
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        if connection.vendor != "postgresql":
+            return
+        table = schema_editor.quote_name(self.table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT min(id), max(id) FROM {table}")
+            low, high = cursor.fetchone()
+        if low is None:
+            return
+        for start in range(low, high + 1, self.batch_size):
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET {self.assignments} WHERE id BETWEEN %s AND %s",
+                    [start, start + self.batch_size - 1],
+                )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        # nothing to undo, the column goes away with the field
+        pass
+
+    def describe(self):
+        return f"Update {self.table} in batches of {self.batch_size}"
@@ -0,0 +1,186 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    get_named_type,
+)
+from graphql.execution.values import get_argument_values
+
+from .filters import FILTERSETS, ListArguments
+
+
+# ======================
+# QUERY OPTIMIZER
+# ======================
+# Looks at the fields the client actually selected (info.field_nodes) and turns
+# them into only() / select_related() / Prefetch(queryset=...) on the root
+# queryset, so relations that weren't asked for are never loaded and big text
+# columns (description, content) are only read when requested.
+#
+# Anything the optimizer doesn't understand (a custom resolver field that isn't
+# a model field) makes it fall back to loading full rows for that model - over
+# fetching is always safe, deferring a column a resolver needs is not.
+# Types can list the columns such fields need in `optimizer_hints`:
+#
+#     class ProjectType(DjangoObjectType):
+#         optimizer_hints = {"tasks_connection": ()}  # only needs the pk
+
+
+def optimize(queryset, info):
+    optimizer = QueryOptimizer(info)
+    return optimizer.optimize(queryset, info.field_nodes, info.return_type)
+
+
+def optimize_connection(queryset, info):
+    # same as optimize(), for a connection field: `edges { node { ... } }`
+    optimizer = QueryOptimizer(info)
+    edges_type = get_named_type(info.return_type).fields["edges"].type
+    node_type = get_named_type(edges_type).fields["node"].type
+
+    edges = optimizer.selected_fields(info.field_nodes).get("edges", [])
+    nodes = optimizer.selected_fields(edges).get("node", [])
+    # cursors are built from (created_at, id)
+    return optimizer.optimize(queryset, nodes, node_type, extra_only=["created_at"])
+
+
+def optimize_field(queryset, info, field_name, extra_only=()):
+    # same as optimize(), for a model returned under `field_name` of the
+    # payload, e.g. `updateTask { task { ... } }`
+    optimizer = QueryOptimizer(info)
+    field_type = get_named_type(info.return_type).fields[field_name].type
+    nodes = optimizer.selected_fields(info.field_nodes).get(field_name, [])
+    return optimizer.optimize(queryset, nodes, field_type, extra_only=extra_only)
+
+
+class QueryOptimizer:
+    def __init__(self, info):
+        self.info = info
+
+    def optimize(self, queryset, field_nodes, graphql_type, extra_only=()):
+        only, select, prefetch = self.plan(queryset.model, field_nodes, graphql_type)
+
+        if only is not None:
+            queryset = queryset.only(*only, *extra_only)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    def plan(self, model, field_nodes, graphql_type, prefix=""):
+        """
+        Returns (only, select_related, prefetch_related) for `model`.
+        `only` is None when a selected field couldn't be mapped to a column.
+        """
+        graphql_type = get_named_type(graphql_type)
+        only = {f"{prefix}{model._meta.pk.attname}"}
+        select, prefetch = [], []
+        complete = True
+
+        for name, nodes in self.selected_fields(field_nodes).items():
+            if name.startswith("__"):
+                continue
+
+            field = self.model_field(model, name)
+            if field is None:
+                hints = getattr(graphql_type.graphene_type, "optimizer_hints", {})
+                hint = hints.get(to_snake_case(name))
+                if hint is None:
+                    complete = False
+                else:
+                    only.update(f"{prefix}{column}" for column in hint)
+                continue
+
+            field_type = graphql_type.fields[name].type
+            path = f"{prefix}{field.name}"
+
+            if field.many_to_one or (field.one_to_one and field.concrete):
+                # forward FK -> JOIN it in, columns of the related row are pruned too
+                only.add(f"{prefix}{field.attname}")
+                select.append(path)
+                sub_only, sub_select, sub_prefetch = self.plan(
+                    field.related_model, nodes, field_type, prefix=f"{path}__"
+                )
+                if sub_only is None:
+                    complete = False
+                else:
+                    only.update(sub_only)
+                select.extend(sub_select)
+                prefetch.extend(sub_prefetch)
+
+            elif field.one_to_many:
+                # reverse FK -> one extra query for the whole level
+                # (the FK back to us must be loaded or Django can't match
+                # the children to their parent)
+                # one Prefetch per distinct filter/orderBy (core/filters.py)
+                field_def = graphql_type.fields[name]
+                accessor = field.get_accessor_name()
+                for arguments, group in self.group_by_arguments(field, field_def, nodes):
+                    related_qs = self.optimize(
+                        field.related_model.objects.order_by("id"),
+                        group,
+                        field_type,
+                        extra_only=[field.field.attname],
+                    )
+                    if arguments is None:
+                        prefetch.append(Prefetch(f"{prefix}{accessor}", queryset=related_qs))
+                    else:
+                        prefetch.append(
+                            Prefetch(
+                                f"{prefix}{accessor}",
+                                queryset=arguments.apply(related_qs),
+                                to_attr=arguments.prefetch_attr(accessor),
+                            )
+                        )
+
+            elif field.concrete:
+                only.add(f"{prefix}{field.attname}")
+
+            else:
+                complete = False
+
+        return (only if complete else None), select, prefetch
+
+    def group_by_arguments(self, field, field_def, nodes):
+        """
+        Splits the selections of a reverse FK list by their filter/orderBy
+        arguments: [(ListArguments or None, nodes)], None for no arguments.
+        """
+        if field.related_model not in FILTERSETS:
+            return [(None, nodes)]
+
+        groups = {}
+        for node in nodes:
+            values = get_argument_values(field_def, node, self.info.variable_values)
+            arguments = ListArguments(field.related_model, values.get("filter"), values.get("order_by"))
+            key = arguments.key if arguments else None
+            groups.setdefault(key, (arguments or None, []))[1].append(node)
+        return list(groups.values())
+
+    def model_field(self, model, graphql_name):
+        name = to_snake_case(graphql_name)
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def selected_fields(self, field_nodes):
+        # merge every selection of the same field, following fragments
+        fields = {}
+        for node in field_nodes:
+            if node.selection_set:
+                self._collect(node.selection_set.selections, fields)
+        return fields
+
+    def _collect(self, selections, fields):
+        for selection in selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                self._collect(selection.selection_set.selections, fields)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.info.fragments[selection.name.value]
+                self._collect(fragment.selection_set.selections, fields)
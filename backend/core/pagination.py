@@ -0,0 +1,96 @@
+import base64
+from datetime import datetime
+
+import graphene
+from django.db.models import Q
+
+
+# ======================
+# KEYSET PAGINATION
+# ======================
+# Connections are ordered by (created_at, id) and the cursor is simply the
+# (created_at, id) of the row it points at. Fetching the page after a cursor
+# is then `WHERE (created_at, id) > cursor ORDER BY created_at, id LIMIT n`,
+# which walks the index instead of counting past OFFSET rows - page 1000
+# costs the same as page 1.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+ORDERING = ("created_at", "id")
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise Exception("Invalid cursor")
+
+
+def page_size(first):
+    if first is None:
+        return DEFAULT_PAGE_SIZE
+    if first < 0:
+        raise Exception("first cannot be negative")
+    if first > MAX_PAGE_SIZE:
+        raise Exception(f"first cannot be greater than {MAX_PAGE_SIZE}")
+    return first
+
+
+def after_cursor(queryset, after):
+    # rows strictly after the cursor in (created_at, id) order
+    if not after:
+        return queryset
+    created_at, pk = decode_cursor(after)
+    return queryset.filter(
+        Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    )
+
+
+def page_queryset(queryset, first, after=None):
+    # one extra row tells us whether there is a next page
+    return after_cursor(queryset, after).order_by(*ORDERING)[: first + 1]
+
+
+def paginate(connection_type, queryset, first=None, after=None):
+    first = page_size(first)
+    rows = list(page_queryset(queryset, first, after))
+    return build_connection(connection_type, rows, first, after)
+
+
+async def apaginate(connection_type, queryset, first=None, after=None):
+    # paginate() with the async ORM
+    first = page_size(first)
+    rows = [row async for row in page_queryset(queryset, first, after)]
+    return build_connection(connection_type, rows, first, after)
+
+
+def build_connection(connection_type, rows, first, after, cursor=encode_cursor):
+    has_next = len(rows) > first
+    rows = rows[:first]
+
+    edges = [
+        connection_type.Edge(node=row, cursor=cursor(row)) for row in rows
+    ]
+    page_info = graphene.relay.PageInfo(
+        has_next_page=has_next,
+        has_previous_page=bool(after),
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+    )
+    return connection_type(edges=edges, page_info=page_info)
+
+
+def connection_field(connection_type, **kwargs):
+    return graphene.Field(
+        connection_type,
+        first=graphene.Int(),
+        after=graphene.String(),
+        **kwargs,
+    )
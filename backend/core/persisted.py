@@ -0,0 +1,179 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from graphql import GraphQLError
+
+
+# ======================
+# PERSISTED QUERIES
+# ======================
+# Automatic Persisted Queries (the Apollo protocol): the client sends
+#   {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "..."}}, "variables": ...}
+# without the query text. If we know the hash we run the stored document,
+# otherwise we answer PersistedQueryNotFound and the client retries once
+# with the full query, which we store under its hash.
+#
+# Documents come from two places:
+#   - REGISTRY: a JSON file shipped with the frontend, either {hash: query} or
+#     an Apollo persisted query manifest ({"operations": [{"id", "body"}]})
+#   - documents registered at runtime, kept in a Django cache (CACHE alias)
+# With ALLOW_LIST on, only REGISTRY documents can run - anything else is
+# rejected before it is parsed.
+#
+# Parsing + validating a document is the expensive part, so the view keeps the
+# resulting AST per hash in an in-process LRU (DocumentCache) - plain
+# (non-persisted) queries are cached the same way under the hash of their text.
+
+DEFAULTS = {
+    "CACHE": "default",
+    "REGISTRY": None,
+    "ALLOW_LIST": False,
+    "DOCUMENT_CACHE_SIZE": 256,
+    "TTL": 60 * 60 * 24,
+}
+
+
+def get_setting(name):
+    return getattr(settings, "PERSISTED_QUERIES", {}).get(name, DEFAULTS[name])
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def persisted_query_error(message, code):
+    return GraphQLError(message, extensions={"code": code})
+
+
+def persisted_query_miss(errors):
+    # PersistedQueryNotFound is a step of the protocol, not a failed request:
+    # it's answered with 200 (a 400 would also fail the rest of a batch) and
+    # the client retries with the query
+    return bool(errors) and all(
+        (error.extensions or {}).get("code") == "PERSISTED_QUERY_NOT_FOUND" for error in errors
+    )
+
+
+class DocumentCache:
+    # hash -> parsed and validated DocumentNode
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.documents = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+            return document
+
+    def set(self, key, document):
+        max_size = self.max_size or get_setting("DOCUMENT_CACHE_SIZE")
+        with self.lock:
+            self.documents[key] = document
+            self.documents.move_to_end(key)
+            while len(self.documents) > max_size:
+                self.documents.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+
+
+class PersistedQueryStore:
+    def __init__(self):
+        self._registry = None
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            self._registry = load_registry(get_setting("REGISTRY"))
+        return self._registry
+
+    def reload(self):
+        self._registry = None
+
+    def lookup(self, key):
+        query = self.registry.get(key)
+        if query is None and not get_setting("ALLOW_LIST"):
+            query = caches[get_setting("CACHE")].get(self._cache_key(key))
+        return query
+
+    def register(self, key, query):
+        caches[get_setting("CACHE")].set(self._cache_key(key), query, get_setting("TTL"))
+
+    def resolve(self, request, data, query):
+        """
+        Returns (query, hash) for the request, raising a GraphQLError for
+        unknown hashes, hash mismatches and, in allow-list mode, documents
+        that aren't in the registry.
+        """
+        key = self.requested_hash(request, data)
+        persisted = key is not None
+
+        if not persisted:
+            if not query:
+                return query, None
+            key = query_hash(query)
+        elif query:
+            if query_hash(query) != key:
+                raise persisted_query_error(
+                    "provided sha does not match query", "PERSISTED_QUERY_HASH_MISMATCH"
+                )
+        else:
+            query = self.lookup(key)
+            if query is None:
+                raise persisted_query_error("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+            return query, key
+
+        if key not in self.registry:
+            if get_setting("ALLOW_LIST"):
+                raise persisted_query_error(
+                    "Query is not in the persisted query registry",
+                    "PERSISTED_QUERY_NOT_ALLOWED",
+                )
+            if persisted:
+                self.register(key, query)
+        return query, key
+
+    def requested_hash(self, request, data):
+        extensions = data.get("extensions") or request.GET.get("extensions")
+        if not extensions:
+            return None
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                return None
+        # it's client input: anything but {"persistedQuery": {"sha256Hash": "..."}}
+        # is a regular request
+        if not isinstance(extensions, dict):
+            return None
+        persisted = extensions.get("persistedQuery")
+        if not isinstance(persisted, dict):
+            return None
+        key = persisted.get("sha256Hash")
+        return key if isinstance(key, str) else None
+
+    def _cache_key(self, key):
+        return f"core:persisted-query:{key}"
+
+
+def load_registry(path):
+    if not path:
+        return {}
+    with open(path) as f:
+        manifest = json.load(f)
+    if "operations" in manifest:
+        # Apollo persisted query manifest
+        return {op["id"]: op["body"] for op in manifest["operations"]}
+    return manifest
+
+
+persisted_queries = PersistedQueryStore()
+document_cache = DocumentCache()
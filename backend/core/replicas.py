@@ -0,0 +1,172 @@
+import logging
+import math
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from graphql.pyutils import is_awaitable
+
+
+logger = logging.getLogger(__name__)
+
+
+# ======================
+# READ REPLICAS
+# ======================
+# GraphQL queries read from a replica, everything else uses the primary:
+#
+#   - the views (core/views.py) pick a replica for a request with
+#     read_database() and run query operations under reading_from(alias);
+#     ReplicaRouter (settings.DATABASE_ROUTERS) sends the reads made in there
+#     to it. Mutations, the admin, management commands, ... never set it and
+#     keep reading from the primary.
+#   - read-your-writes: a mutation pins its tenant (X-ORG) to the primary for
+#     PIN_SECONDS, in a shared cache so every process sees it - the status
+#     change is there on the next fetch even if the replica hasn't replayed it.
+#     The pin is set before the mutation runs (and again after it), so no
+#     request sees the commit without the pin, and it must last at least as
+#     long as a replica may lag (PIN_SECONDS >= MAX_LAG, checked at startup)
+#   - lag guard: a replica further than MAX_LAG seconds behind is skipped
+#     (checked at most every LAG_CHECK_INTERVAL seconds per process); with
+#     none left the primary serves the reads.
+
+DEFAULTS = {
+    "ALIASES": [],  # DATABASES aliases of the replicas
+    "PIN_SECONDS": 10,  # at least MAX_LAG
+    "MAX_LAG": 10,  # seconds
+    "LAG_CHECK_INTERVAL": 5,  # seconds
+    "CACHE": "default",  # alias in CACHES for the pins, shared between processes
+}
+
+PIN_PREFIX = "replicas:pin:"
+
+# seconds behind the primary, 0 when fully replayed (an idle primary doesn't
+# make the replay timestamp a lag) or when this isn't a standby at all
+POSTGRES_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def get_setting(name):
+    return getattr(settings, "READ_REPLICAS", {}).get(name, DEFAULTS[name])
+
+
+def check_settings():
+    # a pin shorter than the lag the router accepts lets a lagging replica
+    # serve the rows from before the write once it expires
+    if get_setting("ALIASES") and get_setting("PIN_SECONDS") < get_setting("MAX_LAG"):
+        raise ImproperlyConfigured(
+            f"READ_REPLICAS['PIN_SECONDS'] ({get_setting('PIN_SECONDS')}) must be at least "
+            f"READ_REPLICAS['MAX_LAG'] ({get_setting('MAX_LAG')})"
+        )
+
+
+# alias reads go to for the running operation, None = the primary
+current_database = ContextVar("read_database", default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return current_database.get()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a replica holds the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *get_setting("ALIASES")}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def reading_from(alias, execute):
+    """Runs execute() (which may return an awaitable) with the reads going to `alias`."""
+    token = current_database.set(alias)
+    try:
+        result = execute()
+    except BaseException:
+        current_database.reset(token)
+        raise
+
+    if is_awaitable(result):
+        async def finish():
+            try:
+                return await result
+            finally:
+                current_database.reset(token)
+
+        return finish()
+
+    current_database.reset(token)
+    return result
+
+
+def read_database(request):
+    """Replica for the queries of this request, None for the primary."""
+    aliases = get_setting("ALIASES")
+    if not aliases:
+        return None
+    slug = request.headers.get("X-ORG")
+    if slug and caches[get_setting("CACHE")].get(PIN_PREFIX + slug):
+        return None
+
+    max_lag = get_setting("MAX_LAG")
+    healthy = [alias for alias in aliases if lag_monitor.lag(alias) <= max_lag]
+    return random.choice(healthy) if healthy else None
+
+
+def pin(request):
+    # after a write: this tenant reads from the primary for a while
+    slug = request.headers.get("X-ORG")
+    if slug and get_setting("ALIASES"):
+        caches[get_setting("CACHE")].set(PIN_PREFIX + slug, 1, get_setting("PIN_SECONDS"))
+
+
+def measure_lag(alias):
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        logger.warning("Replica %s unreachable, reading from the primary", alias, exc_info=True)
+        return math.inf
+
+
+class LagMonitor:
+    """measure_lag() per replica, remembered for LAG_CHECK_INTERVAL seconds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # alias -> (checked at, seconds behind)
+        self.checked = {}
+
+    def lag(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.checked.get(alias)
+        if entry is not None and now - entry[0] < get_setting("LAG_CHECK_INTERVAL"):
+            return entry[1]
+
+        lag = measure_lag(alias)
+        if lag > get_setting("MAX_LAG"):
+            logger.warning("Replica %s is %.1fs behind, reading from the primary", alias, lag)
+        with self.lock:
+            self.checked[alias] = (now, lag)
+        return lag
+
+    def clear(self):
+        with self.lock:
+            self.checked.clear()
+
+
+lag_monitor = LagMonitor()
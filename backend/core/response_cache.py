@@ -0,0 +1,161 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import FieldNode, OperationType, get_operation_ast
+from graphql.utilities import value_from_ast_untyped
+
+from .shards import write_database
+
+
+# ======================
+# RESPONSE CACHE
+# ======================
+# Dashboards poll the same read queries over and over, while the data only
+# changes through our mutations. So the serialized response of a query is
+# cached (Django cache, RESPONSE_CACHE["CACHE"]) under
+#
+#   tenant slug + document hash + operation name + variables + version tokens
+#
+# and a hit is returned as is - no parsing, no ORM, no JSON encoding.
+#
+# Responses are never deleted one by one: every tenant and every project has a
+# version token (a random string in the same cache), and mutations drop the
+# tokens they touch once their transaction commits - the next read starts a
+# new one. Entries built with the old token just stop being looked up and
+# expire after TIMEOUT.
+#
+#   - project(id) / projectStats(id) depend on that project's token only,
+#     so editing one project doesn't throw away every other project's page
+#   - anything else (projects, organizationStats, ...) depends on the tenant's
+#
+# Mutations drop the tenant token and the tokens of the projects they wrote to.
+# Responses don't depend on the user, only on the X-ORG tenant.
+#
+# Responses read from a replica (core/replicas.py) are served but not stored:
+# the replica may not have replayed the write that dropped the token yet, and
+# its old rows would be cached under the new one.
+
+DEFAULTS = {
+    "ENABLED": True,
+    "CACHE": "default",
+    "TIMEOUT": 60 * 5,
+}
+
+# root fields whose response only depends on the project in their `id` argument
+PROJECT_FIELDS = {"project", "projectStats"}
+
+TENANT = "tenant"
+
+
+def get_setting(name):
+    return getattr(settings, "RESPONSE_CACHE", {}).get(name, DEFAULTS[name])
+
+
+def response_scopes(document, operation_name, variables):
+    """
+    The version tokens a response depends on: {"tenant"} or
+    {"project:<id>", ...}. None when the operation must not be cached.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+
+    scopes = set()
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, FieldNode):
+            # fragments on Query: not worth analyzing, depend on everything
+            return {TENANT}
+        name = selection.name.value
+        if name == "__typename":
+            continue
+        if name.startswith("__"):
+            # introspection, nothing to do with tenant data
+            return None
+        project_id = argument(selection, "id", variables)
+        if name not in PROJECT_FIELDS or project_id is None:
+            return {TENANT}
+        scopes.add(f"project:{project_id}")
+    return scopes
+
+
+def argument(node, name, variables):
+    for arg in node.arguments:
+        if arg.name.value == name:
+            return value_from_ast_untyped(arg.value, variables)
+    return None
+
+
+def etag(body):
+    return '"{}"'.format(hashlib.sha256(body.encode()).hexdigest()[:32])
+
+
+class ResponseCache:
+    def cache(self):
+        return caches[get_setting("CACHE")]
+
+    def lookup(self, slug, document_key, operation_name, variables, scopes):
+        """Returns (key, entry) - entry is {"body", "etag"} or None on a miss."""
+        cache = self.cache()
+        versions = cache.get_many([self._version_key(slug, scope) for scope in scopes])
+        for scope in scopes:
+            version_key = self._version_key(slug, scope)
+            if version_key not in versions:
+                # first request since the token was bumped or evicted
+                cache.add(version_key, uuid.uuid4().hex, None)
+                versions[version_key] = cache.get(version_key)
+
+        key = self._key(slug, document_key, operation_name, variables, versions)
+        return key, cache.get(key)
+
+    async def alookup(self, slug, document_key, operation_name, variables, scopes):
+        # lookup() for the async view
+        cache = self.cache()
+        versions = await cache.aget_many([self._version_key(slug, scope) for scope in scopes])
+        for scope in scopes:
+            version_key = self._version_key(slug, scope)
+            if version_key not in versions:
+                await cache.aadd(version_key, uuid.uuid4().hex, None)
+                versions[version_key] = await cache.aget(version_key)
+
+        key = self._key(slug, document_key, operation_name, variables, versions)
+        return key, await cache.aget(key)
+
+    def store(self, key, body):
+        entry = {"body": body, "etag": etag(body)}
+        self.cache().set(key, entry, get_setting("TIMEOUT"))
+        return entry
+
+    async def astore(self, key, body):
+        entry = {"body": body, "etag": etag(body)}
+        await self.cache().aset(key, entry, get_setting("TIMEOUT"))
+        return entry
+
+    def invalidate(self, slug, project_ids=()):
+        """
+        Drops the tenant's token and the given projects' tokens once the
+        current transaction commits (right away outside of one) - doing it
+        earlier would let a concurrent read cache the old rows under the
+        new token.
+        """
+        keys = [self._version_key(slug, TENANT)]
+        keys += [self._version_key(slug, f"project:{pk}") for pk in set(project_ids)]
+        # the tenant's transaction, on its shard (core/shards.py)
+        transaction.on_commit(lambda: self.cache().delete_many(keys), using=write_database())
+
+    def _version_key(self, slug, scope):
+        return f"core:response-version:{slug}:{scope}"
+
+    def _key(self, slug, document_key, operation_name, variables, versions):
+        raw = json.dumps(
+            [slug, document_key, operation_name, variables, sorted(versions.items())],
+            sort_keys=True,
+            default=str,
+        )
+        return "core:response:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+response_cache = ResponseCache()
@@ -1,6 +1,21 @@
+import copy
+from collections import Counter, defaultdict
+
 import graphene
+from django.db import transaction
+from django.utils import timezone
 from graphene_django import DjangoObjectType
 from .models import Project, Task, Organization, TaskComment
+from . import counters
+from .aio import fetch, get_or_none, is_async, related, sync_resolver, then
+from .broker import broker, comment_topic, task_topic
+from .filters import ListArguments
+from .loaders import get_loaders
+from .optimizer import optimize, optimize_connection, optimize_field
+from .pagination import apaginate, build_connection, connection_field, page_size, paginate
+from .response_cache import response_cache
+from .search import encode_search_cursor, search_rows
+from .shards import write_database
 
 
 # ======================
@@ -21,8 +36,11 @@ class OrganizationType(DjangoObjectType):
    # an org has many projects so we define projects as a TYPE- list of ProjectType, coz in resolver it's used so we define type
     projects = graphene.List(lambda: ProjectType)
 
+    # estimated rows per list field, used by the query cost limit (core/cost.py)
+    cost_hints = {"projects": {"multiplier": 50}}
+
     def resolve_projects(self, info):
-        return self.projects.all()
+        return get_loaders(info).projects_by_organization.load(self)
 
 
 class ProjectType(DjangoObjectType):
@@ -37,12 +55,35 @@ class ProjectType(DjangoObjectType):
             "organization",
             "created_at",
             "last_updated_at",
+            "todo_count",
+            "in_progress_count",
+            "done_count",
         )
    # a project has many tasks so we define tasks as a TYPE- list of TaskType, coz in resolver it's used so we define type
-    tasks = graphene.List(lambda: TaskType)
+    tasks = graphene.List(
+        lambda: TaskType,
+        filter=graphene.Argument(lambda: TaskFilter),
+        order_by=graphene.Argument(lambda: TaskOrder),
+    )
+    # paginated version of tasks, ordered by (created_at, id)
+    tasks_connection = connection_field(lambda: TaskConnection)
+
+    optimizer_hints = {"tasks_connection": ()}
+    cost_hints = {"tasks": {"multiplier": 50}}
 
-    def resolve_tasks(self, info):
-        return self.tasks.all()
+    def resolve_organization(self, info):
+        return related(self, "organization", info)
+
+    def resolve_tasks(self, info, filter=None, order_by=None):
+        arguments = ListArguments(Task, filter, order_by)
+        if arguments:
+            return get_loaders(info).tasks_by_project.load_filtered(self, arguments)
+        return get_loaders(info).tasks_by_project.load(self)
+
+    def resolve_tasks_connection(self, info, first=None, after=None):
+        first = page_size(first)
+        rows = get_loaders(info).tasks_by_project.load_page(self, first, after)
+        return then(rows, lambda rows: build_connection(TaskConnection, rows, first, after))
 
 
 class TaskType(DjangoObjectType):
@@ -58,12 +99,26 @@ class TaskType(DjangoObjectType):
             "project",
             "created_at",
             "last_updated_at",
+            "comment_count",
         )
     # a task has many comments so we define comments as a TYPE- list of TaskCommentType, coz in resolver it's used so we define type
     comments = graphene.List(lambda: TaskCommentType)
+    # paginated version of comments, ordered by (created_at, id)
+    comments_connection = connection_field(lambda: TaskCommentConnection)
+
+    optimizer_hints = {"comments_connection": ()}
+    cost_hints = {"comments": {"multiplier": 20}}
+
+    def resolve_project(self, info):
+        return related(self, "project", info)
 
     def resolve_comments(self, info):
-        return self.comments.all()
+        return get_loaders(info).comments_by_task.load(self)
+
+    def resolve_comments_connection(self, info, first=None, after=None):
+        first = page_size(first)
+        rows = get_loaders(info).comments_by_task.load_page(self, first, after)
+        return then(rows, lambda rows: build_connection(TaskCommentConnection, rows, first, after))
 
 
 class TaskCommentType(DjangoObjectType):
@@ -78,6 +133,133 @@ class TaskCommentType(DjangoObjectType):
             "last_updated_at",
         )
 
+    def resolve_task(self, info):
+        return related(self, "task", info)
+
+
+# ======================
+# CONNECTIONS
+# ======================
+# Relay-style connections (edges/node/cursor + pageInfo), see core/pagination.py
+
+class ProjectConnection(graphene.relay.Connection):
+    class Meta:
+        node = ProjectType
+
+
+class TaskConnection(graphene.relay.Connection):
+    class Meta:
+        node = TaskType
+
+
+class TaskCommentConnection(graphene.relay.Connection):
+    class Meta:
+        node = TaskCommentType
+
+
+# ======================
+# SEARCH
+# ======================
+# full-text search over tasks and comments, see core/search.py
+
+class SearchResult(graphene.Union):
+    class Meta:
+        types = (TaskType, TaskCommentType)
+
+    @classmethod
+    def resolve_type(cls, instance, info):
+        return TaskType if isinstance(instance, Task) else TaskCommentType
+
+
+class SearchConnection(graphene.relay.Connection):
+    class Meta:
+        node = SearchResult
+
+
+# ======================
+# FILTERS
+# ======================
+# filter/orderBy arguments of the `projects` and `tasks` lists, applied in SQL
+# (core/filters.py); the status enums are the ones generated for the model fields
+
+ProjectStatus = ProjectType._meta.fields["status"].type.of_type
+TaskStatus = TaskType._meta.fields["status"].type.of_type
+
+
+class ProjectFilter(graphene.InputObjectType):
+    status_in = graphene.List(graphene.NonNull(ProjectStatus))
+    due_before = graphene.Date()
+    due_after = graphene.Date()
+    # past due and not COMPLETED
+    overdue = graphene.Boolean()
+
+
+class ProjectOrder(graphene.Enum):
+    CREATED_AT = "CREATED_AT"
+    CREATED_AT_DESC = "CREATED_AT_DESC"
+    DUE_DATE = "DUE_DATE"
+    DUE_DATE_DESC = "DUE_DATE_DESC"
+    NAME = "NAME"
+
+
+class TaskFilter(graphene.InputObjectType):
+    status_in = graphene.List(graphene.NonNull(TaskStatus))
+    assignee_email = graphene.String()
+    due_before = graphene.DateTime()
+    due_after = graphene.DateTime()
+    # past due and not DONE
+    overdue = graphene.Boolean()
+
+
+class TaskOrder(graphene.Enum):
+    CREATED_AT = "CREATED_AT"
+    CREATED_AT_DESC = "CREATED_AT_DESC"
+    DUE_DATE = "DUE_DATE"
+    DUE_DATE_DESC = "DUE_DATE_DESC"
+    TITLE = "TITLE"
+
+
+# ======================
+# STATS
+# ======================
+# built from the denormalized counters (core/counters.py), never from task rows
+
+class ProjectStatsType(graphene.ObjectType):
+    project = graphene.Field(ProjectType)
+    todo = graphene.Int()
+    in_progress = graphene.Int()
+    done = graphene.Int()
+    overdue = graphene.Int()
+    total = graphene.Int()
+
+
+class OrganizationStatsType(graphene.ObjectType):
+    project_count = graphene.Int()
+    todo = graphene.Int()
+    in_progress = graphene.Int()
+    done = graphene.Int()
+    overdue = graphene.Int()
+    total = graphene.Int()
+    projects = graphene.List(ProjectStatsType)
+
+
+def project_stats(projects):
+    overdue = counters.overdue_counts([p.id for p in projects])
+    return [
+        ProjectStatsType(
+            project=p,
+            todo=p.todo_count,
+            in_progress=p.in_progress_count,
+            done=p.done_count,
+            overdue=overdue.get(p.id, 0),
+            total=p.todo_count + p.in_progress_count + p.done_count,
+        )
+        for p in projects
+    ]
+
+
+STATS_COLUMNS = ("id", "name", "status", "todo_count", "in_progress_count", "done_count")
+
 
 # ======================
 # QUERIES
@@ -85,39 +267,224 @@ class TaskCommentType(DjangoObjectType):
 
 class Query(graphene.ObjectType):
     # List projects (ORG-SCOPED)
-    projects = graphene.List(ProjectType)
+    projects = graphene.List(ProjectType, filter=ProjectFilter(), order_by=ProjectOrder())
+
+    # Page through projects (ORG-SCOPED)
+    projects_connection = connection_field(ProjectConnection)
 
     # Get single project (ORG-SCOPED)
     project = graphene.Field(ProjectType, id=graphene.ID(required=True))
 
-    def resolve_projects(self, info):
+    # Tasks and comments matching every word of `query`, best match first (ORG-SCOPED)
+    search = connection_field(SearchConnection, query=graphene.String(required=True))
+
+    # Task counts per status (ORG-SCOPED)
+    project_stats = graphene.Field(ProjectStatsType, id=graphene.ID(required=True))
+    organization_stats = graphene.Field(OrganizationStatsType)
+
+    def resolve_projects(self, info, filter=None, order_by=None):
         org = info.context.organization
         if not org:
             raise Exception("X-ORG header required")
 
-        return (
+        def queued(projects):
+            # anything not prefetched below is batched by the loaders
+            get_loaders(info).tasks_by_project.queue(projects)
+            return projects
+
+        # only the columns/relations the client selected are loaded
+        queryset = ListArguments(Project, filter, order_by).apply(
             Project.objects.filter(organization=org)
-            .prefetch_related("tasks")
         )
+        return then(fetch(optimize(queryset, info), info), queued)
+
+    def resolve_projects_connection(self, info, first=None, after=None):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        def queued(connection):
+            get_loaders(info).tasks_by_project.queue(edge.node for edge in connection.edges)
+            return connection
+
+        queryset = optimize_connection(Project.objects.filter(organization=org), info)
+        pages = apaginate if is_async(info) else paginate
+        return then(pages(ProjectConnection, queryset, first, after), queued)
 
     def resolve_project(self, info, id):
         org = info.context.organization
         if not org:
             raise Exception("X-ORG header required")
 
-        try:
-            return Project.objects.prefetch_related(
-                "tasks__comments"
-            ).get(id=id, organization=org)
-        except Project.DoesNotExist:
-            return None
+        return get_or_none(optimize(Project.objects, info), info, id=id, organization=org)
+
+    # full-text search and aggregates, run in a worker thread on the async view
+    @sync_resolver
+    def resolve_search(self, info, query, first=None, after=None):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        first = page_size(first)
+        rows = search_rows(org, query, first, after)
+        return build_connection(SearchConnection, rows, first, after, cursor=encode_search_cursor)
+
+    @sync_resolver
+    def resolve_project_stats(self, info, id):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        project = (
+            Project.objects.only(*STATS_COLUMNS).filter(id=id, organization=org).first()
+        )
+        return project_stats([project])[0] if project else None
+
+    @sync_resolver
+    def resolve_organization_stats(self, info):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        projects = project_stats(
+            list(Project.objects.only(*STATS_COLUMNS).filter(organization=org).order_by("id"))
+        )
+        return OrganizationStatsType(
+            project_count=len(projects),
+            todo=sum(p.todo for p in projects),
+            in_progress=sum(p.in_progress for p in projects),
+            done=sum(p.done for p in projects),
+            overdue=sum(p.overdue for p in projects),
+            total=sum(p.total for p in projects),
+            projects=projects,
+        )
 # Let other exceptions crash - they're bugs! 
-# prefetch_related avoids n+1 query problem by fetching related objects in a single query
+# optimize() builds only()/select_related/Prefetch from the selected fields, and
+# nested tasks/comments otherwise go through the per-request loaders
+# (core/loaders.py), which batch each level into one query -> no n+1 problem
+
+# ======================
+# SUBSCRIPTIONS
+# ======================
+# served over WebSocket (core/subscriptions.py), fed by the mutations through
+# the broker (core/broker.py) once their transaction commits
+
+class TaskChangedPayload(graphene.ObjectType):
+    kind = graphene.String()  # CREATED / UPDATED
+    task = graphene.Field(TaskType)
+
+
+async def events(info, topic):
+    async for message in broker.subscribe(topic):
+        # every event resolves like a new request: fresh loaders, no rows
+        # cached from the previous event
+        info.context.loaders = None
+        yield message
+
+
+class Subscription(graphene.ObjectType):
+    # tasks created/updated in a project (ORG-SCOPED)
+    task_changed = graphene.Field(TaskChangedPayload, project_id=graphene.ID(required=True))
+
+    # comments added to a task (ORG-SCOPED)
+    comment_added = graphene.Field(TaskCommentType, task_id=graphene.ID(required=True))
+
+    async def subscribe_task_changed(self, info, project_id):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        if not await Project.objects.filter(id=project_id, organization=org).aexists():
+            raise Exception("Project not found")
+        return events(info, task_topic(project_id))
+
+    async def subscribe_comment_added(self, info, task_id):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        if not await Task.objects.filter(id=task_id, project__organization=org).aexists():
+            raise Exception("Task not found")
+        return events(info, comment_topic(task_id))
+
+
+def publish_tasks(kind, tasks):
+    def publish():
+        for task in tasks:
+            topic = task_topic(task.project_id)
+            if not broker.has_subscribers(topic):
+                continue
+            # subscribers resolve the event from the message alone, so it
+            # carries the full row (UpdateTask only loaded the changed columns)
+            deferred = task.get_deferred_fields() - {"search_vector"}
+            if deferred:
+                task.refresh_from_db(fields=deferred)
+            broker.publish(topic, {"kind": kind, "task": copy.copy(task)})
+
+    transaction.on_commit(publish, using=write_database())
+
+
+# ======================
+# INPUTS
+# ======================
+
+class TaskInput(graphene.InputObjectType):
+    title = graphene.String(required=True)
+    description = graphene.String()
+    status = graphene.String(default_value="TODO")
+    assignee_email = graphene.String()
+    due_date = graphene.DateTime()
+
+
+class TaskPatchInput(graphene.InputObjectType):
+    # fields left out (or null) are not touched
+    title = graphene.String()
+    description = graphene.String()
+    status = graphene.String()
+    assignee_email = graphene.String()
+    due_date = graphene.DateTime()
+
 
 # ======================
 # MUTATIONS
 # ======================
 
+# max rows per createTasks / updateTasks call
+MAX_BATCH_SIZE = 1000
+
+TASK_STATUSES = {value for value, _ in Task.STATUS_CHOICES}
+
+
+def clean_task_fields(fields, prefix=""):
+    """
+    Validates/normalizes one task's fields in place, returns a list of
+    error messages (empty if the fields are fine).
+    """
+    errors = []
+    if fields.get("title") is not None:
+        fields["title"] = fields["title"].strip()
+        if not fields["title"]:
+            errors.append(f"{prefix}Task title cannot be empty")
+    if fields.get("status") is not None and fields["status"] not in TASK_STATUSES:
+        errors.append(f"{prefix}Invalid status {fields['status']}")
+    return errors
+
+
+def save_changes(obj, changes):
+    """
+    Sets `changes` on obj and writes only the columns whose value actually
+    changed (plus last_updated_at). Returns False, without writing anything,
+    when nothing changed.
+    """
+    changed = [field for field, value in changes.items() if getattr(obj, field) != value]
+    if not changed:
+        return False
+
+    for field in changed:
+        setattr(obj, field, changes[field])
+    obj.save(update_fields=[*changed, "last_updated_at"])
+    return True
+
 class CreateProject(graphene.Mutation):
     class Arguments:
         name = graphene.String(required=True)
@@ -140,6 +507,8 @@ class CreateProject(graphene.Mutation):
             name=name.strip(),
             **kwargs,
         )
+        # drop cached responses of this tenant (core/response_cache.py)
+        response_cache.invalidate(org.slug, [project.id])
 
         return CreateProject(project=project)
 
@@ -159,21 +528,24 @@ class UpdateProject(graphene.Mutation):
         if not org:
             raise Exception("X-ORG header required")
 
-        try:
-            project = Project.objects.get(id=id, organization=org)
-        except Project.DoesNotExist:
-            raise Exception("Project not found")
-
         if "name" in kwargs and kwargs["name"]:
             if not kwargs["name"].strip():
                 raise Exception("Project name cannot be empty")
             kwargs["name"] = kwargs["name"].strip()
 
-        for field, value in kwargs.items():
-            if value is not None:
-                setattr(project, field, value)
+        changes = {field: value for field, value in kwargs.items() if value is not None}
 
-        project.save()
+        # load only the columns we compare against + what the response asks for
+        try:
+            project = optimize_field(
+                Project.objects, info, "project", extra_only=changes
+            ).get(id=id, organization=org)
+        except Project.DoesNotExist:
+            raise Exception("Project not found")
+
+        # UPDATE only the changed columns, no write at all for a no-op
+        if save_changes(project, changes):
+            response_cache.invalidate(org.slug, [project.id])
         return UpdateProject(project=project)
 
 
@@ -193,6 +565,13 @@ class CreateTask(graphene.Mutation):
         if not org:
             raise Exception("X-ORG header required")
 
+        # the same checks as createTasks
+        fields = {field: value for field, value in kwargs.items() if value is not None}
+        fields["title"] = title
+        errors = clean_task_fields(fields)
+        if errors:
+            raise Exception("; ".join(errors))
+
         try:
             project = Project.objects.get(
                 id=project_id,
@@ -201,14 +580,14 @@ class CreateTask(graphene.Mutation):
         except Project.DoesNotExist:
             raise Exception("Project not found")
 
-        if not title.strip():
-            raise Exception("Task title cannot be empty")
-
-        task = Task.objects.create(
-            project=project,
-            title=title.strip(),
-            **kwargs,
-        )
+        with transaction.atomic(using=write_database()):
+            task = Task.objects.create(
+                project=project,
+                **fields,
+            )
+            counters.adjust_status_counts(project.id, {task.status: 1})
+            response_cache.invalidate(org.slug, [project.id])
+            publish_tasks("CREATED", [task])
 
         return CreateTask(task=task)
 
@@ -229,25 +608,135 @@ class UpdateTask(graphene.Mutation):
         if not org:
             raise Exception("X-ORG header required")
 
+        # the same checks as updateTasks
+        changes = {field: value for field, value in kwargs.items() if value is not None}
+        errors = clean_task_fields(changes)
+        if errors:
+            raise Exception("; ".join(errors))
+
+        with transaction.atomic(using=write_database()):
+            # load only the columns we compare against + what the response asks for;
+            # the row stays locked until commit, so a concurrent status change
+            # waits and counts from our new status, not from the same old one
+            try:
+                task = optimize_field(
+                    Task.objects.select_for_update(of=("self",)),
+                    info,
+                    "task",
+                    extra_only=[*changes, "project_id"],
+                ).get(
+                    id=id,
+                    project__organization=org,
+                )
+            except Task.DoesNotExist:
+                raise Exception("Task not found")
+
+            old_status = task.status if "status" in changes else None
+            # UPDATE only the changed columns, no write at all for a no-op
+            if save_changes(task, changes):
+                if old_status is not None:
+                    counters.status_changed(task.project_id, old_status, task.status)
+                response_cache.invalidate(org.slug, [task.project_id])
+                publish_tasks("UPDATED", [task])
+        return UpdateTask(task=task)
+
+
+class CreateTasks(graphene.Mutation):
+    class Arguments:
+        project_id = graphene.ID(required=True)
+        tasks = graphene.List(graphene.NonNull(TaskInput), required=True)
+
+    tasks = graphene.List(TaskType)
+
+    def mutate(self, info, project_id, tasks):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        if len(tasks) > MAX_BATCH_SIZE:
+            raise Exception(f"Cannot create more than {MAX_BATCH_SIZE} tasks at once")
+
+        # validate the whole batch before touching the database
+        rows, errors = [], []
+        for i, task_input in enumerate(tasks):
+            fields = {k: v for k, v in task_input.items() if v is not None}
+            errors += clean_task_fields(fields, prefix=f"tasks[{i}]: ")
+            rows.append(fields)
+        if errors:
+            raise Exception("; ".join(errors))
+
+        # one tenant check for the whole batch
         try:
-            task = Task.objects.select_related("project").get(
-                id=id,
-                project__organization=org,
+            project = Project.objects.get(id=project_id, organization=org)
+        except Project.DoesNotExist:
+            raise Exception("Project not found")
+
+        with transaction.atomic(using=write_database()):
+            created = Task.objects.bulk_create(
+                [Task(project=project, **fields) for fields in rows],
+                batch_size=500,
             )
-        except Task.DoesNotExist:
-            raise Exception("Task not found")
+            counters.adjust_status_counts(
+                project.id, Counter(task.status for task in created)
+            )
+            response_cache.invalidate(org.slug, [project.id])
+            publish_tasks("CREATED", created)
 
-        if "title" in kwargs and kwargs["title"]:
-            if not kwargs["title"].strip():
-                raise Exception("Task title cannot be empty")
-            kwargs["title"] = kwargs["title"].strip()
+        return CreateTasks(tasks=created)
 
-        for field, value in kwargs.items():
-            if value is not None:
-                setattr(task, field, value)
 
-        task.save()
-        return UpdateTask(task=task)
+class UpdateTasks(graphene.Mutation):
+    # applies the same patch to every task, e.g. move a sprint's tasks to DONE
+    class Arguments:
+        ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+        patch = TaskPatchInput(required=True)
+
+    tasks = graphene.List(TaskType)
+
+    def mutate(self, info, ids, patch):
+        org = info.context.organization
+        if not org:
+            raise Exception("X-ORG header required")
+
+        ids = set(ids)
+        if len(ids) > MAX_BATCH_SIZE:
+            raise Exception(f"Cannot update more than {MAX_BATCH_SIZE} tasks at once")
+
+        changes = {field: value for field, value in patch.items() if value is not None}
+        errors = clean_task_fields(changes)
+        if errors:
+            raise Exception("; ".join(errors))
+
+        with transaction.atomic(using=write_database()):
+            # one tenant check for the whole batch, rows stay locked until commit
+            tasks = list(
+                Task.objects.select_for_update(of=("self",))
+                .filter(id__in=ids, project__organization=org)
+                .order_by("id")
+            )
+            if len(tasks) != len(ids):
+                raise Exception("Task not found")
+
+            if changes:
+                if "status" in changes:
+                    # -1 for every old status, +1 for the new one, per project
+                    deltas = defaultdict(Counter)
+                    for task in tasks:
+                        deltas[task.project_id][task.status] -= 1
+                        deltas[task.project_id][changes["status"]] += 1
+                    for project_id, project_deltas in deltas.items():
+                        counters.adjust_status_counts(project_id, project_deltas)
+
+                # update() skips auto_now, so bump it ourselves
+                changes["last_updated_at"] = timezone.now()
+                Task.objects.filter(id__in=[task.id for task in tasks]).update(**changes)
+                for task in tasks:
+                    for field, value in changes.items():
+                        setattr(task, field, value)
+                response_cache.invalidate(org.slug, [task.project_id for task in tasks])
+                publish_tasks("UPDATED", tasks)
+
+        return UpdateTasks(tasks=tasks)
 
 
 class AddComment(graphene.Mutation):
@@ -277,11 +766,17 @@ class AddComment(graphene.Mutation):
         if "@" not in author_email:
             raise Exception("Valid email required")
 
-        comment = TaskComment.objects.create(
-            task=task,
-            content=content.strip(),
-            author_email=author_email.strip(),
-        )
+        with transaction.atomic(using=write_database()):
+            comment = TaskComment.objects.create(
+                task=task,
+                content=content.strip(),
+                author_email=author_email.strip(),
+            )
+            counters.comment_added(task.id)
+            response_cache.invalidate(org.slug, [task.project_id])
+            broker.publish_on_commit(
+                comment_topic(task.id), copy.copy(comment), using=write_database()
+            )
 
         return AddComment(comment=comment)
 
@@ -291,4 +786,6 @@ class Mutation(graphene.ObjectType):
     update_project = UpdateProject.Field()
     create_task = CreateTask.Field()
     update_task = UpdateTask.Field()
+    create_tasks = CreateTasks.Field()
+    update_tasks = UpdateTasks.Field()
     add_comment = AddComment.Field()
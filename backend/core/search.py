@@ -0,0 +1,132 @@
+import base64
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+from .models import Task, TaskComment
+
+
+# ======================
+# FULL-TEXT SEARCH
+# ======================
+# Task and TaskComment have a `search_vector` tsvector column with a GIN index,
+# maintained by Postgres triggers (migration 0004) - every write path, including
+# bulk_create() and update(), keeps it current.
+#
+# search_rows() matches every word of the query as a prefix ("desi rev" finds
+# "design review"), so it works for type-ahead, and ranks with ts_rank. Tasks
+# and comments are fetched with one indexed query each and merged by
+# (rank desc, kind, id), which is also what the cursor encodes.
+#
+# Other databases (SQLite in local tests) have no tsvector: they fall back to
+# icontains on the same columns with a rank of 0.
+
+SEARCH_CONFIG = "english"
+
+# how many words of a query are used
+MAX_TERMS = 8
+
+
+class Searchable:
+    model = None
+    # Union member name, also the tie-breaker between kinds in the ordering
+    kind = None
+    # lookup to the tenant
+    organization_field = None
+    # columns matched with icontains when there is no tsvector
+    fallback_fields = ()
+
+    def queryset(self, org, terms):
+        # the default manager defers search_vector (core/models.py)
+        queryset = self.model.objects.filter(**{self.organization_field: org})
+        if connection.vendor == "postgresql":
+            query = search_query(terms)
+            # ts_rank is a float4; as a double it round-trips exactly through
+            # the cursor (repr of a Python float) and compares equal to it
+            return queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+            )
+
+        for term in terms:
+            matches = Q()
+            for field in self.fallback_fields:
+                matches |= Q(**{f"{field}__icontains": term})
+            queryset = queryset.filter(matches)
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    def after(self, queryset, cursor):
+        # rows strictly after the cursor in (rank desc, kind, id) order
+        if cursor is None:
+            return queryset
+        rank, kind, pk = cursor
+        if self.kind < kind:
+            return queryset.filter(rank__lt=rank)
+        if self.kind > kind:
+            return queryset.filter(rank__lte=rank)
+        return queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+
+
+class TaskSearch(Searchable):
+    model = Task
+    kind = "TaskType"
+    organization_field = "project__organization"
+    fallback_fields = ("title", "description")
+
+
+class TaskCommentSearch(Searchable):
+    model = TaskComment
+    kind = "TaskCommentType"
+    organization_field = "task__project__organization"
+    fallback_fields = ("content",)
+
+
+SEARCHABLES = (TaskSearch(), TaskCommentSearch())
+
+
+def search_terms(text):
+    # words only - tsquery operators in user input would be a syntax error
+    return re.findall(r"\w+", text or "")[:MAX_TERMS]
+
+
+def search_query(terms):
+    # every term as a prefix: 'desi':* & 'rev':*
+    return SearchQuery(
+        " & ".join(f"{term}:*" for term in terms), config=SEARCH_CONFIG, search_type="raw"
+    )
+
+
+def encode_search_cursor(row):
+    raw = f"{row.rank!r}|{row.search_kind}|{row.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    try:
+        rank, kind, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(rank), kind, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise Exception("Invalid cursor")
+
+
+def search_rows(org, text, first, after=None):
+    """
+    Up to first + 1 tasks and comments of `org` matching `text`, best match
+    first (the extra row tells whether there is a next page).
+    """
+    terms = search_terms(text)
+    if not terms:
+        return []
+    cursor = decode_search_cursor(after) if after else None
+
+    rows = []
+    for searchable in SEARCHABLES:
+        queryset = searchable.after(searchable.queryset(org, terms), cursor)
+        for row in queryset.order_by("-rank", "id")[: first + 1]:
+            row.search_kind = searchable.kind
+            rows.append(row)
+
+    rows.sort(key=lambda row: (-row.rank, row.search_kind, row.pk))
+    return rows[: first + 1]
@@ -0,0 +1,293 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils import timezone
+
+from .counters import rebuild_counters
+from .importer import keep_timestamps
+from .models import Organization, Project, Task, TaskComment
+from .tenants import get_setting as get_tenant_setting
+from .tenants import organization_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+# ======================
+# TENANT SHARDS
+# ======================
+# Organization.shard is the DATABASES alias holding a tenant's projects,
+# tasks and comments (plus a copy of its Organization row, for the foreign
+# keys). The Organization rows on `default` are the directory: tenant lookups
+# (core/tenants.py) always read them there and cache them, shard included.
+#
+#   - OrganizationMiddleware puts the request's X-ORG in `current_tenant`
+#     (the WebSocket connection does the same for subscriptions)
+#   - ShardRouter (first in settings.DATABASE_ROUTERS) sends every `core`
+#     model query made meanwhile to that tenant's shard. Tenants on `default`
+#     fall through to the next router (read replicas, core/replicas.py).
+#   - transactions and on_commit hooks around a tenant's writes must be on
+#     the same alias: write_database()
+#
+# Ids are exposed by the API and must not change when a tenant moves, so the
+# shards need disjoint id ranges (see `manage.py move_tenant`).
+#
+# `manage.py move_tenant` moves a tenant online: TenantMove copies the rows,
+# catches up with what changed since (last_updated_at) until the delta is
+# small, then freezes the tenant's mutations, copies the rest, switches the
+# directory and keeps the freeze until every process has forgotten the old
+# shard (the tenant cache TTL). Reads keep working throughout.
+
+DEFAULTS = {
+    "ALIASES": [],  # DATABASES aliases tenants can live on besides default
+    "CACHE": "default",  # alias in CACHES for the move freezes, shared between processes
+}
+
+FREEZE_PREFIX = "shards:frozen:"
+
+# in dependency order, parents first
+MODELS = (Organization, Project, Task, TaskComment)
+
+# how each model's rows are tied to the organization
+TENANT_FILTERS = {
+    Organization: "pk",
+    Project: "organization_id",
+    Task: "project__organization_id",
+    TaskComment: "task__project__organization_id",
+}
+
+# a write committed after a catch-up pass started may carry an older
+# last_updated_at; passes look back this far (re-copying is harmless)
+CATCH_UP_MARGIN = timedelta(seconds=30)
+
+
+def get_setting(name):
+    return getattr(settings, "TENANT_SHARDS", {}).get(name, DEFAULTS[name])
+
+
+# X-ORG slug of the running request / subscription
+current_tenant = ContextVar("tenant", default=None)
+
+
+def shard_for(slug):
+    """The tenant's shard alias, None for default (or unknown tenants)."""
+    if not slug:
+        return None
+    org = organization_cache.get(slug)
+    if org is None or org.shard == DEFAULT_DB_ALIAS:
+        return None
+    return org.shard
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "core":
+            return shard_for(current_tenant.get())
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a tenant's rows only ever point at rows of the same shard, where
+        # the directory's Organization has a copy with the same pk
+        if obj1._meta.app_label == "core" and obj2._meta.app_label == "core":
+            return (
+                obj1._state.db == obj2._state.db
+                or isinstance(obj1, Organization)
+                or isinstance(obj2, Organization)
+            )
+        return None
+
+
+def write_database():
+    """The alias the current tenant's writes go to, for transaction.atomic(using=...)."""
+    return router.db_for_write(Task)
+
+
+@contextmanager
+def tenant_context(slug):
+    # the router picks `slug`'s shard for the block
+    token = current_tenant.set(slug)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+def database_for(org):
+    # for code running outside the request (e.g. a streamed response)
+    return org.shard or DEFAULT_DB_ALIAS
+
+
+# ======================
+# FREEZE
+# ======================
+
+def frozen(slug):
+    # mutations are refused while a move cuts over
+    return bool(slug) and bool(caches[get_setting("CACHE")].get(FREEZE_PREFIX + slug))
+
+
+def freeze(slug, seconds):
+    caches[get_setting("CACHE")].set(FREEZE_PREFIX + slug, 1, seconds)
+
+
+def unfreeze(slug):
+    caches[get_setting("CACHE")].delete(FREEZE_PREFIX + slug)
+
+
+# ======================
+# MOVE
+# ======================
+
+def tenant_rows(model, org, alias):
+    return model.objects.using(alias).filter(**{TENANT_FILTERS[model]: org.pk})
+
+
+def copied_fields(model):
+    # the search vectors are the triggers' business (migration 0004)
+    return [f for f in model._meta.concrete_fields if f.get_internal_type() != "SearchVectorField"]
+
+
+class TenantMove:
+    def __init__(self, org, target, batch_size=2000, log=logger.info):
+        self.org = org
+        self.source = database_for(org)
+        self.target = target
+        self.batch_size = batch_size
+        self.log = log
+
+    def check(self):
+        """Reasons the move can't happen (empty = go)."""
+        problems = []
+        if self.target == self.source:
+            problems.append(f"{self.org.slug} is already on {self.target}")
+        if self.target not in {DEFAULT_DB_ALIAS, *get_setting("ALIASES")}:
+            problems.append(f"{self.target} is not in TENANT_SHARDS['ALIASES']")
+            return problems
+
+        # rows keep their ids; the target must not use them for something else
+        if Organization.objects.using(self.target).filter(pk=self.org.pk).exclude(slug=self.org.slug).exists():
+            problems.append(f"Organization id {self.org.pk} is taken on {self.target}")
+            return problems
+        for model in MODELS:
+            ids = tenant_rows(model, self.org, self.source).values_list("pk", flat=True)
+            taken = model.objects.using(self.target).exclude(**{TENANT_FILTERS[model]: self.org.pk})
+            for batch in batched(ids.order_by("pk").iterator(chunk_size=self.batch_size), self.batch_size):
+                if taken.filter(pk__in=batch).exists():
+                    problems.append(
+                        f"{model._meta.label} ids of {self.org.slug} are taken on {self.target}, "
+                        "the shards need disjoint id ranges"
+                    )
+                    break
+        return problems
+
+    def copy(self, since=None):
+        """Upserts the rows changed since `since` (all of them if None), returns how many."""
+        copied = 0
+        for model in MODELS:
+            fields = copied_fields(model)
+            rows = tenant_rows(model, self.org, self.source).order_by("pk")
+            if since is not None:
+                rows = rows.filter(last_updated_at__gte=since)
+            objs = (
+                model(**row)
+                for row in rows.values(*[f.attname for f in fields]).iterator(chunk_size=self.batch_size)
+            )
+            for batch in batched(objs, self.batch_size):
+                copied += self.write(model, fields, batch)
+        return copied
+
+    def write(self, model, fields, objs):
+        with keep_timestamps(model):
+            model.objects.using(self.target).bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=[f.name for f in fields if not f.primary_key],
+            )
+        return len(objs)
+
+    def delete_missing(self):
+        """Deletes target rows that were deleted on the source, returns how many."""
+        deleted = 0
+        for model in reversed(MODELS):
+            source_ids = set(tenant_rows(model, self.org, self.source).values_list("pk", flat=True))
+            gone = [
+                pk
+                for pk in tenant_rows(model, self.org, self.target).values_list("pk", flat=True)
+                if pk not in source_ids
+            ]
+            for batch in batched(gone, self.batch_size):
+                deleted += model.objects.using(self.target).filter(pk__in=batch).delete()[0]
+        return deleted
+
+    def sync(self, since):
+        # one catch-up pass
+        return self.copy(since) + self.delete_missing()
+
+    def run(self, max_passes=10, threshold=100, drain=2.0, freeze_seconds=None):
+        """copy, catch up, cut over. Returns the number of rows copied in the end."""
+        slug = self.org.slug
+        if freeze_seconds is None:
+            # until no process still has the old shard cached
+            freeze_seconds = get_tenant_setting("TTL")
+
+        started = timezone.now()
+        copied = self.copy()
+        self.log(f"Copied {copied} rows of {slug} to {self.target}")
+
+        since = started - CATCH_UP_MARGIN
+        for number in range(1, max_passes + 1):
+            started = timezone.now()
+            changed = self.sync(since)
+            since = started - CATCH_UP_MARGIN
+            self.log(f"Catch-up pass {number}: {changed} rows")
+            if changed <= threshold:
+                break
+
+        # cut over: no more writes, let in-flight mutations finish, last pass
+        freeze(slug, freeze_seconds + drain + 60)
+        try:
+            time.sleep(drain)
+            changed = self.sync(since)
+            self.log(f"Final pass: {changed} rows")
+
+            Organization.objects.using(DEFAULT_DB_ALIAS).filter(pk=self.org.pk).update(shard=self.target)
+            if self.target != DEFAULT_DB_ALIAS:
+                Organization.objects.using(self.target).filter(pk=self.org.pk).update(shard=self.target)
+            organization_cache.invalidate(slug)
+            # counters are kept with update(), which doesn't touch last_updated_at
+            with tenant_context(slug):
+                rebuild_counters(Project.objects.filter(organization_id=self.org.pk))
+            self.log(f"{slug} now reads and writes {self.target}, mutations resume in {freeze_seconds}s")
+            time.sleep(freeze_seconds)
+        finally:
+            unfreeze(slug)
+        return copied + changed
+
+    def delete_source(self):
+        """Drops the tenant's rows from the old shard (the directory row stays on default)."""
+        deleted = 0
+        for model in reversed(MODELS):
+            if model is Organization and self.source == DEFAULT_DB_ALIAS:
+                continue
+            deleted += tenant_rows(model, self.org, self.source).delete()[0]
+        return deleted
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
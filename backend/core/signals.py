@@ -0,0 +1,32 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .instrumentation import instrument_connection
+from .models import Organization
+from .tenants import organization_cache
+
+
+@receiver(pre_save, sender=Organization)
+def forget_old_slug(sender, instance, **kwargs):
+    # the slug may be changing, drop whatever the old one was cached as
+    if instance.pk:
+        old_slug = (
+            Organization.objects.filter(pk=instance.pk)
+            .values_list("slug", flat=True)
+            .first()
+        )
+        if old_slug:
+            organization_cache.invalidate(old_slug)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def forget_organization(sender, instance, **kwargs):
+    organization_cache.invalidate(instance.slug)
+
+
+@receiver(connection_created)
+def instrument_sql(sender, connection, **kwargs):
+    # per-request SQL tracing (core/instrumentation.py)
+    instrument_connection(connection)
@@ -0,0 +1,296 @@
+import asyncio
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from graphene_django.settings import graphene_settings
+from graphql import (
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    create_source_event_stream,
+    execute,
+    get_operation_ast,
+    parse,
+    validate,
+)
+from graphql.pyutils import is_awaitable
+
+from .broker import get_setting
+from .cost import check_cost
+from .persisted import document_cache, query_hash
+from .shards import current_tenant
+from .tenants import organization_cache
+
+
+# ======================
+# SUBSCRIPTION SERVER
+# ======================
+# GraphQL subscriptions over WebSocket, speaking the graphql-transport-ws
+# protocol (what the `graphql-ws` client library uses):
+#
+#   client: connection_init {"payload": {"X-ORG": "org-one"}}
+#   server: connection_ack
+#   client: subscribe {"id": "1", "payload": {"query": "subscription { ... }"}}
+#   server: next {"id": "1", "payload": {"data": ...}}   (once per event)
+#   client: complete {"id": "1"}
+#
+# Browsers can't set headers on a WebSocket, so the tenant comes from the
+# connection_init payload (X-ORG), falling back to an X-ORG handshake header.
+# It's a plain ASGI app next to Django's, see config/asgi.py.
+
+PROTOCOL = "graphql-transport-ws"
+
+# close codes from the protocol
+INVALID_MESSAGE = 4400
+UNAUTHORIZED = 4401
+INIT_TIMEOUT = 4408
+DUPLICATE_SUBSCRIBER = 4409
+TOO_MANY_INITS = 4429
+
+
+class SubscriptionContext:
+    # what resolvers read from info.context (the HttpRequest on the HTTP views)
+    graphql_async = True
+
+    def __init__(self, headers, organization):
+        self.headers = headers
+        self.organization = organization
+        self.loaders = None
+
+
+class GraphQLWebSocket:
+    """One WebSocket connection."""
+
+    def __init__(self, scope, receive, send, schema):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.schema = schema
+        self.headers = {
+            key.decode("latin-1").lower(): value.decode("latin-1")
+            for key, value in scope.get("headers", [])
+        }
+        self.initialized = False
+        self.organization = None
+        self.slug = None
+        # subscription id -> task streaming its events
+        self.operations = {}
+
+    async def run(self):
+        message = await self.receive()
+        if message["type"] != "websocket.connect":
+            return
+        if PROTOCOL not in self.scope.get("subprotocols", []):
+            await self.send({"type": "websocket.close", "code": 4406})
+            return
+        await self.send({"type": "websocket.accept", "subprotocol": PROTOCOL})
+
+        init_timeout = asyncio.get_running_loop().call_later(
+            get_setting("CONNECTION_INIT_TIMEOUT"), self.init_timed_out
+        )
+        self.closing = asyncio.Event()
+        try:
+            while not self.closing.is_set():
+                receive = asyncio.ensure_future(self.receive())
+                closing = asyncio.ensure_future(self.closing.wait())
+                done, _ = await asyncio.wait(
+                    {receive, closing}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if receive not in done:
+                    receive.cancel()
+                    break
+                closing.cancel()
+
+                message = receive.result()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message["type"] == "websocket.receive":
+                    await self.handle(message.get("text") or message.get("bytes") or "")
+        finally:
+            init_timeout.cancel()
+            for task in list(self.operations.values()):
+                task.cancel()
+            if self.operations:
+                await asyncio.gather(*self.operations.values(), return_exceptions=True)
+
+    def init_timed_out(self):
+        if not self.initialized:
+            asyncio.ensure_future(self.close(INIT_TIMEOUT, "Connection initialisation timeout"))
+
+    async def close(self, code, reason):
+        if not self.closing.is_set():
+            self.closing.set()
+            await self.send({"type": "websocket.close", "code": code, "reason": reason})
+
+    async def send_json(self, message):
+        if not self.closing.is_set():
+            await self.send({"type": "websocket.send", "text": json.dumps(message, cls=DjangoJSONEncoder)})
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (ValueError, TypeError, KeyError):
+            await self.close(INVALID_MESSAGE, "Invalid message")
+            return
+
+        if kind == "connection_init":
+            if self.initialized:
+                await self.close(TOO_MANY_INITS, "Too many initialisation requests")
+                return
+            payload = message.get("payload") or {}
+            self.slug = payload.get("X-ORG") or self.headers.get("x-org")
+            if self.slug:
+                self.organization = await organization_cache.aget(self.slug)
+                # the tenant's shard (core/shards.py), inherited by the subscription tasks
+                current_tenant.set(self.slug)
+            self.initialized = True
+            await self.send_json({"type": "connection_ack"})
+
+        elif kind == "ping":
+            await self.send_json({"type": "pong"})
+
+        elif kind == "pong":
+            pass
+
+        elif kind == "subscribe":
+            if not self.initialized:
+                await self.close(UNAUTHORIZED, "Unauthorized")
+                return
+            id = message.get("id")
+            if not isinstance(id, str) or not isinstance(message.get("payload"), dict):
+                await self.close(INVALID_MESSAGE, "Invalid message")
+                return
+            if id in self.operations:
+                await self.close(DUPLICATE_SUBSCRIBER, f"Subscriber for {id} already exists")
+                return
+            self.operations[id] = asyncio.ensure_future(self.stream(id, message["payload"]))
+
+        elif kind == "complete":
+            task = self.operations.get(message.get("id"))
+            if task is not None:
+                task.cancel()
+
+        else:
+            await self.close(INVALID_MESSAGE, f"Unknown message type {kind}")
+
+    async def stream(self, id, payload):
+        source = None
+        try:
+            started = await self.start(payload)
+            if isinstance(started, ExecutionResult):
+                await self.send_json(
+                    {"id": id, "type": "error", "payload": [e.formatted for e in started.errors]}
+                )
+                return
+
+            source, execute_event = started
+            async for message in source:
+                # same as graphql-core's subscribe(), but subscriptions with the
+                # same document/variables/tenant share one execution per event
+                rendered = await rendered_events.get(message, execute_event)
+                text = f'{{"id": {json.dumps(id)}, "type": "next", "payload": {rendered}}}'
+                if not self.closing.is_set():
+                    await self.send({"type": "websocket.send", "text": text})
+            await self.send_json({"id": id, "type": "complete"})
+        finally:
+            if source is not None:
+                # stops the broker subscription
+                await source.aclose()
+            self.operations.pop(id, None)
+
+    async def start(self, payload):
+        """
+        Parses/validates the document (cached like on the HTTP view), checks
+        its cost and subscribes. Returns (event source, execute_event) or an
+        ExecutionResult with the errors.
+        """
+        query = payload.get("query") or ""
+        variables = payload.get("variables") or {}
+        operation_name = payload.get("operationName")
+        graphql_schema = self.schema.graphql_schema
+
+        key = query_hash(query)
+        document = document_cache.get(key)
+        try:
+            if document is None:
+                document = parse(query)
+                errors = validate(
+                    graphql_schema, document, max_errors=graphene_settings.MAX_VALIDATION_ERRORS
+                )
+                if errors:
+                    return ExecutionResult(errors=errors)
+                document_cache.set(key, document)
+
+            operation = get_operation_ast(document, operation_name)
+            if operation is None or operation.operation != OperationType.SUBSCRIPTION:
+                raise GraphQLError("Only subscription operations are supported over WebSocket")
+
+            check_cost(graphql_schema, document, variables, operation_name, self.slug)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        context = SubscriptionContext(self.headers, self.organization)
+        source = await create_source_event_stream(
+            graphql_schema,
+            document,
+            context_value=context,
+            variable_values=variables,
+            operation_name=operation_name,
+        )
+        if isinstance(source, ExecutionResult):
+            return source
+
+        async def execute_event(message):
+            result = execute(
+                graphql_schema,
+                document,
+                message,
+                context_value=context,
+                variable_values=variables,
+                operation_name=operation_name,
+            )
+            if is_awaitable(result):
+                result = await result
+            return json.dumps(result.formatted, cls=DjangoJSONEncoder)
+
+        execute_event.key = json.dumps(
+            [key, operation_name, variables, self.slug], sort_keys=True, default=str
+        )
+        return source, execute_event
+
+
+class RenderedEvents:
+    """
+    Event -> serialized `next` payload, per (document, operation, variables,
+    tenant). A few thousand sockets watching the same project with the same
+    query execute every event once instead of once each.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        # (id(message), execute_event.key) -> (message, task)
+        self.entries = OrderedDict()
+
+    def get(self, message, execute_event):
+        key = (id(message), execute_event.key)
+        entry = self.entries.get(key)
+        # the entry keeps the message alive, so its id can't be reused meanwhile
+        if entry is None or entry[0] is not message:
+            entry = (message, asyncio.ensure_future(execute_event(message)))
+            self.entries[key] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return asyncio.shield(entry[1])
+
+
+rendered_events = RenderedEvents()
+
+
+async def websocket_application(scope, receive, send):
+    if scope["path"] != get_setting("PATH"):
+        await receive()
+        await send({"type": "websocket.close", "code": 4404})
+        return
+    await GraphQLWebSocket(scope, receive, send, graphene_settings.SCHEMA).run()
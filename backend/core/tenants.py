@@ -0,0 +1,146 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Organization
+
+
+# ======================
+# TENANT CACHE
+# ======================
+# X-ORG slug -> Organization, so the middleware doesn't hit the database on
+# every request. Two tiers:
+#   1. an in-process LRU with a TTL (no I/O at all for hot tenants)
+#   2. optionally a shared Django cache (e.g. Redis), so a cold process can
+#      skip the DB too - set ORGANIZATION_CACHE["SHARED_CACHE"] to the alias
+# Organization save/delete signals drop the entry from both tiers (see
+# core/signals.py). Other processes' in-process copies expire after TTL.
+# Lookups always go to the primary: a lagging read replica (core/replicas.py)
+# would get a brand new tenant cached as MISSING for a whole TTL.
+
+DEFAULTS = {
+    "MAX_SIZE": 1024,
+    "TTL": 60,
+    "SHARED_CACHE": None,
+}
+
+# stored for slugs that don't exist, so bogus X-ORG headers are cached too
+MISSING = "missing"
+
+
+def get_setting(name):
+    return getattr(settings, "ORGANIZATION_CACHE", {}).get(name, DEFAULTS[name])
+
+
+class OrganizationCache:
+    def __init__(self, max_size=None, ttl=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        # slug -> (expires_at, Organization or MISSING)
+        self.entries = OrderedDict()
+
+    def get(self, slug):
+        org = self._get_local(slug)
+        if org is None:
+            org = self._get_shared(slug)
+            if org is None:
+                org = Organization.objects.using(DEFAULT_DB_ALIAS).filter(slug=slug).first() or MISSING
+                self._set_shared(slug, org)
+            self._set_local(slug, org)
+        return self._result(org)
+
+    async def aget(self, slug):
+        # get() for async code: shared cache and database go through their async APIs
+        org = self._get_local(slug)
+        if org is None:
+            org = await self._aget_shared(slug)
+            if org is None:
+                org = await Organization.objects.using(DEFAULT_DB_ALIAS).filter(slug=slug).afirst() or MISSING
+                await self._aset_shared(slug, org)
+            self._set_local(slug, org)
+        return self._result(org)
+
+    def _result(self, org):
+        if org == MISSING:
+            return None
+        # every request gets its own instance, nothing leaks between requests
+        return copy.copy(org)
+
+    def invalidate(self, slug):
+        with self.lock:
+            self.entries.pop(slug, None)
+        shared = self._shared()
+        if shared is not None:
+            shared.delete(self._shared_key(slug))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _ttl(self):
+        return self.ttl if self.ttl is not None else get_setting("TTL")
+
+    def _max_size(self):
+        return self.max_size if self.max_size is not None else get_setting("MAX_SIZE")
+
+    # -- in-process tier --
+
+    def _get_local(self, slug):
+        with self.lock:
+            entry = self.entries.get(slug)
+            if entry is None:
+                return None
+            expires_at, org = entry
+            if expires_at <= self.clock():
+                del self.entries[slug]
+                return None
+            self.entries.move_to_end(slug)
+            return org
+
+    def _set_local(self, slug, org):
+        with self.lock:
+            self.entries[slug] = (self.clock() + self._ttl(), org)
+            self.entries.move_to_end(slug)
+            while len(self.entries) > self._max_size():
+                self.entries.popitem(last=False)
+
+    # -- shared tier --
+
+    def _shared(self):
+        alias = get_setting("SHARED_CACHE")
+        return caches[alias] if alias else None
+
+    def _shared_key(self, slug):
+        return f"core:organization:{slug}"
+
+    def _get_shared(self, slug):
+        shared = self._shared()
+        if shared is None:
+            return None
+        return shared.get(self._shared_key(slug))
+
+    def _set_shared(self, slug, org):
+        shared = self._shared()
+        if shared is not None:
+            shared.set(self._shared_key(slug), org, self._ttl())
+
+    async def _aget_shared(self, slug):
+        shared = self._shared()
+        if shared is None:
+            return None
+        return await shared.aget(self._shared_key(slug))
+
+    async def _aset_shared(self, slug, org):
+        shared = self._shared()
+        if shared is not None:
+            await shared.aset(self._shared_key(slug), org, self._ttl())
+
+
+organization_cache = OrganizationCache()
@@ -1,3 +1,2202 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from collections import Counter
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from .benchmark import Dataset, connection_mode, parse_mix, pooling_unavailable, script
+from .batching import groups
+from .broker import broker, comment_topic, task_topic
+from .counters import rebuild_counters
+from .encoding import brotli, encode
+from .export import export_chunks
+from .filters import ListArguments
+from .importer import BulkCreateWriter, InvalidImport, TenantImporter, copy_value, read_records
+from .instrumentation import metrics
+from .loaders import CommentsByTaskLoader, Loaders
+from .models import Organization, Project, Task, TaskComment
+from .pagination import encode_cursor
+from .persisted import document_cache, persisted_queries, query_hash
+from .replicas import PIN_PREFIX, check_settings, lag_monitor
+from .schema import save_changes
+from .shards import TenantMove, freeze
+from .subscriptions import PROTOCOL, websocket_application
+from .tenants import OrganizationCache, organization_cache
+from .views import AsyncGraphQLView
+
+
+# responses are cached per request in ResponseCacheTests only, elsewhere
+# data is changed behind the mutations' back
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class GraphQLTestCase(TestCase):
+    org_slug = "org-one"
+
+    def setUp(self):
+        organization_cache.clear()
+        self.org = Organization.objects.create(
+            name="Org One", slug=self.org_slug, contact_email="admin@org-one.test"
+        )
+        # warm the tenant cache so query counts only cover the resolvers
+        organization_cache.get(self.org_slug)
+
+    def make_tree(self, projects, tasks, comments=1, org=None):
+        org = org or self.org
+        for p in range(projects):
+            project = Project.objects.create(organization=org, name=f"Project {p}")
+            for t in range(tasks):
+                task = Task.objects.create(project=project, title=f"Task {p}.{t}")
+                for c in range(comments):
+                    TaskComment.objects.create(
+                        task=task, content=f"Comment {c}", author_email="dev@org-one.test"
+                    )
+
+    def graphql(self, query, variables=None, slug=None):
+        response = self.client.post(
+            "/graphql/",
+            json.dumps({"query": query, "variables": variables or {}}),
+            content_type="application/json",
+            HTTP_X_ORG=slug or self.org_slug,
+        )
+        return response.json()
+
+    def count_queries(self, query, variables=None):
+        with CaptureQueriesContext(connection) as ctx:
+            result = self.graphql(query, variables)
+        self.assertNotIn("errors", result)
+        self.captured = ctx.captured_queries
+        return len(ctx.captured_queries), result
+
+
+class DataLoaderTests(GraphQLTestCase):
+    PROJECTS_TREE = """
+        query {
+          projects { id tasks { id comments { id content } } }
+        }
+    """
+
+    def test_projects_tree_query_count_is_flat(self):
+        self.make_tree(projects=2, tasks=2)
+        small, _ = self.count_queries(self.PROJECTS_TREE)
+
+        self.make_tree(projects=6, tasks=5, comments=3)
+        large, result = self.count_queries(self.PROJECTS_TREE)
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(result["data"]["projects"]), 8)
+
+    def test_project_detail_query_count_is_flat(self):
+        query = """
+            query ($id: ID!) {
+              project(id: $id) { id tasks { id comments { id } project { id } } }
+            }
+        """
+        self.make_tree(projects=1, tasks=1)
+        small_id = Project.objects.get().id
+        small, _ = self.count_queries(query, {"id": small_id})
+
+        self.make_tree(projects=1, tasks=10, comments=4)
+        large_id = Project.objects.latest("id").id
+        large, result = self.count_queries(query, {"id": large_id})
+
+        self.assertEqual(small, large)
+        tasks = result["data"]["project"]["tasks"]
+        self.assertEqual(len(tasks), 10)
+        self.assertTrue(all(len(t["comments"]) == 4 for t in tasks))
+
+    def test_loaders_keep_tenant_scope(self):
+        other = Organization.objects.create(
+            name="Org Two", slug="org-two", contact_email="admin@org-two.test"
+        )
+        self.make_tree(projects=1, tasks=2)
+        self.make_tree(projects=1, tasks=3, org=other)
+
+        result = self.graphql(self.PROJECTS_TREE)
+        projects = result["data"]["projects"]
+        self.assertEqual(len(projects), 1)
+        self.assertEqual(len(projects[0]["tasks"]), 2)
+
+
+class QueryOptimizerTests(GraphQLTestCase):
+    def test_dashboard_list_prunes_columns_and_relations(self):
+        self.make_tree(projects=3, tasks=2)
+
+        _, result = self.count_queries("query { projects { id name status } }")
+
+        self.assertEqual(len(result["data"]["projects"]), 3)
+        sql = [q["sql"] for q in self.captured if "core_project" in q["sql"]]
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn("description", sql[0])
+        self.assertFalse(any("core_task" in q["sql"] for q in self.captured))
+
+    def test_nested_selection_is_prefetched_with_pruned_columns(self):
+        self.make_tree(projects=2, tasks=3, comments=2)
+        query = """
+            query ($id: ID!) {
+              project(id: $id) {
+                name
+                organization { slug }
+                tasks { ...taskFields project { id } comments { content } }
+              }
+            }
+            fragment taskFields on TaskType { title status }
+        """
+        project = Project.objects.first()
+
+        count, result = self.count_queries(query, {"id": project.id})
+
+        data = result["data"]["project"]
+        self.assertEqual(data["organization"]["slug"], self.org_slug)
+        self.assertEqual(len(data["tasks"]), 3)
+        self.assertEqual(data["tasks"][0]["project"]["id"], str(project.id))
+        self.assertEqual(len(data["tasks"][0]["comments"]), 2)
+        # project JOIN organization, tasks, comments
+        self.assertEqual(count, 3)
+        task_sql = next(q["sql"] for q in self.captured if 'FROM "core_task"' in q["sql"])
+        self.assertNotIn("description", task_sql)
+        self.assertNotIn("assignee_email", task_sql)
+
+    def test_typename_does_not_disable_pruning(self):
+        self.make_tree(projects=1, tasks=1)
+
+        _, result = self.count_queries("query { projects { name __typename } }")
+
+        self.assertEqual(result["data"]["projects"][0]["__typename"], "ProjectType")
+        sql = next(q["sql"] for q in self.captured if "core_project" in q["sql"])
+        self.assertNotIn("description", sql)
+
+    def test_two_selections_of_the_same_relation(self):
+        # the second root mustn't get the first one's pruned task rows
+        self.make_tree(projects=2, tasks=5, comments=0)
+        query = """
+            query ($id: ID!) {
+              projects { id tasks { id } }
+              project(id: $id) { id tasks { id description } }
+            }
+        """
+        project = Project.objects.first()
+
+        count, result = self.count_queries(query, {"id": project.id})
+
+        self.assertEqual(len(result["data"]["project"]["tasks"]), 5)
+        # projects + their tasks, project + its tasks
+        self.assertEqual(count, 4)
+
+
+class PaginationTests(GraphQLTestCase):
+    PROJECTS_PAGE = """
+        query ($first: Int, $after: String) {
+          projectsConnection(first: $first, after: $after) {
+            edges { cursor node { name } }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    """
+
+    def test_pages_through_projects_with_keyset_cursor(self):
+        self.make_tree(projects=5, tasks=0)
+
+        names, after = [], None
+        for _ in range(3):
+            _, result = self.count_queries(self.PROJECTS_PAGE, {"first": 2, "after": after})
+            connection = result["data"]["projectsConnection"]
+            names += [edge["node"]["name"] for edge in connection["edges"]]
+            after = connection["pageInfo"]["endCursor"]
+            self.assertNotIn("OFFSET", self.captured[-1]["sql"])
+
+        self.assertEqual(names, [f"Project {i}" for i in range(5)])
+        self.assertFalse(connection["pageInfo"]["hasNextPage"])
+
+    def test_nested_connections_are_batched_and_capped(self):
+        query = """
+            query {
+              projectsConnection {
+                edges { node {
+                  tasksConnection(first: 2) {
+                    edges { node { title commentsConnection(first: 1) { edges { node { id } } } } }
+                    pageInfo { hasNextPage }
+                  }
+                } }
+              }
+            }
+        """
+        self.make_tree(projects=1, tasks=3, comments=2)
+        small, _ = self.count_queries(query)
+
+        self.make_tree(projects=4, tasks=6, comments=3)
+        large, result = self.count_queries(query)
+
+        self.assertEqual(small, large)
+        for edge in result["data"]["projectsConnection"]["edges"]:
+            tasks = edge["node"]["tasksConnection"]
+            self.assertEqual(len(tasks["edges"]), 2)
+            self.assertTrue(tasks["pageInfo"]["hasNextPage"])
+            for task in tasks["edges"]:
+                self.assertEqual(len(task["node"]["commentsConnection"]["edges"]), 1)
+
+    def test_rejects_bad_arguments(self):
+        for variables in ({"after": "not-a-cursor"}, {"first": 1000}):
+            result = self.graphql(self.PROJECTS_PAGE, variables)
+            self.assertIn("errors", result)
+
+
+class IndexUsageTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_tree(projects=3, tasks=3, comments=2)
+        self.project = Project.objects.first()
+        self.task = Task.objects.first()
+        if connection.vendor == "postgresql":
+            # tiny test tables are cheaper to scan, make the planner show
+            # which index it *would* use
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def plans(self, query, variables=None, table=None):
+        # EXPLAIN exactly what a request ran, not a hand-built lookalike
+        self.count_queries(query, variables)
+        selects = [
+            q["sql"] for q in self.captured
+            if q["sql"].startswith("SELECT") and f'FROM "{table}"' in q["sql"]
+        ]
+        self.assertTrue(selects, f"no query on {table}")
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute(f"{prefix} {sql}")
+                yield sql, "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, index_name, query, variables=None, table=None):
+        for sql, plan in self.plans(query, variables, table):
+            self.assertIn(index_name, plan, sql)
+
+    def test_projects_list_and_pages(self):
+        page = "query ($after: String) { projectsConnection(first: 2, after: $after) { edges { cursor node { id } } } }"
+        self.assertUsesIndex("project_org_created_idx", "query { projects(orderBy: CREATED_AT) { id name } }", table="core_project")
+        self.assertUsesIndex("project_org_created_idx", page, table="core_project")
+        self.assertUsesIndex(
+            "project_org_created_idx", page, {"after": encode_cursor(self.project)}, table="core_project"
+        )
+
+    def test_tasks_by_status_and_due_date(self):
+        tasks = "query ($id: ID!, $filter: TaskFilter) { project(id: $id) { tasks(filter: $filter) { id } } }"
+        self.assertUsesIndex(
+            "task_project_status_idx",
+            tasks,
+            {"id": self.project.id, "filter": {"statusIn": ["DONE"]}},
+            table="core_task",
+        )
+        self.assertUsesIndex(
+            "task_project_due_idx",
+            tasks,
+            {"id": self.project.id, "filter": {"dueBefore": timezone.now().isoformat()}},
+            table="core_task",
+        )
+        self.assertUsesIndex(
+            "task_project_created_idx",
+            "query ($id: ID!) { project(id: $id) { tasksConnection(first: 2) { edges { node { id } } } } }",
+            {"id": self.project.id},
+            table="core_task",
+        )
+
+    def test_comments_of_task(self):
+        self.assertUsesIndex(
+            "comment_task_created_idx",
+            "query ($id: ID!) { project(id: $id) { tasks { commentsConnection(first: 2) { edges { node { id } } } } } }",
+            {"id": self.project.id},
+            table="core_taskcomment",
+        )
+
+
+class OrganizationCacheTests(GraphQLTestCase):
+    def org_queries(self, slug=None, query="query { projects { id } }"):
+        with CaptureQueriesContext(connection) as ctx:
+            self.graphql(query, slug=slug)
+        return [q for q in ctx.captured_queries if "core_organization" in q["sql"]]
+
+    def test_hot_tenant_is_served_from_cache(self):
+        organization_cache.clear()
+
+        self.assertEqual(len(self.org_queries()), 1)
+        self.assertEqual(len(self.org_queries()), 0)
+
+    def test_tenant_is_only_resolved_when_used(self):
+        organization_cache.clear()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/", HTTP_X_ORG=self.org_slug)
+
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_unknown_slug_is_cached_as_missing(self):
+        self.assertEqual(len(self.org_queries(slug="nope")), 1)
+        self.assertEqual(len(self.org_queries(slug="nope")), 0)
+
+        result = self.graphql("query { projects { id } }", slug="nope")
+        self.assertEqual(result["errors"][0]["message"], "X-ORG header required")
+
+    def test_save_and_delete_invalidate(self):
+        self.org.slug = "renamed"
+        self.org.save()
+        self.assertIsNone(organization_cache.get(self.org_slug))
+        self.assertEqual(organization_cache.get("renamed").pk, self.org.pk)
+
+        self.org.delete()
+        self.assertIsNone(organization_cache.get("renamed"))
+
+    def test_entries_expire_and_are_evicted(self):
+        now = [0]
+        cache = OrganizationCache(max_size=1, ttl=10, clock=lambda: now[0])
+        cache.get(self.org_slug)
+
+        with CaptureQueriesContext(connection) as ctx:
+            cache.get(self.org_slug)
+            now[0] = 11
+            cache.get(self.org_slug)
+            cache.get("other")
+            cache.get(self.org_slug)
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+    @override_settings(
+        ORGANIZATION_CACHE={"SHARED_CACHE": "default"},
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    def test_shared_tier_skips_database_for_cold_process(self):
+        OrganizationCache().get(self.org_slug)
+
+        with CaptureQueriesContext(connection) as ctx:
+            org = OrganizationCache().get(self.org_slug)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(org.pk, self.org.pk)
+
+
+class BulkMutationTests(GraphQLTestCase):
+    CREATE_TASKS = """
+        mutation ($projectId: ID!, $tasks: [TaskInput!]!) {
+          createTasks(projectId: $projectId, tasks: $tasks) { tasks { id title status } }
+        }
+    """
+    UPDATE_TASKS = """
+        mutation ($ids: [ID!]!, $patch: TaskPatchInput!) {
+          updateTasks(ids: $ids, patch: $patch) { tasks { id status title } }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(organization=self.org, name="Sprint")
+
+    def test_create_tasks_in_constant_queries(self):
+        tasks = [{"title": f" Task {i} "} for i in range(50)]
+        tasks[3]["status"] = "IN_PROGRESS"
+
+        count, result = self.count_queries(
+            self.CREATE_TASKS, {"projectId": self.project.id, "tasks": tasks}
+        )
+
+        created = result["data"]["createTasks"]["tasks"]
+        self.assertEqual(len(created), 50)
+        self.assertEqual(created[0]["title"], "Task 0")
+        self.assertEqual(created[3]["status"], "IN_PROGRESS")
+        self.assertEqual(self.project.tasks.count(), 50)
+        # project check + savepoints, insert, counter update - whatever the batch size
+        self.assertLessEqual(count, 5)
+
+    def test_create_tasks_validates_whole_batch(self):
+        tasks = [{"title": "ok"}, {"title": "  "}, {"title": "x", "status": "NOPE"}]
+
+        result = self.graphql(self.CREATE_TASKS, {"projectId": self.project.id, "tasks": tasks})
+
+        message = result["errors"][0]["message"]
+        self.assertIn("tasks[1]", message)
+        self.assertIn("tasks[2]", message)
+        self.assertFalse(Task.objects.exists())
+
+    def test_single_task_mutations_validate_the_same_way(self):
+        task = Task.objects.create(project=self.project, title="T")
+        create = 'mutation ($pid: ID!, $title: String!, $status: String) { createTask(projectId: $pid, title: $title, status: $status) { task { id } } }'
+        update = 'mutation ($id: ID!, $title: String, $status: String) { updateTask(id: $id, title: $title, status: $status) { task { id } } }'
+
+        for query, variables, message in [
+            (create, {"pid": self.project.id, "title": "x", "status": "NOPE"}, "Invalid status NOPE"),
+            (create, {"pid": self.project.id, "title": "  "}, "Task title cannot be empty"),
+            (update, {"id": task.id, "status": "NOPE"}, "Invalid status NOPE"),
+            (update, {"id": task.id, "title": "  "}, "Task title cannot be empty"),
+        ]:
+            with self.subTest(variables=variables):
+                self.assertEqual(self.graphql(query, variables)["errors"][0]["message"], message)
+        self.assertEqual(Task.objects.get().status, "TODO")
+        self.assertEqual(Task.objects.get().title, "T")
+
+        result = self.graphql(create, {"pid": self.project.id, "title": " New ", "status": "DONE"})
+        created = Task.objects.get(id=result["data"]["createTask"]["task"]["id"])
+        self.assertEqual((created.title, created.status), ("New", "DONE"))
+
+    def test_update_tasks_status_transition(self):
+        ids = [Task.objects.create(project=self.project, title=f"T{i}").id for i in range(20)]
+
+        count, result = self.count_queries(
+            self.UPDATE_TASKS, {"ids": ids, "patch": {"status": "DONE"}}
+        )
+
+        self.assertTrue(all(t["status"] == "DONE" for t in result["data"]["updateTasks"]["tasks"]))
+        self.assertEqual(Task.objects.filter(status="DONE").count(), 20)
+        self.assertEqual(Task.objects.get(id=ids[0]).title, "T0")
+        # savepoints, locking select, counter update, update
+        self.assertLessEqual(count, 5)
+
+    def test_update_tasks_is_all_or_nothing_across_tenants(self):
+        other = Organization.objects.create(name="Other", slug="other", contact_email="a@b.c")
+        foreign = Task.objects.create(
+            project=Project.objects.create(organization=other, name="Theirs"), title="Theirs"
+        )
+        mine = Task.objects.create(project=self.project, title="Mine")
+
+        result = self.graphql(
+            self.UPDATE_TASKS, {"ids": [mine.id, foreign.id], "patch": {"status": "DONE"}}
+        )
+
+        self.assertEqual(result["errors"][0]["message"], "Task not found")
+        self.assertFalse(Task.objects.filter(status="DONE").exists())
+
+
+class PartialUpdateTests(GraphQLTestCase):
+    UPDATE_TASK = """
+        mutation ($id: ID!, $status: String) {
+          updateTask(id: $id, status: $status) { task { id status } }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(organization=self.org, name="P", description="long")
+        self.task = Task.objects.create(project=self.project, title="T", description="x" * 1000)
+
+    def test_update_task_writes_only_changed_columns(self):
+        _, result = self.count_queries(self.UPDATE_TASK, {"id": self.task.id, "status": "DONE"})
+
+        self.assertEqual(result["data"]["updateTask"]["task"]["status"], "DONE")
+        select, update = [q["sql"] for q in self.captured if "core_task" in q["sql"]]
+        self.assertNotIn("description", select)
+        self.assertTrue(update.startswith('UPDATE "core_task" SET "status"'))
+        self.assertNotIn("description", update)
+        self.assertNotIn("title", update)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, "DONE")
+        self.assertEqual(self.task.description, "x" * 1000)
+
+    def test_noop_update_skips_write(self):
+        _, result = self.count_queries(self.UPDATE_TASK, {"id": self.task.id, "status": "TODO"})
+
+        self.assertEqual(result["data"]["updateTask"]["task"]["status"], "TODO")
+        self.assertFalse(any(q["sql"].startswith("UPDATE") for q in self.captured))
+
+    def test_update_project_returns_requested_fields(self):
+        query = """
+            mutation ($id: ID!) {
+              updateProject(id: $id, name: " New ") { project { name description } }
+            }
+        """
+        _, result = self.count_queries(query, {"id": self.project.id})
+
+        self.assertEqual(
+            result["data"]["updateProject"]["project"], {"name": "New", "description": "long"}
+        )
+        update = next(q["sql"] for q in self.captured if q["sql"].startswith("UPDATE"))
+        self.assertNotIn("description", update)
+
+
+class CounterTests(GraphQLTestCase):
+    STATS = """
+        query {
+          organizationStats {
+            projectCount todo inProgress done overdue total
+            projects { project { name } todo done overdue }
+          }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.create(organization=self.org, name="P")
+
+    def create_task(self, **variables):
+        result = self.graphql(
+            """
+            mutation ($projectId: ID!, $title: String!, $status: String, $dueDate: DateTime) {
+              createTask(projectId: $projectId, title: $title, status: $status, dueDate: $dueDate) {
+                task { id }
+              }
+            }
+            """,
+            {"projectId": self.project.id, "title": "T", **variables},
+        )
+        return result["data"]["createTask"]["task"]["id"]
+
+    def test_status_change_locks_the_task(self):
+        # the old status is read from the locked row, see UpdateTask
+        task_id = self.create_task()
+        with CaptureQueriesContext(connection) as ctx:
+            self.graphql(
+                'mutation ($id: ID!) { updateTask(id: $id, status: "DONE") { task { id } } }', {"id": task_id}
+            )
+        select = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith('SELECT "core_task"'))
+        if connection.features.has_select_for_update:
+            self.assertIn("FOR UPDATE", select)
+        self.assertEqual(Project.objects.get().done_count, 1)
+
+    def test_mutations_keep_counters_in_sync(self):
+        first = self.create_task()
+        second = self.create_task(status="IN_PROGRESS")
+        self.graphql(
+            'mutation ($id: ID!) { updateTask(id: $id, status: "DONE") { task { id } } }',
+            {"id": first},
+        )
+        self.graphql(
+            'mutation ($ids: [ID!]!) { updateTasks(ids: $ids, patch: {status: "DONE"}) { tasks { id } } }',
+            {"ids": [first, second]},
+        )
+        self.graphql(
+            'mutation ($pid: ID!) { createTasks(projectId: $pid, tasks: [{title: "a"}, {title: "b"}]) { tasks { id } } }',
+            {"pid": self.project.id},
+        )
+        self.graphql(
+            'mutation ($id: ID!) { addComment(taskId: $id, content: "hi", authorEmail: "a@b.c") { comment { id } } }',
+            {"id": first},
+        )
+
+        self.project.refresh_from_db()
+        self.assertEqual(
+            (self.project.todo_count, self.project.in_progress_count, self.project.done_count),
+            (2, 0, 2),
+        )
+        self.assertEqual(Task.objects.get(id=first).comment_count, 1)
+
+    def test_stats_do_not_read_tasks(self):
+        self.create_task(dueDate="2000-01-01T00:00:00+00:00")
+        for _ in range(5):
+            self.create_task(status="DONE")
+
+        count, result = self.count_queries(self.STATS)
+
+        stats = result["data"]["organizationStats"]
+        self.assertEqual(
+            (stats["projectCount"], stats["todo"], stats["done"], stats["overdue"], stats["total"]),
+            (1, 1, 5, 1, 6),
+        )
+        self.assertEqual(stats["projects"][0]["project"]["name"], "P")
+        # projects + one grouped overdue query
+        self.assertEqual(count, 2)
+
+    def test_rebuild_counters_command(self):
+        self.make_tree(projects=2, tasks=3, comments=2)
+        Project.objects.update(todo_count=99)
+
+        call_command("rebuild_counters", org=self.org_slug, stdout=StringIO())
+
+        self.assertEqual(set(Project.objects.values_list("todo_count", flat=True)), {0, 3})
+        self.assertEqual(set(Task.objects.values_list("comment_count", flat=True)), {2})
+
+
+class PersistedQueryTests(GraphQLTestCase):
+    QUERY = "query { projects { id name } }"
+
+    def setUp(self):
+        super().setUp()
+        document_cache.clear()
+        caches["default"].clear()
+        persisted_queries.reload()
+
+    def post(self, body):
+        return self.client.post(
+            "/graphql/", json.dumps(body), content_type="application/json", HTTP_X_ORG=self.org_slug
+        ).json()
+
+    def apq(self, key, query=None):
+        body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": key}}}
+        if query:
+            body["query"] = query
+        return self.post(body)
+
+    def test_apq_roundtrip(self):
+        key = query_hash(self.QUERY)
+
+        miss = self.client.post(
+            "/graphql/",
+            json.dumps({"extensions": {"persistedQuery": {"version": 1, "sha256Hash": key}}}),
+            content_type="application/json",
+            HTTP_X_ORG=self.org_slug,
+        )
+        # the protocol's answer, not a failed request
+        self.assertEqual(miss.status_code, 200)
+        self.assertEqual(miss.json()["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+        self.assertEqual(self.apq(key, self.QUERY)["data"], {"projects": []})
+        self.assertEqual(self.apq(key)["data"], {"projects": []})
+
+    def test_hash_must_match_query(self):
+        result = self.apq(query_hash("query { hello }"), self.QUERY)
+        self.assertEqual(result["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_HASH_MISMATCH")
+
+    def test_malformed_extensions_are_ignored(self):
+        for extensions in ([1], "[1]", {"persistedQuery": "x"}, {"persistedQuery": {"sha256Hash": [1]}}):
+            with self.subTest(extensions=extensions):
+                response = self.client.post(
+                    "/graphql/",
+                    json.dumps({"query": self.QUERY, "extensions": extensions}),
+                    content_type="application/json",
+                    HTTP_X_ORG=self.org_slug,
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["data"], {"projects": []})
+
+        response = self.client.get(
+            "/graphql/",
+            {"query": self.QUERY, "extensions": '"x"'},
+            HTTP_X_ORG=self.org_slug,
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_hot_documents_skip_parse_and_validate(self):
+        self.graphql(self.QUERY)
+        with mock.patch("core.views.parse") as parse, mock.patch("core.views.validate") as validate:
+            result = self.graphql(self.QUERY)
+        parse.assert_not_called()
+        validate.assert_not_called()
+        self.assertEqual(result["data"], {"projects": []})
+
+    def test_invalid_documents_are_not_cached(self):
+        self.graphql("query { nope }")
+        self.assertIsNone(document_cache.get(query_hash("query { nope }")))
+
+    def test_allow_list_mode(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(
+                {"operations": [{"id": query_hash(self.QUERY), "body": self.QUERY, "name": "P"}]}, f
+            )
+        self.addCleanup(os.remove, f.name)
+        self.addCleanup(persisted_queries.reload)
+
+        with self.settings(PERSISTED_QUERIES={"REGISTRY": f.name, "ALLOW_LIST": True}):
+            persisted_queries.reload()
+            self.assertEqual(self.apq(query_hash(self.QUERY))["data"], {"projects": []})
+            self.assertEqual(self.graphql(self.QUERY)["data"], {"projects": []})
+
+            other = "query { hello }"
+            for result in (self.graphql(other), self.apq(query_hash(other), other)):
+                self.assertEqual(
+                    result["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_ALLOWED"
+                )
+
+
+class QueryCostTests(GraphQLTestCase):
+    def test_cost_is_reported_in_extensions(self):
+        result = self.graphql("query { projectsConnection(first: 10) { edges { node { name } } } }")
+
+        # connection 1 + 10 nodes
+        self.assertEqual(result["extensions"]["cost"]["requested"], 11)
+        self.assertEqual(result["extensions"]["cost"]["depth"], 4)
+
+    def test_first_variable_and_list_hints_multiply(self):
+        query = """
+            query ($first: Int) {
+              projectsConnection(first: $first) { edges { node { tasks { comments { id } } } } }
+            }
+        """
+        result = self.graphql(query, {"first": 2})
+
+        # connection 1 + 2 nodes * (1 + 50 tasks * (1 + 20 comments))
+        self.assertEqual(result["extensions"]["cost"]["requested"], 1 + 2 * (1 + 50 * (1 + 20)))
+
+    def test_empty_page_costs_only_the_connection(self):
+        query = "query ($first: Int) { projectsConnection(first: $first) { edges { node { name } } } }"
+
+        self.assertEqual(self.graphql(query, {"first": 0})["extensions"]["cost"]["requested"], 1)
+        self.assertGreater(self.graphql(query)["extensions"]["cost"]["requested"], 1)
+
+    def test_cyclic_fan_out_is_rejected_before_sql(self):
+        query = """
+            query {
+              projects { tasks { project { tasks { project { tasks { comments { id } } } } } } }
+            }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            result = self.graphql(query)
+
+        self.assertEqual(result["errors"][0]["extensions"]["code"], "QUERY_TOO_EXPENSIVE")
+        self.assertNotIn("data", result)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_depth_limit(self):
+        query = "query { project(id: 1) { " + "tasks { project { " * 6 + "id" + " } }" * 6 + " } }"
+
+        result = self.graphql(query)
+
+        self.assertEqual(result["errors"][0]["extensions"]["code"], "QUERY_TOO_DEEP")
+
+    def test_limits_can_be_raised_per_tenant(self):
+        query = "query { projects { tasks { comments { task { comments { id } } } } } }"
+        self.assertIn("errors", self.graphql(query))
+
+        with self.settings(QUERY_COST={"TENANTS": {self.org_slug: {"MAX_COST": 10**7}}}):
+            result = self.graphql(query)
+
+        self.assertNotIn("errors", result)
+        self.assertEqual(result["extensions"]["cost"]["maximum"], 10**7)
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": True})
+class ResponseCacheTests(GraphQLTestCase):
+    PROJECT = "query ($id: ID!) { project(id: $id) { id name tasks { title status } } }"
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        document_cache.clear()
+        self.make_tree(projects=2, tasks=2)
+        self.first, self.second = Project.objects.order_by("id")
+
+    def post(self, query, variables=None, slug=None, **headers):
+        return self.client.post(
+            "/graphql/",
+            json.dumps({"query": query, "variables": variables or {}}),
+            content_type="application/json",
+            HTTP_X_ORG=slug or self.org_slug,
+            **headers,
+        )
+
+    def mutate(self, query, variables):
+        # versions are dropped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.graphql(query, variables)
+        self.assertNotIn("errors", result)
+
+    def test_hit_skips_the_database(self):
+        variables = {"id": self.first.id}
+        self.post(self.PROJECT, variables)  # parses + validates the document
+        miss = self.post(self.PROJECT, variables)
+
+        with CaptureQueriesContext(connection) as ctx:
+            hit = self.post(self.PROJECT, variables)
+
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit["ETag"], miss["ETag"])
+        self.assertEqual(len(hit.json()["data"]["project"]["tasks"]), 2)
+
+    def test_if_none_match_returns_304(self):
+        variables = {"id": self.first.id}
+        self.post(self.PROJECT, variables)
+        tag = self.post(self.PROJECT, variables)["ETag"]
+
+        response = self.post(self.PROJECT, variables, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], tag)
+
+        response = self.post(self.PROJECT, variables, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_mutations_invalidate_their_project_and_the_tenant(self):
+        query = "query { projects { id tasks { status } } }"
+        for _ in range(2):
+            self.post(query)
+            self.post(self.PROJECT, {"id": self.first.id})
+            other = self.post(self.PROJECT, {"id": self.second.id})
+
+        task = self.first.tasks.order_by("id").first()
+        self.mutate(
+            'mutation ($id: ID!) { updateTask(id: $id, status: "DONE") { task { id } } }',
+            {"id": task.id},
+        )
+
+        project = self.post(self.PROJECT, {"id": self.first.id}).json()["data"]["project"]
+        self.assertEqual(project["tasks"][0]["status"], "DONE")
+        projects = self.post(query).json()["data"]["projects"]
+        self.assertEqual(projects[0]["tasks"][0]["status"], "DONE")
+
+        # the other project's cached response is still served
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.post(self.PROJECT, {"id": self.second.id})
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(cached.content, other.content)
+
+    def test_add_comment_invalidates(self):
+        query = "query ($id: ID!) { project(id: $id) { tasks { comments { content } } } }"
+        for _ in range(2):
+            self.post(query, {"id": self.first.id})
+
+        task = self.first.tasks.order_by("id").first()
+        self.mutate(
+            """
+            mutation ($id: ID!) {
+              addComment(taskId: $id, content: "new", authorEmail: "dev@org-one.test") { comment { id } }
+            }
+            """,
+            {"id": task.id},
+        )
+
+        tasks = self.post(query, {"id": self.first.id}).json()["data"]["project"]["tasks"]
+        self.assertEqual([c["content"] for c in tasks[0]["comments"]], ["Comment 0", "new"])
+
+    def test_cache_is_per_tenant(self):
+        Organization.objects.create(name="Org Two", slug="org-two", contact_email="a@b.test")
+        query = "query { projects { name } }"
+        for _ in range(2):
+            self.post(query)
+
+        result = self.post(query, slug="org-two").json()
+        self.assertEqual(result["data"]["projects"], [])
+
+    def test_errors_and_mutations_are_not_cached(self):
+        query = "query { projects { name } }"
+        for _ in range(2):
+            self.assertIn("errors", self.post(query, slug="missing").json())
+
+        for _ in range(2):
+            response = self.post(
+                'mutation { createProject(name: "P") { project { id } } }'
+            )
+            self.assertNotIn("ETag", response)
+        self.assertEqual(Project.objects.filter(name="P").count(), 2)
+
+
+# the async view, mounted for AsyncViewTests (ROOT_URLCONF="core.tests")
+urlpatterns = [path("graphql/", csrf_exempt(AsyncGraphQLView.as_view()))]
+
+
+@override_settings(ROOT_URLCONF="core.tests")
+class AsyncViewTests(GraphQLTestCase):
+    TREE = """
+        query {
+          projects {
+            id name organization { slug }
+            tasks { id title project { id } comments { id content } }
+            tasksConnection(first: 2) { edges { node { id } } pageInfo { hasNextPage } }
+          }
+        }
+    """
+
+    async def agraphql(self, query, variables=None, slug=None):
+        response = await self.async_client.post(
+            "/graphql/",
+            json.dumps({"query": query, "variables": variables or {}}),
+            content_type="application/json",
+            headers={"X-ORG": slug or self.org_slug},
+        )
+        return response.json()
+
+    def acount_queries(self, query, variables=None):
+        # the query log has to be read from the sync side
+        with CaptureQueriesContext(connection) as ctx:
+            result = async_to_sync(self.agraphql)(query, variables)
+        self.assertNotIn("errors", result)
+        return len(ctx.captured_queries), result
+
+    def test_same_result_as_sync_view(self):
+        self.make_tree(projects=3, tasks=3, comments=2)
+        with override_settings(ROOT_URLCONF="config.urls"):
+            expected = self.graphql(self.TREE)
+
+        result = async_to_sync(self.agraphql)(self.TREE)
+        self.assertEqual(result["data"], expected["data"])
+        self.assertEqual(len(result["data"]["projects"]), 3)
+
+    def test_query_count_is_flat(self):
+        self.make_tree(projects=2, tasks=2)
+        small, _ = self.acount_queries(self.TREE)
+
+        self.make_tree(projects=5, tasks=4, comments=3)
+        large, result = self.acount_queries(self.TREE)
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(result["data"]["projects"]), 7)
+
+    def test_concurrent_siblings_share_one_batch(self):
+        self.make_tree(projects=3, tasks=2)
+        single, _ = self.acount_queries("query { projects { id tasks { id } } }")
+        aliased, result = self.acount_queries(
+            "query { projects { id a: tasks { id } b: tasks { id title } } }"
+        )
+
+        self.assertEqual(single, aliased)
+        for project in result["data"]["projects"]:
+            self.assertEqual([t["id"] for t in project["a"]], [t["id"] for t in project["b"]])
+
+    async def test_project_and_stats(self):
+        await sync_to_async(self.make_tree)(projects=1, tasks=3)
+        await sync_to_async(rebuild_counters)()
+        project = await Project.objects.aget()
+
+        result = await self.agraphql(
+            """
+            query ($id: ID!) {
+              project(id: $id) { name }
+              projectStats(id: $id) { todo total }
+              missing: project(id: 0) { name }
+            }
+            """,
+            {"id": project.id},
+        )
+        self.assertEqual(
+            result["data"],
+            {"project": {"name": "Project 0"}, "projectStats": {"todo": 3, "total": 3}, "missing": None},
+        )
+
+    async def test_mutations_run_on_the_sync_path(self):
+        await sync_to_async(self.make_tree)(projects=1, tasks=0)
+        project = await Project.objects.aget()
+
+        result = await self.agraphql(
+            """
+            mutation ($id: ID!) {
+              createTask(projectId: $id, title: "from asgi") { task { title project { id } } }
+            }
+            """,
+            {"id": project.id},
+        )
+        self.assertEqual(
+            result["data"]["createTask"]["task"],
+            {"title": "from asgi", "project": {"id": str(project.id)}},
+        )
+        await project.arefresh_from_db()
+        self.assertEqual(project.todo_count, 1)
+
+    def test_two_selections_of_the_same_relation(self):
+        # pruned rows of one selection would make the other one load its
+        # columns lazily, i.e. synchronously inside the event loop
+        self.make_tree(projects=2, tasks=3, comments=1)
+        project = Project.objects.first()
+        count, result = self.acount_queries(
+            """
+            query ($id: ID!) {
+              projects { id tasks { id comments { id } } }
+              project(id: $id) { id tasks { id description comments { content } } }
+            }
+            """,
+            {"id": project.id},
+        )
+        tasks = result["data"]["project"]["tasks"]
+        self.assertEqual([t["description"] for t in tasks], [""] * 3)
+        self.assertEqual([len(t["comments"]) for t in tasks], [1] * 3)
+        self.assertEqual(count, 6)
+
+    async def test_unknown_organization(self):
+        result = await self.agraphql("query { projects { id } }", slug="nope")
+        self.assertEqual(result["errors"][0]["message"], "X-ORG header required")
+
+    @override_settings(RESPONSE_CACHE={"ENABLED": True})
+    def test_response_cache_hit(self):
+        caches["default"].clear()
+        document_cache.clear()
+        self.make_tree(projects=2, tasks=1)
+        query = "query { projects { name } }"
+        expected = async_to_sync(self.agraphql)(query)
+        async_to_sync(self.agraphql)(query)
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = async_to_sync(self.agraphql)(query)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(result, expected)
+
+
+class WebSocketClient:
+    # drives core.subscriptions.websocket_application like an ASGI server would
+    def __init__(self, path="/graphql/", subprotocols=(PROTOCOL,)):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {"type": "websocket", "path": path, "subprotocols": list(subprotocols), "headers": []}
+        self.task = asyncio.ensure_future(
+            websocket_application(scope, self.inbox.get, self.outbox.put)
+        )
+
+    async def connect(self):
+        await self.inbox.put({"type": "websocket.connect"})
+        return await self.receive()
+
+    async def send_json(self, message):
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outbox.get(), 5)
+
+    async def receive_json(self):
+        return json.loads((await self.receive())["text"])
+
+    async def disconnect(self):
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+class SubscriptionTests(GraphQLTestCase):
+    TASK_CHANGED = """
+        subscription ($id: ID!) {
+          taskChanged(projectId: $id) { kind task { title status description } }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.make_tree(projects=1, tasks=1)
+        self.project = Project.objects.get()
+        self.task = Task.objects.get()
+
+    def mutate(self, query, variables):
+        # events are published on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.graphql(query, variables)
+        self.assertNotIn("errors", result)
+
+    async def subscribe(self, query, variables, slug=None):
+        client = WebSocketClient()
+        self.assertEqual((await client.connect())["type"], "websocket.accept")
+        await client.send_json({"type": "connection_init", "payload": {"X-ORG": slug or self.org_slug}})
+        self.assertEqual(await client.receive_json(), {"type": "connection_ack"})
+        await client.send_json(
+            {"id": "1", "type": "subscribe", "payload": {"query": query, "variables": variables}}
+        )
+        return client
+
+    async def wait_for_subscribers(self, topic, count=1):
+        for _ in range(100):
+            if broker.subscriber_count(topic) == count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"{topic} has {broker.subscriber_count(topic)} subscribers")
+
+    async def test_task_changed(self):
+        client = await self.subscribe(self.TASK_CHANGED, {"id": self.project.id})
+        await self.wait_for_subscribers(task_topic(self.project.id))
+
+        await sync_to_async(self.mutate)(
+            'mutation ($id: ID!) { createTask(projectId: $id, title: "new") { task { id } } }',
+            {"id": self.project.id},
+        )
+        created = await client.receive_json()
+        self.assertEqual(created["type"], "next")
+        self.assertEqual(
+            created["payload"]["data"]["taskChanged"],
+            {"kind": "CREATED", "task": {"title": "new", "status": "TODO", "description": ""}},
+        )
+
+        # updateTask only loads the columns it writes, the event still has the full row
+        await sync_to_async(self.mutate)(
+            'mutation ($id: ID!) { updateTask(id: $id, status: "DONE") { task { id } } }',
+            {"id": self.task.id},
+        )
+        updated = await client.receive_json()
+        self.assertEqual(
+            updated["payload"]["data"]["taskChanged"],
+            {"kind": "UPDATED", "task": {"title": "Task 0.0", "status": "DONE", "description": ""}},
+        )
+
+        await client.send_json({"id": "1", "type": "complete"})
+        await self.wait_for_subscribers(task_topic(self.project.id), 0)
+        await client.disconnect()
+
+    async def test_comment_added(self):
+        client = await self.subscribe(
+            "subscription ($id: ID!) { commentAdded(taskId: $id) { content task { title } } }",
+            {"id": self.task.id},
+        )
+        await self.wait_for_subscribers(comment_topic(self.task.id))
+
+        await sync_to_async(self.mutate)(
+            """
+            mutation ($id: ID!) {
+              addComment(taskId: $id, content: "hi", authorEmail: "dev@org-one.test") { comment { id } }
+            }
+            """,
+            {"id": self.task.id},
+        )
+        event = await client.receive_json()
+        self.assertEqual(
+            event["payload"]["data"]["commentAdded"], {"content": "hi", "task": {"title": "Task 0.0"}}
+        )
+        await client.disconnect()
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    async def test_subscriptions_are_tenant_scoped(self):
+        await Organization.objects.acreate(name="Org Two", slug="org-two", contact_email="a@b.test")
+
+        client = await self.subscribe(self.TASK_CHANGED, {"id": self.project.id}, slug="org-two")
+        error = await client.receive_json()
+        self.assertEqual(error["type"], "error")
+        self.assertEqual(error["payload"][0]["message"], "Project not found")
+
+        client = await self.subscribe(self.TASK_CHANGED, {"id": self.project.id}, slug="missing")
+        error = await client.receive_json()
+        self.assertEqual(error["payload"][0]["message"], "X-ORG header required")
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    async def test_protocol_errors_close_the_socket(self):
+        client = WebSocketClient(subprotocols=())
+        self.assertEqual((await client.connect())["code"], 4406)
+
+        client = WebSocketClient()
+        await client.connect()
+        await client.send_json({"id": "1", "type": "subscribe", "payload": {"query": "{ hello }"}})
+        self.assertEqual((await client.receive())["code"], 4401)
+        await client.disconnect()
+
+
+class SearchTests(GraphQLTestCase):
+    # SQLite: exercises the icontains fallback, rank is 0 for every row so the
+    # order is (kind, id)
+    SEARCH = """
+        query ($q: String!, $first: Int, $after: String) {
+          search(query: $q, first: $first, after: $after) {
+            edges {
+              cursor
+              node {
+                __typename
+                ... on TaskType { title }
+                ... on TaskCommentType { content }
+              }
+            }
+            pageInfo { hasNextPage endCursor }
+          }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        project = Project.objects.create(organization=self.org, name="Website")
+        self.task = Task.objects.create(project=project, title="Design review", description="")
+        Task.objects.create(project=project, title="Deploy", description="after the design review")
+        Task.objects.create(project=project, title="Unrelated")
+        TaskComment.objects.create(task=self.task, content="review the designs", author_email="a@b.test")
+
+    def search(self, q, **variables):
+        result = self.graphql(self.SEARCH, {"q": q, **variables})
+        self.assertNotIn("errors", result)
+        return result["data"]["search"]
+
+    @skipUnless(connection.vendor == "postgresql", "the admin only searches the vector on Postgres")
+    def test_admin_search_matches_emails(self):
+        self.task.assignee_email = "alice@example.test"
+        self.task.save()
+        self.client.force_login(User.objects.create_superuser("root", password="x"))
+
+        for path, q, expected in [
+            ("/admin/core/task/", "alice", "Design review"),
+            ("/admin/core/task/", "design", "Design review"),
+            ("/admin/core/taskcomment/", "a@b.test", "a@b.test"),
+        ]:
+            with self.subTest(path=path, q=q):
+                self.assertContains(self.client.get(path, {"q": q}), expected)
+
+    def test_other_queries_dont_read_the_vector(self):
+        queries = [
+            ("query { projects { tasks { title comments { content } } } }", {}),
+            (
+                "query ($id: ID!) { project(id: $id) { tasksConnection(first: 5) { edges { node { title } } } } }",
+                {"id": self.task.project_id},
+            ),
+            ('mutation ($id: ID!) { updateTask(id: $id, title: "Review") { task { title } } }', {"id": self.task.id}),
+            (
+                'mutation ($id: ID!) { addComment(taskId: $id, content: "ok", authorEmail: "a@b.test") '
+                "{ comment { id } } }",
+                {"id": self.task.id},
+            ),
+        ]
+        for query, variables in queries:
+            with self.subTest(query=query), CaptureQueriesContext(connection) as ctx:
+                self.assertNotIn("errors", self.graphql(query, variables))
+            # INSERTs name it (the trigger fills it in), nothing reads it
+            reads = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+            self.assertFalse([sql for sql in reads if "search_vector" in sql])
+
+    def nodes(self, connection):
+        return [edge["node"] for edge in connection["edges"]]
+
+    def test_matches_tasks_and_comments(self):
+        nodes = self.nodes(self.search("design review"))
+        self.assertEqual(
+            nodes,
+            [
+                {"__typename": "TaskCommentType", "content": "review the designs"},
+                {"__typename": "TaskType", "title": "Design review"},
+                {"__typename": "TaskType", "title": "Deploy"},
+            ],
+        )
+
+    def test_terms_match_as_prefixes(self):
+        titles = [node.get("title") for node in self.nodes(self.search("desi rev"))]
+        self.assertIn("Design review", titles)
+        self.assertEqual(self.nodes(self.search("unrel")), [{"__typename": "TaskType", "title": "Unrelated"}])
+
+    def test_empty_query_matches_nothing(self):
+        self.assertEqual(self.search("  !? ")["edges"], [])
+
+    def test_pages_with_cursors(self):
+        first = self.search("review", first=2)
+        self.assertEqual(len(first["edges"]), 2)
+        self.assertTrue(first["pageInfo"]["hasNextPage"])
+
+        rest = self.search("review", first=2, after=first["pageInfo"]["endCursor"])
+        self.assertEqual(self.nodes(rest), [{"__typename": "TaskType", "title": "Deploy"}])
+
+    @skipUnless(connection.vendor == "postgresql", "ts_rank needs Postgres")
+    def test_pages_through_tied_ranks(self):
+        # same text = same (non-zero) rank, the pages must neither skip nor repeat
+        project = Project.objects.first()
+        for number in range(7):
+            task = Task.objects.create(project=project, title="Quarterly budget", description="")
+            TaskComment.objects.create(task=task, content="quarterly budget", author_email="a@b.test")
+
+        seen, after = [], None
+        while True:
+            page = self.search("quarterly budget", first=3, after=after)
+            seen.extend(edge["cursor"] for edge in page["edges"])
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+            after = page["pageInfo"]["endCursor"]
+        self.assertEqual(len(seen), 14)
+        self.assertEqual(len(set(seen)), 14)
+        self.assertFalse(rest["pageInfo"]["hasNextPage"])
+
+        result = self.graphql(self.SEARCH, {"q": "review", "after": "garbage"})
+        self.assertEqual(result["errors"][0]["message"], "Invalid cursor")
+
+    def test_is_tenant_scoped(self):
+        other = Organization.objects.create(name="Org Two", slug="org-two", contact_email="a@b.test")
+        project = Project.objects.create(organization=other, name="Secret")
+        Task.objects.create(project=project, title="Design review of the secret")
+
+        titles = [node.get("title") for node in self.nodes(self.search("secret"))]
+        self.assertEqual(titles, [])
+        result = self.graphql(self.SEARCH, {"q": "secret"}, slug="org-two")
+        self.assertEqual(len(result["data"]["search"]["edges"]), 1)
+
+
+class FilterTests(GraphQLTestCase):
+    MY_TASKS = """
+        query ($filter: TaskFilter, $orderBy: TaskOrder) {
+          projects(orderBy: NAME) { name tasks(filter: $filter, orderBy: $orderBy) { title } }
+        }
+    """
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        self.website = Project.objects.create(organization=self.org, name="Website", status="ACTIVE")
+        self.app = Project.objects.create(
+            organization=self.org, name="App", status="ON_HOLD", due_date=now.date() - timezone.timedelta(days=1)
+        )
+        Project.objects.create(organization=self.org, name="Archive", status="COMPLETED")
+        for project in (self.website, self.app):
+            Task.objects.create(project=project, title=f"{project.name} late", assignee_email="me@org.test",
+                                status="IN_PROGRESS", due_date=now - timezone.timedelta(days=1))
+            Task.objects.create(project=project, title=f"{project.name} soon", assignee_email="me@org.test",
+                                due_date=now + timezone.timedelta(days=1))
+            Task.objects.create(project=project, title=f"{project.name} done", assignee_email="me@org.test",
+                                status="DONE", due_date=now - timezone.timedelta(days=2))
+            Task.objects.create(project=project, title=f"{project.name} theirs", assignee_email="you@org.test")
+
+    def titles(self, result):
+        return {p["name"]: [t["title"] for t in p["tasks"]] for p in result["data"]["projects"]}
+
+    def test_filters_projects(self):
+        result = self.graphql(
+            "query ($f: ProjectFilter) { projects(filter: $f, orderBy: NAME) { name } }",
+            {"f": {"statusIn": ["ACTIVE", "ON_HOLD"]}},
+        )
+        self.assertEqual([p["name"] for p in result["data"]["projects"]], ["App", "Website"])
+
+        result = self.graphql("query { projects(filter: {overdue: true}) { name } }")
+        self.assertEqual([p["name"] for p in result["data"]["projects"]], ["App"])
+
+    def test_my_open_tasks_is_one_query_per_level(self):
+        filter = {"assigneeEmail": "me@org.test", "statusIn": ["TODO", "IN_PROGRESS"]}
+        count, result = self.count_queries(self.MY_TASKS, {"filter": filter, "orderBy": "DUE_DATE"})
+
+        self.assertEqual(
+            self.titles(result),
+            {
+                "App": ["App late", "App soon"],
+                "Archive": [],
+                "Website": ["Website late", "Website soon"],
+            },
+        )
+        # projects, tasks - filtered in SQL, not in Python
+        self.assertEqual(count, 2)
+        task_sql = next(q["sql"] for q in self.captured if 'FROM "core_task"' in q["sql"])
+        self.assertIn('"core_task"."assignee_email" = \'me@org.test\'', task_sql)
+        self.assertIn("ORDER BY", task_sql)
+
+    def test_due_dates_and_overdue(self):
+        due_desc = self.titles(self.graphql(self.MY_TASKS, {"orderBy": "DUE_DATE_DESC"}))
+        # tasks without a due date last
+        self.assertEqual(due_desc["App"], ["App soon", "App late", "App done", "App theirs"])
+
+        overdue = self.titles(self.graphql(self.MY_TASKS, {"filter": {"overdue": True}}))
+        self.assertEqual(overdue["App"], ["App late"])
+        not_overdue = self.titles(self.graphql(self.MY_TASKS, {"filter": {"overdue": False}}))
+        self.assertEqual(not_overdue["App"], ["App soon", "App done", "App theirs"])
+
+        before = (timezone.now() - timezone.timedelta(hours=1)).isoformat()
+        result = self.graphql(self.MY_TASKS, {"filter": {"dueBefore": before}, "orderBy": "TITLE"})
+        self.assertEqual(self.titles(result)["App"], ["App done", "App late"])
+
+    def test_aliases_with_different_filters(self):
+        query = """
+            query ($id: ID!) {
+              project(id: $id) {
+                mine: tasks(filter: {assigneeEmail: "me@org.test"}, orderBy: TITLE) { title }
+                done: tasks(filter: {statusIn: [DONE]}) { title }
+                tasks { title }
+              }
+            }
+        """
+        count, result = self.count_queries(query, {"id": self.app.id})
+
+        project = result["data"]["project"]
+        self.assertEqual([t["title"] for t in project["mine"]], ["App done", "App late", "App soon"])
+        self.assertEqual([t["title"] for t in project["done"]], ["App done"])
+        self.assertEqual(len(project["tasks"]), 4)
+        # project + one prefetch per distinct set of arguments
+        self.assertEqual(count, 4)
+
+    def test_loader_batches_filtered_loads(self):
+        loaders = Loaders()
+        projects = list(Project.objects.order_by("id"))
+        loaders.tasks_by_project.queue(projects)
+        arguments = ListArguments(Task, {"assignee_email": "you@org.test"}, "TITLE")
+
+        with self.assertNumQueries(1):
+            rows = [loaders.tasks_by_project.load_filtered(p, arguments) for p in projects]
+        self.assertEqual([[t.title for t in tasks] for tasks in rows], [["Website theirs"], ["App theirs"], []])
+
+
+class BenchmarkTests(GraphQLTestCase):
+    ARGS = ["--orgs", "1", "--projects", "2", "--tasks", "3", "--comments", "1", "--steps", "20",
+            "--warmup", "2", "--latency-tolerance", "-1"]
+
+    def test_dataset_and_script(self):
+        dataset = Dataset(orgs=2, projects=3, tasks=4, comments=2).create()
+
+        slug = sorted(dataset.tenants)[0]
+        self.assertEqual(Project.objects.filter(organization__slug=slug).count(), 3)
+        self.assertEqual(Task.objects.filter(project__organization__slug=slug).count(), 12)
+        self.assertEqual(TaskComment.objects.filter(task__project__organization__slug=slug).count(), 24)
+
+        mix = parse_mix("dashboard=1,comment_burst=1")
+        first = script(dataset, mix, 10, seed=3)
+        self.assertEqual([step[:2] for step in first], [step[:2] for step in script(dataset, mix, 10, seed=3)])
+        self.assertEqual({name for name, _, _ in first}, {"dashboard", "comment_burst"})
+        with self.assertRaises(ValueError):
+            parse_mix("everything")
+
+        dataset.delete()
+        self.assertFalse(Organization.objects.filter(slug=slug).exists())
+
+    def test_baseline_catches_query_regressions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            call_command("benchmark", *self.ARGS, "--save-baseline", path, stdout=StringIO())
+            with open(path) as f:
+                baseline = json.load(f)
+            self.assertEqual(baseline["errors"], 0)
+            self.assertEqual(baseline["operations"]["project_detail"]["queries"], 3)
+
+            out = StringIO()
+            call_command("benchmark", *self.ARGS, "--baseline", path, stdout=out)
+            self.assertIn("No regressions", out.getvalue())
+
+            # pretend the project page used to take 2 queries
+            baseline["operations"]["project_detail"]["queries"] = 2
+            with open(path, "w") as f:
+                json.dump(baseline, f)
+            with self.assertRaisesMessage(CommandError, "project_detail: 3 queries/request"):
+                call_command("benchmark", *self.ARGS, "--baseline", path, stdout=StringIO())
+
+            with self.assertRaisesMessage(CommandError, "different configuration"):
+                call_command("benchmark", *self.ARGS, "--seed", "1", "--baseline", path, stdout=StringIO())
+
+    def test_connection_modes(self):
+        saved = dict(connection.settings_dict)
+        with connection_mode("reconnect"):
+            self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], 0)
+            self.assertNotIn("pool", connection.settings_dict["OPTIONS"])
+        with connection_mode("persistent"):
+            self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], 600)
+            self.assertTrue(connection.settings_dict["CONN_HEALTH_CHECKS"])
+        with connection_mode("pooled"):
+            self.assertIs(connection.settings_dict["OPTIONS"]["pool"], True)
+        self.assertEqual(connection.settings_dict, saved)
+
+        self.assertEqual(pooling_unavailable(), "pooling needs Postgres")
+        with self.assertRaisesMessage(CommandError, ":memory:"):
+            call_command("benchmark_connections", stdout=StringIO())
+
+
+class InstrumentationTests(GraphQLTestCase):
+    TREE = "query Tree { projects { name tasks { title comments { content } } } }"
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+        self.make_tree(projects=2, tasks=3, comments=1)
+
+    def debug(self, query, **headers):
+        response = self.client.post(
+            "/graphql/",
+            json.dumps({"query": query}),
+            content_type="application/json",
+            HTTP_X_ORG=self.org_slug,
+            HTTP_X_GRAPHQL_DEBUG="1",
+            **headers,
+        )
+        return response.json()
+
+    def n_plus_one_comments(self):
+        # what resolve_comments would look like without the loaders
+        return mock.patch.object(
+            CommentsByTaskLoader, "load", lambda loader, task: list(TaskComment.objects.filter(task=task))
+        )
+
+    @override_settings(DEBUG=True)
+    def test_debug_header_returns_the_trace(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = self.debug(self.TREE)
+
+        debug = result["extensions"]["debug"]
+        self.assertEqual(debug["operation"], "Tree")
+        self.assertEqual(debug["sql"]["count"], len(ctx.captured_queries))
+        self.assertEqual(debug["resolvers"]["fields"]["TaskType.comments"]["calls"], 6)
+        # plain attributes aren't timed
+        self.assertNotIn("TaskType.title", debug["resolvers"]["fields"])
+        self.assertEqual(debug["resolvers"]["slowest"][0]["path"], "projects")
+        self.assertEqual(debug["n_plus_one"], [])
+        # traced requests aren't counted twice
+        self.assertEqual(metrics.operations, {})
+
+    def test_debug_needs_debug_or_staff(self):
+        self.assertNotIn("debug", self.debug(self.TREE).get("extensions", {}))
+
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        self.assertIn("debug", self.debug(self.TREE)["extensions"])
+
+    @override_settings(DEBUG=True)
+    def test_flags_n_plus_one(self):
+        with self.n_plus_one_comments(), self.assertLogs("core.instrumentation", "WARNING") as logs:
+            flagged = self.debug(self.TREE)["extensions"]["debug"]["n_plus_one"]
+            self.graphql(self.TREE)
+
+        self.assertEqual(len(flagged), 1)
+        self.assertEqual(flagged[0]["field"], "TaskType.comments")
+        self.assertEqual(flagged[0]["count"], 6)
+        self.assertIn("N+1 in TaskType.comments (Tree)", logs.output[0])
+        self.assertEqual(metrics.n_plus_one["TaskType.comments"], 1)
+
+    def test_metrics(self):
+        self.graphql(self.TREE)
+        self.graphql("{ hello }")
+
+        self.assertEqual(self.client.get("/graphql/metrics/").status_code, 403)
+        with override_settings(GRAPHQL_INSTRUMENTATION={"METRICS_TOKEN": "s3cret"}):
+            response = self.client.get("/graphql/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('graphql_requests_total{operation="Tree"} 1', text)
+        self.assertIn('graphql_requests_total{operation="anonymous query"} 1', text)
+        self.assertIn('graphql_resolver_calls_total{field="TaskType.comments"} 6', text)
+
+    @override_settings(GRAPHQL_INSTRUMENTATION={"MAX_OPERATIONS": 2})
+    def test_operation_labels_are_bounded(self):
+        for name in ("A", "B", "C", "D"):
+            self.graphql(f"query {name} {{ hello }}")
+        self.graphql("query A { hello }")
+
+        self.assertEqual(metrics.operations["A"][0], 2)
+        self.assertEqual(metrics.operations["B"][0], 1)
+        self.assertEqual(metrics.operations["other"][0], 2)
+        self.assertEqual(set(metrics.operations), {"A", "B", "other"})
+
+    def test_registry_limits_the_operation_labels(self):
+        registered = "query Registered { hello }"
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({query_hash(registered): registered}, f)
+        self.addCleanup(os.remove, f.name)
+        self.addCleanup(persisted_queries.reload)
+
+        with self.settings(PERSISTED_QUERIES={"REGISTRY": f.name}):
+            persisted_queries.reload()
+            self.graphql(registered)
+            self.graphql("query Adhoc { hello }")
+            self.client.post(
+                "/graphql/",
+                json.dumps({"query": "query A { hello } query B { hello }", "operationName": "Nope"}),
+                content_type="application/json",
+                HTTP_X_ORG=self.org_slug,
+            )
+
+        self.assertEqual(set(metrics.operations), {"Registered", "other"})
+        self.assertEqual(metrics.operations["other"][0], 2)
+
+    @override_settings(DEBUG=True, ROOT_URLCONF="core.tests")
+    def test_async_view_traces_sql_run_in_threads(self):
+        async def request():
+            response = await self.async_client.post(
+                "/graphql/",
+                json.dumps({"query": self.TREE}),
+                content_type="application/json",
+                headers={"X-ORG": self.org_slug, "X-GraphQL-Debug": "1"},
+            )
+            return response.json()
+
+        with CaptureQueriesContext(connection) as ctx:
+            debug = async_to_sync(request)()["extensions"]["debug"]
+        self.assertEqual(debug["sql"]["count"], len(ctx.captured_queries))
+        fields = {query["field"] for query in debug["sql"]["queries"]}
+        self.assertIn("Query.projects", fields)
+
+
+class ExportTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_tree(projects=2, tasks=2, comments=2)
+        other = Organization.objects.create(name="Org Two", slug="org-two", contact_email="a@b.test")
+        self.make_tree(projects=1, tasks=1, org=other)
+
+    def export(self, **params):
+        return self.client.get("/export/", params, HTTP_X_ORG=self.org_slug)
+
+    def test_ndjson_streams_the_tenant_parents_first(self):
+        response = self.export()
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn('filename="org-one.ndjson"', response["Content-Disposition"])
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            Counter(line["type"] for line in lines),
+            {"organization": 1, "project": 2, "task": 4, "comment": 8},
+        )
+
+        seen = {"organization": set(), "project": set(), "task": set()}
+        parents = {"project": ("organization", "organization_id"), "task": ("project", "project_id"),
+                   "comment": ("task", "task_id")}
+        for line in lines:
+            if line["type"] in parents:
+                kind, column = parents[line["type"]]
+                self.assertIn(line[column], seen[kind])
+            seen.setdefault(line["type"], set()).add(line["id"])
+
+        task = Task.objects.get(pk=next(line["id"] for line in lines if line["type"] == "task"))
+        exported = next(line for line in lines if line["type"] == "task" and line["id"] == task.pk)
+        self.assertEqual(exported["created_at"], task.created_at.isoformat())
+
+    def test_csv(self):
+        response = self.export(format="csv")
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 15)
+        self.assertEqual(rows[0]["type"], "organization")
+        self.assertEqual(rows[0]["slug"], "org-one")
+        self.assertEqual({row["title"] for row in rows if row["type"] == "task"},
+                         {"Task 0.0", "Task 0.1", "Task 1.0", "Task 1.1"})
+
+    def test_errors(self):
+        self.assertEqual(self.export(format="xml").status_code, 400)
+        self.assertEqual(self.client.get("/export/").status_code, 400)
+        self.assertEqual(self.client.post("/export/", HTTP_X_ORG=self.org_slug).status_code, 405)
+
+    def test_asgi_streams_with_an_async_iterator(self):
+        async def export():
+            response = await self.async_client.get("/export/", headers={"X-ORG": self.org_slug})
+            self.assertTrue(response.is_async)
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        body = async_to_sync(export)()
+        self.assertEqual(len(body.splitlines()), 15)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.ndjson")
+            call_command("export_tenant", "org-two", "--output", path, stderr=StringIO())
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([line["type"] for line in lines], ["organization", "project", "task", "comment"])
+
+        with self.assertRaisesMessage(CommandError, "Organization missing not found"):
+            call_command("export_tenant", "missing", stderr=StringIO())
+
+
+class ImportTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_tree(projects=2, tasks=3, comments=2)
+        Task.objects.filter(title="Task 0.1").update(status="DONE", due_date=timezone.now())
+        rebuild_counters()
+
+    def export(self, format="ndjson"):
+        return "".join(export_chunks(self.org, format))
+
+    def load(self, text, format="ndjson", **kwargs):
+        return TenantImporter(**kwargs).run(read_records(io.StringIO(text), format))
+
+    def assertSameTenant(self, copy):
+        self.assertNotEqual(copy.pk, self.org.pk)
+        for original, imported in [
+            (self.org.projects.order_by("id"), copy.projects.order_by("id")),
+        ]:
+            self.assertEqual(
+                list(original.values_list("name", "status", "todo_count", "done_count")),
+                list(imported.values_list("name", "status", "todo_count", "done_count")),
+            )
+        fields = ("project__name", "title", "status", "due_date", "comment_count", "created_at")
+        self.assertEqual(
+            list(Task.objects.filter(project__organization=self.org).order_by("id").values_list(*fields)),
+            list(Task.objects.filter(project__organization=copy).order_by("id").values_list(*fields)),
+        )
+        self.assertEqual(TaskComment.objects.filter(task__project__organization=copy).count(), 12)
+
+    def test_ndjson_roundtrip_maps_ids(self):
+        copy = self.load(self.export(), slug="org-copy", batch_size=4)
+
+        self.assertEqual(copy.slug, "org-copy")
+        self.assertSameTenant(copy)
+        # children point at the new rows, not at the source ids
+        self.assertFalse(Task.objects.filter(project__organization=copy, project__in=self.org.projects.all()))
+
+    def test_csv_roundtrip(self):
+        copy = self.load(self.export("csv"), format="csv", slug="org-copy")
+        self.assertSameTenant(copy)
+
+    def test_bad_input(self):
+        org = '{"type":"organization","id":1,"name":"New","slug":"new"}\n'
+        cases = {
+            '{"type":"project","id":1,"name":"P"}\n': "the organization must come first",
+            org + '{"type":"task","id":5,"project_id":9,"title":"T"}\n': "line 2: task points at unknown project 9",
+            org + '{"type":"widget"}\n': "unknown record type 'widget'",
+            '{"type":"organization","id":1,"name":"Dup","slug":"org-one"}\n': "org-one already exists",
+            "not json\n": "line 1",
+        }
+        for text, message in cases.items():
+            with self.subTest(text=text), self.assertRaisesMessage(InvalidImport, message):
+                with transaction.atomic():
+                    self.load(text)
+
+    def test_bulk_create_keeps_timestamps(self):
+        created = timezone.now() - timezone.timedelta(days=30)
+        copy = self.load(
+            '{"type":"organization","name":"Old","slug":"old"}\n'
+            f'{{"type":"project","id":"a","name":"P","created_at":"{created.isoformat()}"}}\n',
+            writer=BulkCreateWriter(),
+        )
+        project = copy.projects.get()
+        self.assertEqual(project.created_at, created)
+        # the fields are back to normal afterwards
+        self.assertTrue(Project._meta.get_field("created_at").auto_now_add)
+
+    def test_copy_value(self):
+        self.assertEqual(copy_value(None), "\\N")
+        self.assertEqual(copy_value("a\tb\nc\\d"), "a\\tb\\nc\\\\d")
+        self.assertEqual(copy_value(timezone.datetime(2026, 1, 2).date()), "2026-01-02")
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "org.csv")
+            with open(path, "w", newline="") as f:
+                f.write(self.export("csv"))
+            out = StringIO()
+            call_command("import_tenant", path, "--slug", "org-copy", stdout=out, stderr=StringIO())
+            self.assertIn("Imported org-copy: 2 projects, 6 tasks, 12 comments", out.getvalue())
+            self.assertIn("rows/s", out.getvalue())
+
+            # all or nothing
+            with open(path, "a") as f:
+                f.write("task,99,,,,,,,,77,Orphan\n")
+            with self.assertRaisesMessage(CommandError, "unknown project"):
+                call_command("import_tenant", path, "--slug", "org-broken", stdout=StringIO())
+        self.assertFalse(Organization.objects.filter(slug="org-broken").exists())
+
+
+def add_test_database(test_class, alias):
+    # the test runner only sets up the databases in settings.DATABASES (the
+    # configured replicas/shards mirror default), a separate one is created
+    # here the way the runner would and allowed for test_class: an empty
+    # database with the schema - in memory on SQLite, <test db>_<alias> on Postgres
+    default = connections.settings["default"]
+    test = {**default.get("TEST", {}), "MIRROR": None, "NAME": None}
+    if connections["default"].vendor != "sqlite":
+        test["NAME"] = f"{default['NAME']}_{alias}"
+    connections.settings[alias] = {**default, "TEST": test}
+    connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    test_class.databases = {"default", alias}
+
+
+def remove_test_database(alias):
+    connections[alias].creation.destroy_test_db(verbosity=0)
+    del connections[alias]
+    del connections.settings[alias]
+
+
+@override_settings(
+    READ_REPLICAS={"ALIASES": ["replica"], "PIN_SECONDS": 10, "MAX_LAG": 10},
+    RESPONSE_CACHE={"ENABLED": False},
+)
+class ReplicaTests(GraphQLTestCase):
+    """
+    Two databases: the primary and a "replica" that has the schema but never
+    receives any rows - a replica lagging behind forever - so where a read
+    went shows in the response.
+    """
+
+    PROJECTS = "query { projects { name } }"
+    UPDATE = 'mutation ($id: ID!) { updateProject(id: $id, status: "COMPLETED") { project { id } } }'
+
+    @classmethod
+    def setUpClass(cls):
+        add_test_database(cls, "replica")
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        remove_test_database("replica")
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        lag_monitor.clear()
+        self.project = Project.objects.create(organization=self.org, name="Launch")
+
+    def names(self, slug=None):
+        return [p["name"] for p in self.graphql(self.PROJECTS, slug=slug)["data"]["projects"]]
+
+    def test_queries_read_from_the_replica(self):
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            self.assertEqual(self.names(), [])
+        self.assertTrue(any("core_project" in q["sql"] for q in replica.captured_queries))
+
+        with override_settings(READ_REPLICAS={"ALIASES": []}):
+            self.assertEqual(self.names(), ["Launch"])
+
+    def test_mutations_write_to_the_primary_and_pin_the_tenant(self):
+        other = Organization.objects.create(name="Org Two", slug="org-two", contact_email="a@b.test")
+        Project.objects.create(organization=other, name="Other")
+
+        with CaptureQueriesContext(connections["replica"]) as replica:
+            result = self.graphql(self.UPDATE, {"id": self.project.id})
+        self.assertNotIn("errors", result)
+        self.assertEqual(replica.captured_queries, [])
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.status, "COMPLETED")
+
+        # read-your-writes for this tenant, the other one still reads the replica
+        self.assertEqual(self.names(), ["Launch"])
+        self.assertEqual(self.names("org-two"), [])
+
+        caches["default"].clear()
+        self.assertEqual(self.names(), [])
+
+    def test_tenant_is_pinned_before_the_write(self):
+        pinned = []
+
+        def writing(obj, changes):
+            # a request running in parallel from here on must not read the replica
+            pinned.append(caches["default"].get(PIN_PREFIX + self.org_slug))
+            return mock.DEFAULT
+
+        with mock.patch("core.schema.save_changes", wraps=save_changes, side_effect=writing):
+            self.assertNotIn("errors", self.graphql(self.UPDATE, {"id": self.project.id}))
+        self.assertEqual(pinned, [1])
+
+    def test_pin_must_outlast_the_accepted_lag(self):
+        with override_settings(READ_REPLICAS={"ALIASES": ["replica"], "PIN_SECONDS": 5, "MAX_LAG": 10}):
+            with self.assertRaisesMessage(ImproperlyConfigured, "PIN_SECONDS"):
+                check_settings()
+        check_settings()
+
+    @override_settings(RESPONSE_CACHE={"ENABLED": True})
+    def test_replica_responses_are_not_cached(self):
+        caches["default"].clear()
+        document_cache.clear()
+        for _ in range(3):
+            self.assertEqual(self.names(), [])
+        # the replica catches up: nothing stale was stored
+        with override_settings(READ_REPLICAS={"ALIASES": []}):
+            self.assertEqual(self.names(), ["Launch"])
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch("core.replicas.measure_lag", return_value=60.0) as measure, \
+                self.assertLogs("core.replicas", "WARNING"):
+            self.assertEqual(self.names(), ["Launch"])
+            self.assertEqual(self.names(), ["Launch"])
+        # measured once per LAG_CHECK_INTERVAL
+        self.assertEqual(measure.call_count, 1)
+
+        lag_monitor.clear()
+        with mock.patch("core.replicas.measure_lag", return_value=1.0):
+            self.assertEqual(self.names(), [])
+
+    @override_settings(ROOT_URLCONF="core.tests")
+    def test_async_view(self):
+        async def names():
+            response = await self.async_client.post(
+                "/graphql/",
+                json.dumps({"query": self.PROJECTS}),
+                content_type="application/json",
+                headers={"X-ORG": self.org_slug},
+            )
+            return [p["name"] for p in response.json()["data"]["projects"]]
+
+        self.assertEqual(async_to_sync(names)(), [])
+        self.graphql(self.UPDATE, {"id": self.project.id})
+        self.assertEqual(async_to_sync(names)(), ["Launch"])
+
+
+@override_settings(TENANT_SHARDS={"ALIASES": ["shard"]}, RESPONSE_CACHE={"ENABLED": False})
+class ShardTests(GraphQLTestCase):
+    PROJECTS = "query { projects { name taskCount: todoCount tasks { title comments { content } } } }"
+    CREATE = 'mutation { createProject(name: "New") { project { id } } }'
+
+    @classmethod
+    def setUpClass(cls):
+        add_test_database(cls, "shard")
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        remove_test_database("shard")
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        self.make_tree(projects=2, tasks=2, comments=2)
+        rebuild_counters()
+
+    def move(self):
+        move = TenantMove(self.org, "shard", log=lambda message: None)
+        self.assertEqual(move.check(), [])
+        move.run(drain=0, freeze_seconds=0)
+        return move
+
+    def test_moved_tenant_reads_and_writes_its_shard(self):
+        before = self.graphql(self.PROJECTS)
+        self.move().delete_source()
+        self.assertFalse(Project.objects.using("default").filter(organization=self.org).exists())
+        self.assertEqual(Organization.objects.using("default").get(pk=self.org.pk).shard, "shard")
+
+        with CaptureQueriesContext(connections["shard"]) as shard:
+            self.assertEqual(self.graphql(self.PROJECTS), before)
+        self.assertTrue(shard.captured_queries)
+
+        self.assertNotIn("errors", self.graphql(self.CREATE))
+        self.assertTrue(Project.objects.using("shard").filter(name="New").exists())
+        self.assertFalse(Project.objects.using("default").filter(name="New").exists())
+
+        # other tenants stay where they are
+        other = Organization.objects.create(name="Org Two", slug="org-two", contact_email="a@b.test")
+        self.assertNotIn("errors", self.graphql(self.CREATE, slug="org-two"))
+        self.assertTrue(Project.objects.using("default").filter(organization=other).exists())
+
+        # streamed outside the request
+        response = self.client.get("/export/", HTTP_X_ORG=self.org_slug)
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1 + 3 + 4 + 8)
+
+    def test_mutations_run_in_a_transaction_on_the_shard(self):
+        self.move().delete_source()
+        shard = connections["shard"]
+        tasks = list(Task.objects.using("shard").order_by("pk").values_list("pk", flat=True))
+        # the test's own atomic blocks, the mutations must open theirs on top
+        outside = len(shard.atomic_blocks)
+        locked, writes = [], []
+
+        def for_update_sql(**kwargs):
+            # SQLite has no row locks, FOR UPDATE would be a syntax error
+            locked.append(len(shard.atomic_blocks) > outside)
+            return ""
+
+        def record(execute, sql, params, many, context):
+            if sql.startswith(("INSERT", "UPDATE")):
+                writes.append(len(shard.atomic_blocks) > outside)
+            return execute(sql, params, many, context)
+
+        update = 'mutation ($id: ID!) { updateTask(id: $id, status: "DONE") { task { status } } }'
+        bulk = 'mutation ($ids: [ID!]!) { updateTasks(ids: $ids, patch: {status: "IN_PROGRESS"}) { tasks { id } } }'
+        comment = 'mutation ($id: ID!) { addComment(taskId: $id, content: "Hi", authorEmail: "a@b.test") { comment { id } } }'
+        mutations = [(update, {"id": tasks[0]}), (bulk, {"ids": tasks[1:3]}), (comment, {"id": tasks[0]})]
+        with mock.patch.object(shard.features, "has_select_for_update", True), \
+                mock.patch.object(shard.features, "has_select_for_update_of", True), \
+                mock.patch.object(shard.ops, "for_update_sql", for_update_sql), \
+                shard.execute_wrapper(record), \
+                self.captureOnCommitCallbacks(using="default") as on_default, \
+                self.captureOnCommitCallbacks(using="shard") as on_shard:
+            for query, variables in mutations:
+                self.assertNotIn("errors", self.graphql(query, variables))
+
+        self.assertEqual(locked, [True, True])
+        self.assertTrue(writes)
+        self.assertTrue(all(writes))
+        self.assertEqual(on_default, [])
+        self.assertTrue(on_shard)
+        project = Task.objects.using("shard").get(pk=tasks[0]).project
+        self.assertEqual(project.done_count, 1)
+
+    def test_catch_up_applies_changes_and_deletes(self):
+        move = TenantMove(self.org, "shard")
+        since = timezone.now()
+        self.assertEqual(move.copy(), 1 + 2 + 4 + 8)
+
+        task = Task.objects.filter(project__organization=self.org).first()
+        task.title = "Renamed"
+        task.save()
+        TaskComment.objects.filter(task__project__organization=self.org).first().delete()
+        Task.objects.create(project=task.project, title="Added")
+
+        self.assertEqual(move.sync(since), 2 + 1)
+        on_shard = Task.objects.using("shard").filter(project__organization=self.org)
+        self.assertEqual(
+            set(on_shard.values_list("title", flat=True)),
+            set(Task.objects.filter(project__organization=self.org).values_list("title", flat=True)),
+        )
+        self.assertEqual(TaskComment.objects.using("shard").count(), 7)
+
+    def test_frozen_tenant_refuses_mutations(self):
+        freeze(self.org_slug, 60)
+        result = self.graphql(self.CREATE)
+        self.assertEqual(result["errors"][0]["message"], "This organization is being moved, try again in a minute")
+        self.assertNotIn("errors", self.graphql(self.PROJECTS))
+
+    def test_command_checks(self):
+        with self.assertRaisesMessage(CommandError, "elsewhere is not in TENANT_SHARDS"):
+            call_command("move_tenant", self.org_slug, "elsewhere", stdout=StringIO())
+
+        project = Project.objects.filter(organization=self.org).first()
+        squatter = Organization.objects.using("shard").create(
+            pk=self.org.pk, name="S", slug="s", contact_email="s@s.test"
+        )
+        with self.assertRaisesMessage(CommandError, f"Organization id {self.org.pk} is taken on shard"):
+            call_command("move_tenant", self.org_slug, "shard", stdout=StringIO())
+
+        squatter.delete()
+        squatter = Organization.objects.using("shard").create(
+            pk=self.org.pk + 100, name="S", slug="s", contact_email="s@s.test"
+        )
+        Project.objects.using("shard").create(pk=project.pk, organization=squatter, name="Squatter")
+        with self.assertRaisesMessage(CommandError, "core.Project ids of org-one are taken on shard"):
+            call_command("move_tenant", self.org_slug, "shard", stdout=StringIO())
+
+        Project.objects.using("shard").filter(pk=project.pk).delete()
+        out = StringIO()
+        call_command("move_tenant", self.org_slug, "shard", "--drain", "0", "--freeze-seconds", "0", stdout=out)
+        self.assertIn("org-one is on shard", out.getvalue())
+
+
+class BatchTests(GraphQLTestCase):
+    PROJECTS = "query { projects { name tasks { title } } }"
+    CREATE = 'mutation ($id: ID!) { createTask(projectId: $id, title: "New") { task { id } } }'
+
+    def setUp(self):
+        super().setUp()
+        document_cache.clear()
+        self.make_tree(projects=2, tasks=1, comments=0)
+        self.project = Project.objects.order_by("pk").first()
+
+    def post(self, body, path="/graphql/", client=None):
+        return (client or self.client).post(
+            path, json.dumps(body), content_type="application/json", HTTP_X_ORG=self.org_slug
+        )
+
+    def test_results_in_order(self):
+        response = self.post([
+            {"query": "query { organizationStats { projectCount } }", "id": "a"},
+            {"query": self.PROJECTS, "id": "b"},
+            {"query": "query { nope }", "id": "c"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        first, second, third = response.json()
+        self.assertEqual((first["id"], first["status"]), ("a", 200))
+        self.assertEqual(first["data"]["organizationStats"]["projectCount"], 2)
+        self.assertEqual(len(second["data"]["projects"]), 2)
+        self.assertEqual((third["id"], third["status"]), ("c", 400))
+
+        # a single operation still answers with an object
+        self.assertIn("data", self.post({"query": self.PROJECTS}).json())
+
+    def test_persisted_query_miss_doesnt_fail_the_batch(self):
+        unknown = query_hash("query { hello }")
+        response = self.post([
+            {"query": self.PROJECTS},
+            {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": unknown}}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        found, miss = response.json()
+        self.assertEqual(found["status"], 200)
+        self.assertEqual(len(found["data"]["projects"]), 2)
+        self.assertEqual(miss["status"], 200)
+        self.assertEqual(miss["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+
+    def test_operations_see_earlier_mutations(self):
+        before, created, after = self.post([
+            {"query": self.PROJECTS},
+            {"query": self.CREATE, "variables": {"id": self.project.id}},
+            {"query": self.PROJECTS},
+        ]).json()
+        self.assertNotIn("errors", created)
+        titles = lambda result: [t["title"] for p in result["data"]["projects"] for t in p["tasks"]]  # noqa: E731
+        self.assertNotIn("New", titles(before))
+        self.assertIn("New", titles(after))
+
+    def test_operations_with_different_selections(self):
+        self.make_tree(projects=2, tasks=3, comments=0)
+        with CaptureQueriesContext(connection) as ctx:
+            first, second = self.post([
+                {"query": "query { projects { id tasks { id } } }"},
+                {"query": "query { projects { id tasks { id description } } }"},
+            ]).json()
+        self.assertNotIn("errors", second)
+        self.assertEqual(len([t for p in second["data"]["projects"] for t in p["tasks"]]), 8)
+        # projects + tasks per operation
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+    def test_rejected_batches(self):
+        for body, message in [
+            ([], "empty list"),
+            ([{"query": self.PROJECTS}] * 3, "At most 2 operations"),
+            ([{"query": self.PROJECTS}, "query { projects { id } }"], "must be a JSON object"),
+        ]:
+            with self.subTest(message=message), override_settings(GRAPHQL_BATCH={"MAX_OPERATIONS": 2}):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.content.decode())
+
+    @override_settings(ROOT_URLCONF="core.tests")
+    def test_async_view(self):
+        stats = "query { organizationStats { projectCount } }"
+        # parse the documents so the queries are known reads
+        self.post([{"query": stats}, {"query": self.PROJECTS}])
+
+        entries = [
+            {"query": stats},
+            {"query": self.PROJECTS},
+            {"query": self.CREATE, "variables": {"id": self.project.id}},
+            {"query": self.PROJECTS},
+        ]
+        request = mock.Mock(headers={}, GET={})
+        self.assertEqual(groups(request, entries), [([0, 1], True), ([2], False), ([3], True)])
+
+        response = async_to_sync(self.async_client.post)(
+            "/graphql/", json.dumps(entries), content_type="application/json", headers={"X-ORG": self.org_slug}
+        )
+        results = response.json()
+        self.assertEqual([result["status"] for result in results], [200] * 4)
+        self.assertEqual(results[0]["data"]["organizationStats"]["projectCount"], 2)
+        self.assertEqual(len([t for p in results[1]["data"]["projects"] for t in p["tasks"]]), 2)
+        self.assertEqual(len([t for p in results[3]["data"]["projects"] for t in p["tasks"]]), 3)
+
+        # concurrent queries selecting different columns of the same tasks
+        entries = [
+            {"query": "query { projects { id tasks { id } } }"},
+            {"query": "query { projects { id tasks { id description } } }"},
+        ]
+        self.post(entries)
+        response = async_to_sync(self.async_client.post)(
+            "/graphql/", json.dumps(entries), content_type="application/json", headers={"X-ORG": self.org_slug}
+        )
+        first, second = response.json()
+        self.assertNotIn("errors", second)
+        self.assertEqual([t["description"] for p in second["data"]["projects"] for t in p["tasks"]], [""] * 3)
+
+
+class EncodingTests(GraphQLTestCase):
+    TREE = "query { projects { id name tasks { id title dueDate comments { content createdAt } } } }"
+
+    def setUp(self):
+        super().setUp()
+        self.make_tree(projects=3, tasks=5, comments=2)
+
+    def post(self, query, **headers):
+        return self.client.post(
+            "/graphql/",
+            json.dumps({"query": query}),
+            content_type="application/json",
+            HTTP_X_ORG=self.org_slug,
+            **headers,
+        )
+
+    def test_encoders_agree(self):
+        data = {"text": "naïve – ok", "day": timezone.now().date(), "price": Decimal("1.50"), "nested": [{"b": 1}]}
+        self.assertEqual(json.loads(encode(data, using="orjson")), json.loads(encode(data, using="json")))
+        # the same format as graphene's DateTime
+        now = timezone.now()
+        self.assertEqual(encode({"when": now}, using="orjson"), '{"when":"%s"}' % now.isoformat())
+        self.assertEqual(encode({"b": 1, "a": [2]}, pretty=True), '{\n  "a": [\n    2\n  ],\n  "b": 1\n}')
+        # beyond orjson's 64-bit integers
+        self.assertEqual(encode({"big": 2**70}), '{"big":%d}' % 2**70)
+
+    def test_large_responses_are_compressed(self):
+        plain = self.post(self.TREE)
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertGreater(len(plain.content), 1024)
+
+        compressed = self.post(self.TREE, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertLess(len(compressed.content), len(plain.content))
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+
+        for refused in ("gzip;q=0", "br, gzip;q=0", "gzip; q=0.0, identity", "*;q=0"):
+            with self.subTest(refused=refused):
+                self.assertNotIn("Content-Encoding", self.post(self.TREE, HTTP_ACCEPT_ENCODING=refused))
+        self.assertEqual(self.post(self.TREE, HTTP_ACCEPT_ENCODING="*")["Content-Encoding"], "br" if brotli else "gzip")
+
+        small = self.post("query { hello }", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", small)
+
+        with override_settings(GRAPHQL_ENCODING={"COMPRESS": False}):
+            self.assertNotIn("Content-Encoding", self.post(self.TREE, HTTP_ACCEPT_ENCODING="gzip"))
+
+    @override_settings(RESPONSE_CACHE={"ENABLED": True})
+    def test_weak_etag_still_matches(self):
+        caches["default"].clear()
+        document_cache.clear()
+        self.post(self.TREE)
+        response = self.post(self.TREE, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        self.assertEqual(
+            self.post(self.TREE, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304
+        )
+
+    @override_settings(ROOT_URLCONF="core.tests")
+    def test_async_view(self):
+        response = async_to_sync(self.async_client.post)(
+            "/graphql/",
+            json.dumps({"query": self.TREE}),
+            content_type="application/json",
+            headers={"X-ORG": self.org_slug, "Accept-Encoding": "gzip"},
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["data"]["projects"]), 3)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_encoding", "--projects", "1", "--tasks", "20", "--repeat", "1", stdout=out)
+        self.assertIn("bytes on the wire", out.getvalue())
+        self.assertIn("gzip", out.getvalue())
@@ -1,7 +1,8 @@
 
 from django.urls import path
-from .views import home
+from .views import export, home
 
 urlpatterns = [
     path('', home, name='home'),
+    path('export/', export, name='export'),
 ]
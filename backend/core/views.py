@@ -1,6 +1,466 @@
+import asyncio
+import hmac
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.views.decorators.http import require_GET
+from django.utils.http import parse_etags
+from django.db import connection, transaction
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, parse, validate
+from graphql.error import GraphQLError
+from graphql.pyutils import is_awaitable
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+
+from .aio import then
+from .batching import check_batch, combine, get_setting as get_batch_setting, groups
+from .cost import check_cost
+from .encoding import compress, encode
+from .export import FORMATS, aexport_chunks, export_chunks, export_filename
+from .instrumentation import debug_allowed, debug_requested, get_setting as get_instrumentation_setting
+from .instrumentation import OTHER, metrics, traced
+from .loaders import with_loaders
+from .persisted import document_cache, persisted_queries, persisted_query_miss, query_hash
+from .replicas import pin, read_database, reading_from
+from .response_cache import get_setting as get_response_cache_setting
+from .response_cache import response_cache, response_scopes
+from .shards import frozen, write_database
 
 # Create your views here.
 def home(request):
-    return HttpResponse("Welcome to the Multi-Tenant Project Manager!")
\ No newline at end of file
+    return HttpResponse("Welcome to the Multi-Tenant Project Manager!")
+
+
+@require_GET
+def export(request):
+    # the whole tenant as NDJSON or CSV, streamed (core/export.py)
+    org = request.organization
+    if not org:
+        return HttpResponseBadRequest("X-ORG header required")
+    format = request.GET.get("format", "ndjson")
+    if format not in FORMATS:
+        return HttpResponseBadRequest(f"format must be one of {', '.join(FORMATS)}")
+
+    # under ASGI a sync iterator would be read into memory before sending
+    chunks = aexport_chunks if isinstance(request, ASGIRequest) else export_chunks
+    response = StreamingHttpResponse(chunks(org, format), content_type=FORMATS[format])
+    response["Content-Disposition"] = f'attachment; filename="{export_filename(org, format)}"'
+    return response
+
+
+def graphql_metrics(request):
+    # aggregated resolver/SQL metrics (core/instrumentation.py) for Prometheus
+    token = get_instrumentation_setting("METRICS_TOKEN")
+    authorization = request.headers.get("Authorization", "")
+    scraper = bool(token) and hmac.compare_digest(authorization, f"Bearer {token}")
+    if not (scraper or debug_allowed(request)):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.export(), content_type="text/plain; version=0.0.4")
+
+
+def operation_label(document, operation_name, key):
+    # the metrics label: a Prometheus label per client-chosen name would grow
+    # without bound. Names of registered documents are kept; with a registry,
+    # everything else is "other", without one the document's own operation
+    # names are, up to MAX_OPERATIONS of them (core/instrumentation.py).
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return OTHER
+    name = operation.name.value if operation.name else f"anonymous {operation.operation.value}"
+    if key in persisted_queries.registry:
+        return name
+    if persisted_queries.registry:
+        return OTHER
+    return metrics.label(name)
+
+
+class GraphQLView(BaseGraphQLView):
+    """
+    graphene-django's view plus persisted queries and a parsed-document cache
+    (see core/persisted.py) - a hot document is parsed and validated once per
+    process instead of once per request - a depth/cost limit checked
+    before anything runs (core/cost.py), a cache of serialized read
+    query responses with ETags (core/response_cache.py), batches of
+    operations in one POST (core/batching.py) and orjson encoding with
+    gzip/brotli compression of large responses (core/encoding.py).
+    """
+
+    def parse_body(self, request):
+        # a JSON array is a batch; graphene only takes those with batch=True,
+        # and then nothing else
+        if self.get_content_type(request) != "application/json":
+            return super().parse_body(request)
+        try:
+            data = json.loads(request.body)
+        except (TypeError, ValueError):
+            raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+
+        if isinstance(data, list):
+            problem = check_batch(data)
+            if problem:
+                raise HttpError(HttpResponseBadRequest(problem))
+            self.batch = True
+        elif not isinstance(data, dict):
+            raise HttpError(HttpResponseBadRequest("The received data is not a valid JSON query."))
+        return data
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self.conditional_response(request, super().dispatch(request, *args, **kwargs))
+        return compress(request, response)
+
+    def json_encode(self, request, d, pretty=False):
+        return encode(d, pretty=self.pretty or pretty or bool(request.GET.get("pretty")))
+
+    def get_response(self, request, data, show_graphiql=False):
+        # same as GraphQLView.get_response, but keeps result.extensions and
+        # serves/stores read queries from the response cache (core/response_cache.py)
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        cacheable = self.cacheable(request, data, query, variables, operation_name, show_graphiql)
+        if cacheable:
+            key, entry = response_cache.lookup(*cacheable)
+            if entry is not None:
+                request.response_etag = entry["etag"]
+                return entry["body"], 200
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        result, status_code = self.build_response(request, execution_result, id, show_graphiql)
+
+        if cacheable and self.storable(request, execution_result, status_code):
+            request.response_etag = response_cache.store(key, result)["etag"]
+        return result, status_code
+
+    def storable(self, request, execution_result, status_code):
+        # a replica may not have replayed the write that dropped the version
+        # token yet, so what it returned isn't stored (core/response_cache.py)
+        return status_code == 200 and not execution_result.errors and not getattr(request, "replica", None)
+
+    def cacheable(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """
+        Arguments for response_cache.lookup() when the response of this
+        request can come from / go to the response cache, None otherwise.
+        """
+        slug = request.headers.get("X-ORG")
+        if not get_response_cache_setting("ENABLED") or self.batch or show_graphiql or not slug:
+            return None
+        if debug_requested(request):
+            # the client wants this execution's trace, not a stored body
+            return None
+
+        key = persisted_queries.requested_hash(request, data)
+        if query:
+            if key is not None and key != query_hash(query):
+                # hash mismatch, let the normal path report it
+                return None
+            key = query_hash(query)
+
+        # only documents that were already parsed and validated, i.e. from the
+        # second request on - which is every request of a polling dashboard
+        document = document_cache.get(key) if key else None
+        if document is None:
+            return None
+        scopes = response_scopes(document, operation_name, variables)
+        if not scopes:
+            return None
+        return slug, key, operation_name, variables, scopes
+
+    def conditional_response(self, request, response):
+        # ETag for cacheable responses, 304 when the client already has it
+        tag = getattr(request, "response_etag", None)
+        if tag is None or response.status_code != 200:
+            return response
+        # compress() sends it weak, the client sends that back
+        sent = {etag.removeprefix("W/") for etag in parse_etags(request.headers.get("If-None-Match", ""))}
+        if tag in sent:
+            response = HttpResponseNotModified()
+        response["ETag"] = tag
+        return response
+
+    def build_response(self, request, execution_result, id=None, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+            if execution_result.errors and any(
+                not getattr(e, "path", None) for e in execution_result.errors
+            ):
+                status_code = 200 if persisted_query_miss(execution_result.errors) else 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+        else:
+            result = None
+
+        return result, status_code
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        try:
+            query, key = persisted_queries.resolve(request, data, query)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        document = document_cache.get(key)
+        if document is None:
+            try:
+                document = parse(query)
+            except GraphQLError as e:
+                return ExecutionResult(errors=[e])
+
+            validation_errors = validate(
+                self.schema.graphql_schema,
+                document,
+                self.validation_rules,
+                graphene_settings.MAX_VALIDATION_ERRORS,
+            )
+            if validation_errors:
+                return ExecutionResult(data=None, errors=validation_errors)
+            # only documents that passed validation are cached
+            document_cache.set(key, document)
+
+        # depends on the variables (`first`) and the tenant, so it runs every time
+        try:
+            cost = check_cost(
+                self.schema.graphql_schema,
+                document,
+                variables,
+                operation_name,
+                request.headers.get("X-ORG"),
+            )
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        def with_cost(result):
+            if result is not None:
+                result.extensions = {**(result.extensions or {}), "cost": cost}
+            return result
+
+        # an awaitable on the async view; resolver/SQL timings (core/instrumentation.py),
+        # loaders of its own (core/loaders.py)
+        result = traced(
+            request,
+            operation_label(document, operation_name, key),
+            lambda: with_loaders(
+                lambda: self.execute_document(request, document, variables, operation_name, show_graphiql)
+            ),
+        )
+        return then(result, with_cost)
+
+    def execute_document(self, request, document, variables, operation_name, show_graphiql=False):
+        # the part of GraphQLView.execute_graphql_request after validation
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = self.execution_context_class
+
+            if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+                if frozen(request.headers.get("X-ORG")):
+                    # moving to another shard (core/shards.py), reads still work
+                    return ExecutionResult(
+                        errors=[GraphQLError("This organization is being moved, try again in a minute")]
+                    )
+                # read-your-writes (core/replicas.py): pinned before anything commits,
+                # so a parallel request can't read the replica right after the commit
+                pin(request)
+                if (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                ):
+                    with transaction.atomic(using=write_database()):
+                        result = execute(self.schema.graphql_schema, document, **execute_options)
+                        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                            transaction.set_rollback(True)
+                else:
+                    result = execute(self.schema.graphql_schema, document, **execute_options)
+                # and again now, so the pin lasts PIN_SECONDS from the commit; the tenant's
+                # next queries go to the primary, including the ones after it in the same batch
+                pin(request)
+                request.replica = None
+                return result
+
+            return reading_from(
+                self.replica(request),
+                lambda: execute(self.schema.graphql_schema, document, **execute_options),
+            )
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def replica(self, request):
+        # database alias the queries of this request read from, None = primary
+        # (core/replicas.py); the async view picks it in prepare_request()
+        if not hasattr(request, "replica"):
+            request.replica = read_database(request)
+        return request.replica
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    GraphQLView for ASGI. Queries are executed with async resolvers
+    (core/aio.py) using the async ORM, so sibling fields resolve concurrently
+    and a request waiting on the database doesn't hold a worker thread.
+
+    Mutations still run on the sync path in a worker thread - they rely on
+    transaction.atomic()/select_for_update(), which are sync only.
+    GraphiQL is handed to the sync view as well. In a batch the queries
+    between two mutations run concurrently.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                result, status_code = await self.abatch_response(request, data)
+            else:
+                result, status_code = await self.aget_response(request, data)
+            response = HttpResponse(
+                status=status_code, content=result, content_type="application/json"
+            )
+            return compress(request, self.conditional_response(request, response))
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def aget_response(self, request, data):
+        # get_response() for the async view
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        cacheable = self.cacheable(request, data, query, variables, operation_name)
+        if cacheable:
+            key, entry = await response_cache.alookup(*cacheable)
+            if entry is not None:
+                request.response_etag = entry["etag"]
+                return entry["body"], 200
+
+        await self.prepare_request(request)
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name
+        )
+        if is_awaitable(execution_result):
+            execution_result = await execution_result
+        result, status_code = self.build_response(request, execution_result, id)
+
+        if cacheable and self.storable(request, execution_result, status_code):
+            request.response_etag = (await response_cache.astore(key, result))["etag"]
+        return result, status_code
+
+    async def abatch_response(self, request, entries):
+        # the operations in order, each run of queries concurrently - each in
+        # its own task, so the per-operation context (trace, replica) stays apart
+        await self.prepare_request(request)
+        responses = [None] * len(entries)
+        for indexes, parallel in groups(request, entries):
+            if parallel and get_batch_setting("PARALLEL"):
+                results = await asyncio.gather(
+                    *(self.aget_response(request, entries[index]) for index in indexes)
+                )
+            else:
+                results = [await self.aget_response(request, entries[index]) for index in indexes]
+            for index, response in zip(indexes, results):
+                responses[index] = response
+        return combine(responses)
+
+    async def prepare_request(self, request):
+        # everything resolvers would otherwise load lazily (= synchronously),
+        # once per request (a batch runs several operations)
+        if getattr(request, "graphql_prepared", False):
+            return
+        request.graphql_prepared = True
+        request.user = await request.auser()
+        if request.user.is_anonymous and get_http_authorization(request) is not None:
+            # what JSONWebTokenMiddleware would do in the first resolver
+            try:
+                user = await sync_to_async(authenticate)(request=request)
+            except JSONWebTokenError:
+                # bad token, the middleware reports it on the fields
+                user = None
+            if user is not None:
+                request.user = user
+        request.organization = await request.aorganization()
+        request.replica = await sync_to_async(read_database)(request)
+
+    def execute_document(self, request, document, variables, operation_name, show_graphiql=False):
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+            request.graphql_async = False
+            return sync_to_async(super().execute_document)(
+                request, document, variables, operation_name, show_graphiql
+            )
+
+        request.graphql_async = True
+        return super().execute_document(request, document, variables, operation_name, show_graphiql)
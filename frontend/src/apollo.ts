@@ -1,13 +1,30 @@
-import { ApolloClient, InMemoryCache, HttpLink } from "@apollo/client";
+import { ApolloClient, InMemoryCache } from "@apollo/client";
+import { BatchHttpLink } from "@apollo/client/link/batch-http";
+import { PersistedQueryLink } from "@apollo/client/link/persisted-queries";
 
-const httpLink = new HttpLink({
+// operations started within batchInterval ms go out as one POST (the backend
+// answers a JSON array of operations with an array of results)
+const httpLink = new BatchHttpLink({
   uri: "http://localhost:8000/graphql/",
   headers: {
     "X-ORG": "org-one", // hardcoded intentionally
   },
+  batchMax: 20, // GRAPHQL_BATCH["MAX_OPERATIONS"] on the backend
+  batchInterval: 10,
 });
 
+// sends a sha256 of the query instead of the query text (Automatic Persisted
+// Queries), the backend falls back to asking for the full query once
+const sha256 = async (query: string) => {
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(query));
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+};
+
+const persistedQueryLink = new PersistedQueryLink({ sha256 });
+
 export const client = new ApolloClient({
-  link: httpLink,
+  link: persistedQueryLink.concat(httpLink),
   cache: new InMemoryCache(),
-});
\ No newline at end of file
+});